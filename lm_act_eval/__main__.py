@@ -1,4 +1,6 @@
 # lm_act_eval/lm_act_eval/__main__.py
+import sys
+
 import hydra
 from dotenv import load_dotenv
 from omegaconf import DictConfig, OmegaConf
@@ -23,15 +25,55 @@ def main(cfg: DictConfig) -> None:
     if not eval_config:
         raise ValueError("Evaluation configuration is missing.")
     
+    # imported here, not at startup: telemetry pulls in pandas
+    from lm_act_eval.evaluation_harness.evaluators.concurrency import configure_adaptive_concurrency
+    from lm_act_eval.evaluation_harness.helper_functions.judges import configure_judge
+    from lm_act_eval.evaluation_harness.utils.llm_cache import configure_response_cache
+    from lm_act_eval.evaluation_harness.utils.resilience import configure_resilience
+    from lm_act_eval.evaluation_harness.utils.telemetry import telemetry
+
+    # `--resume` continues the last checkpointed run of every track
+    resume = cfg.get('resume', False)
+    # shared LLM response cache, read-only with `--replay`
+    llm_cache = configure_response_cache(cfg.get('llm_cache'))
+    # per model concurrency, adapted to the providers' rate limits
+    configure_adaptive_concurrency(cfg.get('adaptive_concurrency'))
+    # per model timeouts, hedging and circuit breakers
+    configure_resilience(cfg.get('resilience'))
+    # the judge of llm_fuzzy_match / llm_ua_match, OpenAI or a local model
+    configure_judge(cfg.get('judge'))
     # Trajectory evaluation track
     for eval_type, conf in eval_config.items():
         match eval_type:
             case "sft":
-                handle_sft(conf)
+                handle_sft(conf, resume=resume)
             case _:
                 raise ValueError(
                   f"Unsupported evaluation type: {eval_type}")
+    if llm_cache is not None:
+        logger.info(f"LLM response cache: {llm_cache.stats()}")
+    # latency, tokens & retries of every LLM call: summary table and Prometheus text file
+    telemetry().report(cfg.get('telemetry'))
+
+
+def cli() -> None:
+    """
+    Console entry point: `lm_act_eval bench ...` runs the benchmarks, anything else goes to hydra.
+    `--resume` is turned into the `resume` override, picking up the last run of each track.
+    `--replay` makes the LLM response cache read-only: judgments are replayed, never requested.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from .bench import bench
+        bench(sys.argv[2:], prog_name="lm_act_eval bench")
+    else:
+        if "--resume" in sys.argv:
+            sys.argv.remove("--resume")
+            sys.argv.append("++resume=true")
+        if "--replay" in sys.argv:
+            sys.argv.remove("--replay")
+            sys.argv.append("++llm_cache.read_only=true")
+        main()
 
 
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,334 @@
+"""
+Startup & import-time benchmarks, run with `lm_act_eval bench startup`.
+
+Every measurement happens in a fresh interpreter so results reflect a cold start:
+* cold start: wall time of `import lm_act_eval.__main__` on top of a bare interpreter
+* import tree: the `-X importtime` tree of that import, pruned to the expensive nodes
+* per subpackage: import time, peak RSS and files created in the working directory
+  (import-time side effects such as a `FileHandler` or a `.env` assert surface here)
+
+Results are compared against a JSON budget, shipped with the package (`startup_budget.json`); any
+overrun, or a missing budget, makes the command exit non-zero.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+
+# package data, installed next to this module
+DEFAULT_BUDGET_PATH = Path(__file__).resolve().parent / "startup_budget.json"
+
+ENTRY_MODULE = "lm_act_eval.__main__"
+
+SUBPACKAGES = [
+    "lm_act_eval.evaluation_harness.evaluators",
+    "lm_act_eval.evaluation_harness.helper_functions",
+    "lm_act_eval.evaluation_harness.openai.vision",
+    "lm_act_eval.common.data",
+    "lm_act_eval.evaluation_harness.evaluators.webarena_rl.browser_env",
+]
+
+# executed in the child interpreter, prints a single JSON line on the last line of stdout
+_PROBE = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+error = None
+try:
+    importlib.import_module({module!r})
+except BaseException as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+elapsed = time.perf_counter() - start
+# ru_maxrss is in KiB on Linux and bytes on macOS
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({{"import_ms": elapsed * 1000, "peak_rss_mb": rss_mb, "error": error}}))
+"""
+
+
+@dataclass
+class ImportNode:
+    """A node of the `-X importtime` tree, times are in microseconds"""
+    name: str
+    self_us: int
+    cumulative_us: int
+    children: List["ImportNode"] = field(default_factory=list)
+
+
+@dataclass
+class ModuleResult:
+    module: str
+    import_ms: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    error: Optional[str] = None
+    created_files: List[str] = field(default_factory=list)
+
+
+def parse_importtime(stderr: str) -> List[ImportNode]:
+    """
+    Builds the import tree from `python -X importtime` output.
+
+    Children are printed before their parent, one indentation level (two spaces) deeper.
+
+    Args:
+        stderr (str): The stderr of an interpreter run with `-X importtime`.
+
+    Returns:
+        List[ImportNode]: The top-level imports, in import order.
+    """
+    pending: Dict[int, List[ImportNode]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # the header line
+            continue
+        raw_name = parts[2].rstrip()
+        name = raw_name.lstrip()
+        # a single space follows the `|` separator, nesting adds two spaces per level
+        depth = (len(raw_name) - len(name) - 1) // 2
+        node = ImportNode(name, int(parts[0]), int(parts[1]))
+        node.children = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append(node)
+    return pending.get(0, [])
+
+
+def format_import_tree(
+    nodes: List[ImportNode], min_ms: float = 5.0, max_depth: int = 3, _depth: int = 0) -> List[str]:
+    """Renders the nodes slower than `min_ms` as indented lines, slowest first."""
+    lines = []
+    for node in sorted(nodes, key=lambda n: n.cumulative_us, reverse=True):
+        if node.cumulative_us / 1000 < min_ms:
+            continue
+        lines.append(
+            f"{'  ' * _depth}{node.name:<{60 - 2 * _depth}} {node.cumulative_us / 1000:9.1f} ms"
+            f" (self {node.self_us / 1000:.1f} ms)")
+        if _depth + 1 < max_depth:
+            lines.extend(format_import_tree(node.children, min_ms, max_depth, _depth + 1))
+    return lines
+
+
+def _child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [str(PACKAGE_ROOT), env.get("PYTHONPATH")] if p)
+    return env
+
+
+def _run_python(args: List[str], cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, env=_child_env(), cwd=cwd)
+
+
+def measure_cold_start(repeat: int = 3) -> Dict:
+    """
+    Measures the wall time of importing the CLI entry module in a fresh interpreter.
+
+    Runs in an empty temporary directory so files created on import are detected even when
+    the calling process (e.g. `lm_act_eval bench` itself) already created them in the working directory.
+
+    Returns:
+        Dict: the bare interpreter time and the entry import time, in milliseconds (best of `repeat`),
+            and the files the import created in the working directory.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def best_of(args):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _run_python(args, cwd=tmp_dir)
+                timings.append((time.perf_counter() - start) * 1000)
+            return min(timings)
+
+        interpreter_ms = best_of(["-c", "pass"])
+        entry_ms = best_of(["-c", f"import {ENTRY_MODULE}"])
+        created_files = sorted(p.name for p in Path(tmp_dir).iterdir())
+    return {
+        "interpreter_ms": interpreter_ms,
+        "cold_start_ms": max(entry_ms - interpreter_ms, 0.0),
+        "created_files": created_files,
+    }
+
+
+def measure_import_tree(module: str = ENTRY_MODULE) -> List[ImportNode]:
+    """Returns the `-X importtime` tree of importing `module` in a fresh interpreter."""
+    proc = _run_python(["-X", "importtime", "-c", f"import {module}"])
+    return parse_importtime(proc.stderr)
+
+
+def measure_module(module: str, repeat: int = 1) -> ModuleResult:
+    """
+    Imports `module` in a fresh interpreter and records its import time, peak RSS
+    and any files it created in the working directory (an empty temporary one, as in `measure_cold_start`).
+    """
+    result = ModuleResult(module)
+    timings, rss = [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            proc = _run_python(["-c", _PROBE.format(module=module)], cwd=tmp_dir)
+            created = [p.name for p in Path(tmp_dir).iterdir()]
+        result.created_files = sorted(set(result.created_files) | set(created))
+        try:
+            probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, json.JSONDecodeError):
+            # the interpreter died before the probe could report (e.g. a failing `assert` at import)
+            result.error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+            return result
+        if probe["error"]:
+            result.error = probe["error"]
+            return result
+        timings.append(probe["import_ms"])
+        rss.append(probe["peak_rss_mb"])
+    result.import_ms = statistics.median(timings)
+    result.peak_rss_mb = max(rss)
+    return result
+
+
+def load_budget(path: Path | str) -> Dict:
+    """
+    Raises:
+        FileNotFoundError: There is no budget at `path`, nothing would be checked.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"No startup budget at {path}, write one with `--write-budget`")
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_budget(report: Dict, budget: Dict) -> List[str]:
+    """
+    Compares a startup report against a budget.
+
+    Args:
+        report (Dict): The output of `run_startup_bench`.
+        budget (Dict): ``{"cold_start_ms": ..., "no_created_files": ..., "modules": {module: {"import_ms": ...,
+            "peak_rss_mb": ..., "no_created_files": ...}}}``, any key may be omitted to leave it unchecked.
+
+    Returns:
+        List[str]: A description of every budget violation, empty if within budget.
+    """
+    violations = []
+    if "cold_start_ms" in budget and report["cold_start_ms"] > budget["cold_start_ms"]:
+        violations.append(
+            f"cold start: {report['cold_start_ms']:.0f} ms > {budget['cold_start_ms']:.0f} ms")
+    if budget.get("no_created_files") and report.get("created_files"):
+        violations.append(f"cold start: created {report['created_files']} on import")
+    for module, limits in budget.get("modules", {}).items():
+        result = report["modules"].get(module)
+        if result is None:
+            continue
+        if result["error"]:
+            violations.append(f"{module}: import failed ({result['error']})")
+            continue
+        for key, unit in [("import_ms", "ms"), ("peak_rss_mb", "MB")]:
+            if key in limits and result[key] > limits[key]:
+                violations.append(f"{module}: {key} {result[key]:.0f} {unit} > {limits[key]:.0f} {unit}")
+        if limits.get("no_created_files") and result["created_files"]:
+            violations.append(f"{module}: created {result['created_files']} on import")
+    return violations
+
+
+def run_startup_bench(modules: List[str] = SUBPACKAGES, repeat: int = 3) -> Dict:
+    report = measure_cold_start(repeat)
+    report["modules"] = {m: asdict(measure_module(m, repeat)) for m in modules}
+    return report
+
+
+def budget_from_report(report: Dict, headroom: float = 1.5) -> Dict:
+    """Derives a budget from a report, allowing `headroom` times the measured values."""
+    return {
+        "cold_start_ms": round(report["cold_start_ms"] * headroom),
+        "no_created_files": not report["created_files"],
+        "modules": {
+            module: {
+                "import_ms": round(result["import_ms"] * headroom),
+                "peak_rss_mb": round(result["peak_rss_mb"] * headroom),
+                "no_created_files": not result["created_files"],
+            }
+            for module, result in report["modules"].items() if not result["error"]
+        },
+    }
+
+
+def format_report(report: Dict) -> List[str]:
+    lines = [
+        f"interpreter: {report['interpreter_ms']:.0f} ms",
+        f"cold start ({ENTRY_MODULE}): {report['cold_start_ms']:.0f} ms",
+    ]
+    if report["created_files"]:
+        lines.append(f"  side effect, created: {', '.join(report['created_files'])}")
+    lines += [
+        "",
+        f"{'module':<68} {'import':>10} {'peak rss':>10}",
+    ]
+    for module, result in report["modules"].items():
+        if result["error"]:
+            lines.append(f"{module:<68} FAILED: {result['error']}")
+            continue
+        lines.append(
+            f"{module:<68} {result['import_ms']:>7.0f} ms {result['peak_rss_mb']:>7.0f} MB")
+        if result["created_files"]:
+            lines.append(f"  side effect, created: {', '.join(result['created_files'])}")
+    return lines
+
+
+@click.group()
+def bench():
+    """Performance benchmarks for lm_act_eval."""
+
+
+@bench.command()
+@click.option('--budget', 'budget_path', type=click.Path(dir_okay=False), default=str(DEFAULT_BUDGET_PATH),
+              show_default=True, help="JSON budget to compare against.")
+@click.option('--repeat', default=3, show_default=True, help="Fresh interpreters per measurement.")
+@click.option('--min-ms', default=5.0, show_default=True, help="Hide import tree nodes faster than this.")
+@click.option('--depth', default=3, show_default=True, help="Import tree depth to display.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="Write the raw report as JSON.")
+@click.option('--write-budget', is_flag=True, help="Overwrite the budget with the measured values plus 50% headroom.")
+def startup(budget_path, repeat, min_ms, depth, output, write_budget):
+    """Measure cold start, the import tree and per-subpackage import cost."""
+    budget = None
+    if not write_budget:
+        # fail before measuring anything
+        try:
+            budget = load_budget(budget_path)
+        except FileNotFoundError as e:
+            raise click.ClickException(str(e))
+    report = run_startup_bench(repeat=repeat)
+    tree = measure_import_tree()
+
+    click.echo("\n".join(format_report(report)))
+    click.echo(f"\nimport tree of {ENTRY_MODULE} (>= {min_ms} ms):")
+    click.echo("\n".join(format_import_tree(tree, min_ms=min_ms, max_depth=depth)))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if write_budget:
+        Path(budget_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(budget_path, "w") as f:
+            json.dump(budget_from_report(report), f, indent=2)
+        click.echo(f"\nBudget written to {budget_path}")
+        return
+
+    violations = check_budget(report, budget)
+    if violations:
+        click.echo("\nOver budget:\n" + "\n".join(f"  - {v}" for v in violations))
+        sys.exit(1)
+    click.echo("\nWithin budget.")
+
+
+if __name__ == "__main__":
+    bench()
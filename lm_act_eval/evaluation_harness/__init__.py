@@ -1,22 +1,30 @@
+import importlib
 
-from .helper_functions import (
-    get_query_text,
-    get_query_text_lowercase,
-    reddit_get_latest_comment_content_by_username,
-    reddit_get_latest_comment_obj_by_username,
-    reddit_get_parent_comment_username_of_latest_comment_by_username,
-    shopping_get_latest_order_url,
-    shopping_get_num_reviews,
-    shopping_get_order_product_name_list,
-    shopping_get_order_product_option,
-    shopping_get_order_product_quantity,
-    shopping_get_product_attributes,
-    shopping_get_product_price,
-    shopping_get_rating_as_percentage,
-    shopping_get_sku_latest_review_author,
-    shopping_get_sku_latest_review_rating,
-    shopping_get_sku_latest_review_text,
-)
+# helper functions pull in playwright & the LLM providers, import them on first access
+_HELPER_FUNCTIONS = [
+    "get_query_text",
+    "get_query_text_lowercase",
+    "reddit_get_latest_comment_content_by_username",
+    "reddit_get_latest_comment_obj_by_username",
+    "reddit_get_parent_comment_username_of_latest_comment_by_username",
+    "shopping_get_latest_order_url",
+    "shopping_get_num_reviews",
+    "shopping_get_order_product_name_list",
+    "shopping_get_order_product_option",
+    "shopping_get_order_product_quantity",
+    "shopping_get_product_attributes",
+    "shopping_get_product_price",
+    "shopping_get_rating_as_percentage",
+    "shopping_get_sku_latest_review_author",
+    "shopping_get_sku_latest_review_rating",
+    "shopping_get_sku_latest_review_text",
+]
 
 
 from .evaluators import metric_registry, evaluator_registry
+
+
+def __getattr__(name):
+    if name in _HELPER_FUNCTIONS:
+        return getattr(importlib.import_module(".helper_functions", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
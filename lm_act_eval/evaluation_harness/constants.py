@@ -4,35 +4,69 @@ from datetime import datetime
 
 DATETIME_STR = datetime.now().strftime("%m%d%YT%H%M%S")
 
-import torch
-from transformers import BitsAndBytesConfig
-
 from typing import Dict
 
-BNB_QUANTIZATION_CONFIG_4BIT = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_compute_dtype=torch.float16,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_use_double_quant=True,
-)
-
-BNB_QUANTIZATION_CONFIG_8BIT = BitsAndBytesConfig(
-    load_in_8bit=True,
-    bnb_8bit_use_double_quant=True,
-    bnb_8bit_quant_type="int4",
-    bnb_8bit_compute_dtype=torch.float16,
-)
-
-class BNB_OFFLOADING_CONFIG:
-    quantization_config: BitsAndBytesConfig = BitsAndBytesConfig(load_in_8bit_fp32_cpu_offload=True)
-    low_cpu_mem_usage: bool=True
-    device_map: str ="auto"
-    max_memory: Dict ={0: '80000Mib', "cpu": '16Gib'}
-    
-    
+
+def _bnb_quantization_config_4bit():
+    import torch
+    from transformers import BitsAndBytesConfig
+
+    return BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_compute_dtype=torch.float16,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_use_double_quant=True,
+    )
+
+
+def _bnb_quantization_config_8bit():
+    import torch
+    from transformers import BitsAndBytesConfig
+
+    return BitsAndBytesConfig(
+        load_in_8bit=True,
+        bnb_8bit_use_double_quant=True,
+        bnb_8bit_quant_type="int4",
+        bnb_8bit_compute_dtype=torch.float16,
+    )
+
+
+def _bnb_offloading_config():
+    from transformers import BitsAndBytesConfig
+
+    class BNB_OFFLOADING_CONFIG:
+        quantization_config: BitsAndBytesConfig = BitsAndBytesConfig(load_in_8bit_fp32_cpu_offload=True)
+        low_cpu_mem_usage: bool=True
+        device_map: str ="auto"
+        max_memory: Dict ={0: '80000Mib', "cpu": '16Gib'}
+
+    return BNB_OFFLOADING_CONFIG
+
+
+def _bits_and_bytes_config():
+    from transformers import BitsAndBytesConfig
+
+    return BitsAndBytesConfig
+
+
+# torch/transformers backed constants, built on first access so importing this module stays cheap
+_LAZY_CONSTANTS = {
+    "BNB_QUANTIZATION_CONFIG_4BIT": _bnb_quantization_config_4bit,
+    "BNB_QUANTIZATION_CONFIG_8BIT": _bnb_quantization_config_8bit,
+    "BNB_OFFLOADING_CONFIG": _bnb_offloading_config,
+    "BitsAndBytesConfig": _bits_and_bytes_config,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_CONSTANTS:
+        value = globals()[name] = _LAZY_CONSTANTS[name]()
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 #### Logging
 LOGGING_PLATFORMS = {
-  'wandb': 'WANDB_API_KEY', 
+  'wandb': 'WANDB_API_KEY',
   'hf': 'HUGGINGFACE_API_KEY'
 }
-
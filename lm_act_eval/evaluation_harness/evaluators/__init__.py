@@ -8,8 +8,8 @@ USER_AGENT_HEADERS = {
 }
 
 
-# import all modules from 
-from .common import evaluator_registry, metric_registry
+# metrics & evaluators are imported lazily on `Registry.get`, see `manifest.py`
+from .registry import evaluator_registry, metric_registry
 
 
 __all__ = ["evaluator_registry", "metric_registry"]
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Crash-safe checkpointing of metric results.
+
+Results are written to a SQLite database under `CACHE_DIR` as soon as they are computed, keyed by
+(run, metric name, metric args hash, row content hash):
+* scorers with a per-row coroutine (`ascore_row`) are checkpointed row by row
+* any other scorer is checkpointed as a whole, keyed by the content hash of its input frame
+
+Every evaluation starts a new run unless resumed (`lm_act_eval --resume ...`), in which case the
+last run with the same track config is continued and the rows it already scored are skipped.
+Checkpointing is off unless the track has a `checkpoint` block or is resumed; `checkpoint: false`
+disables it either way. Runs started more than `max_age_days` ago are pruned with their results:
+
+    checkpoint:
+      path: .cache/checkpoints.sqlite
+      max_age_days: 14
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+import pandas as pd
+from omegaconf import DictConfig, OmegaConf
+
+from lm_act_eval.evaluation_harness.constants import CACHE_DIR
+
+if TYPE_CHECKING:
+    from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = Path(CACHE_DIR) / "checkpoints.sqlite"
+DEFAULT_MAX_AGE_DAYS = 14
+
+# returned by `MetricCheckpoint.get` for rows without a stored result (None is a valid result)
+MISSING = object()
+
+# set on the `attrs` of the row results `ascore_rows` must not store, see `unscored`
+UNSCORED_ATTR = 'unscored'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_hash TEXT NOT NULL,
+    started_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    args_hash TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    result BLOB NOT NULL,
+    PRIMARY KEY (run_id, metric, args_hash, row_hash)
+);
+"""
+
+
+def _to_container(config) -> Any:
+    if isinstance(config, DictConfig):
+        return OmegaConf.to_container(config, resolve=True)
+    return config
+
+
+def config_hash(config) -> str:
+    """Stable hash of a (possibly OmegaConf) config."""
+    payload = json.dumps(_to_container(config), sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def row_hashes(df: pd.DataFrame) -> List[str]:
+    """Content hash of every row, independent of the index."""
+    try:
+        hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # unhashable cells (lists, dicts), hash their representation instead
+        hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return [f"{h:016x}" for h in hashes]
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Content hash of a whole frame, columns included."""
+    digest = hashlib.sha1("\x1f".join(map(str, df.columns)).encode())
+    digest.update("".join(row_hashes(df)).encode())
+    return f"frame:{digest.hexdigest()[:16]}"
+
+
+class CheckpointStore:
+    def __init__(self, path: Path | str = DEFAULT_CHECKPOINT_PATH, max_age_days: Optional[float] = DEFAULT_MAX_AGE_DAYS):
+        """
+        Args:
+            path (Path | str): The SQLite database.
+            max_age_days (float, optional): Days a run is kept once a newer one starts. None for no bound.
+        """
+        self.path = Path(path)
+        self.max_age_days = max_age_days
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config, resume: bool = False) -> Optional["CheckpointStore"]:
+        """
+        The store configured by the track's `checkpoint` block, with its run started (or resumed).
+        None when checkpointing is disabled, or when there is no block and the run isn't resumed.
+        """
+        checkpoint_config = config.get('checkpoint') if config is not None else None
+        if checkpoint_config is False or (checkpoint_config is None and not resume):
+            return None
+        path, max_age_days = DEFAULT_CHECKPOINT_PATH, DEFAULT_MAX_AGE_DAYS
+        if isinstance(checkpoint_config, (dict, DictConfig)):
+            path = checkpoint_config.get('path') or path
+            max_age_days = checkpoint_config.get('max_age_days', max_age_days)
+        store = cls(path, max_age_days=max_age_days)
+        store.start_run(config, resume=resume)
+        return store
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread (and per process, the store is re-opened after pickling)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def __getstate__(self):
+        return {'path': self.path, 'run_id': getattr(self, 'run_id', None), 'max_age_days': self.max_age_days}
+
+    def __setstate__(self, state):
+        self.path, self.run_id, self.max_age_days = state['path'], state['run_id'], state['max_age_days']
+        self._local = threading.local()
+
+    def start_run(self, config, resume: bool = False) -> int:
+        """
+        Starts a new run for `config`, or continues the last run of the same config when `resume`.
+        Any `checkpoint` block is left out of the config identity.
+        """
+        container = _to_container(config)
+        if isinstance(container, dict):
+            container = {k: v for k, v in container.items() if k != 'checkpoint'}
+        identity = config_hash(container)
+        conn = self._connection()
+        if resume:
+            last = conn.execute(
+                "SELECT run_id FROM runs WHERE config_hash = ? ORDER BY run_id DESC LIMIT 1", (identity,)
+            ).fetchone()
+            if last is not None:
+                self.run_id = last[0]
+                logger.info(f"Resuming run {self.run_id} from {self.path}")
+                self.prune()
+                return self.run_id
+            logger.warning(f"No previous run of this config in {self.path}, starting a new run")
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (config_hash, started_at) VALUES (?, ?)",
+                (identity, datetime.now().isoformat()))
+        self.run_id = cursor.lastrowid
+        logger.info(f"Checkpointing run {self.run_id} to {self.path}")
+        self.prune()
+        return self.run_id
+
+    def prune(self) -> int:
+        """Drops the runs (but the current one) started more than `max_age_days` ago, and their results."""
+        if self.max_age_days is None:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        with self._connection() as conn:
+            stale = "SELECT run_id FROM runs WHERE started_at < ? AND run_id != ?"
+            conn.execute(f"DELETE FROM results WHERE run_id IN ({stale})", (cutoff, self.run_id))
+            pruned = conn.execute("DELETE FROM runs WHERE started_at < ? AND run_id != ?", (cutoff, self.run_id)).rowcount
+        if pruned:
+            logger.info(f"Pruned {pruned} checkpointed run(s) older than {self.max_age_days} days from {self.path}")
+        return pruned
+
+    def metric(self, metric_name: str, metric_config) -> "MetricCheckpoint":
+        return MetricCheckpoint(self, metric_name, config_hash(metric_config))
+
+    def get(self, metric: str, args_hash: str, row_hash: str) -> Any:
+        row = self._connection().execute(
+            "SELECT result FROM results WHERE run_id = ? AND metric = ? AND args_hash = ? AND row_hash = ?",
+            (self.run_id, metric, args_hash, row_hash)).fetchone()
+        return MISSING if row is None else pickle.loads(row[0])
+
+    def put(self, metric: str, args_hash: str, row_hash: str, result: Any) -> None:
+        conn = self._connection()
+        # committed per result, a crash loses at most the rows in flight
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (run_id, metric, args_hash, row_hash, result) VALUES (?, ?, ?, ?, ?)",
+                (self.run_id, metric, args_hash, row_hash, pickle.dumps(result)))
+
+    def count(self, metric: Optional[str] = None) -> int:
+        query, params = "SELECT COUNT(*) FROM results WHERE run_id = ?", [self.run_id]
+        if metric is not None:
+            query, params = query + " AND metric = ?", params + [metric]
+        return self._connection().execute(query, params).fetchone()[0]
+
+
+class MetricCheckpoint:
+    """The checkpoint of a single metric (name & args) within a run."""
+
+    def __init__(self, store: CheckpointStore, metric: str, args_hash: str):
+        self.store = store
+        self.metric = metric
+        self.args_hash = args_hash
+
+    def get(self, row_hash: str) -> Any:
+        return self.store.get(self.metric, self.args_hash, row_hash)
+
+    def put(self, row_hash: str, result: Any) -> None:
+        self.store.put(self.metric, self.args_hash, row_hash, result)
+
+
+def unscored(result: pd.Series) -> pd.Series:
+    """Marks a row result (e.g. of a row past its deadline) as not checkpointed, a resumed run scores the row again."""
+    result.attrs[UNSCORED_ATTR] = True
+    return result
+
+
+def is_unscored(result: Any) -> bool:
+    return bool(getattr(result, 'attrs', {}).get(UNSCORED_ATTR))
+
+
+def checkpoints_for(store: Optional[CheckpointStore], metric_configs) -> Dict[str, MetricCheckpoint]:
+    """A `MetricCheckpoint` per configured metric, empty without a store."""
+    if store is None:
+        return {}
+    return {name: store.metric(name, metric_configs[name]) for name in metric_configs}
+
+
+async def ascore_rows(
+    ascore_row: Callable[[pd.Series], Awaitable[Any]], df: pd.DataFrame, limiter: ConcurrencyLimiter,
+    provider: Optional[str] = None, desc: Optional[str] = None,
+    checkpoint: Optional[MetricCheckpoint] = None) -> List[Any]:
+    """
+    Awaits `ascore_row` for every row of `df` under the limiter. With a checkpoint, rows it already
+    holds are not scored again and every other row is stored as soon as it completes, but for
+    results marked `unscored`.
+
+    Returns:
+        List[Any]: The results, in row order.
+    """
+    rows = [row for _, row in df.iterrows()]
+    if checkpoint is None:
+        return await limiter.map(ascore_row, rows, provider=provider, desc=desc)
+    hashes = row_hashes(df)
+    results = [checkpoint.get(row_hash) for row_hash in hashes]
+    pending = [i for i, result in enumerate(results) if result is MISSING]
+    if len(pending) < len(rows):
+        logger.info(f"{len(rows) - len(pending)}/{len(rows)} rows of '{checkpoint.metric}' restored from checkpoint")
+
+    async def score(i: int) -> Any:
+        result = await ascore_row(rows[i])
+        if not is_unscored(result):
+            checkpoint.put(hashes[i], result)
+        return result
+
+    for i, result in zip(pending, await limiter.map(score, pending, provider=provider, desc=desc)):
+        results[i] = result
+    return results
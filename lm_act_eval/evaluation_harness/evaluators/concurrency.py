@@ -0,0 +1,361 @@
+"""
+Bounded concurrency for I/O-bound scorers.
+
+A `ConcurrencyLimiter` caps the number of in-flight calls globally and per provider
+(e.g. `openai`), so metrics evaluated concurrently share the same budget. Configured by
+the `concurrency` block of an evaluation track:
+
+    concurrency:
+      max: 32
+      providers:
+        openai: 16
+
+A `RateLimiter` additionally bounds the request and token throughput of an API
+(requests / tokens per minute), as set by a scorer's args.
+
+An `AdaptiveLimiter` finds the concurrency a model sustains instead (AIMD): it grows while
+the provider's `x-ratelimit-remaining-*` headers show headroom, halves on a 429 and pauses
+every caller for the `retry-after` the provider asks for. `adaptive_limiter(provider, model)`
+is shared by every metric calling the model, configured by the top-level `adaptive_concurrency`
+block (`enabled: false` disables it):
+
+    adaptive_concurrency:
+      initial: 8
+      max: 256
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import aiolimiter
+from tqdm.asyncio import tqdm
+
+from lm_act_eval.evaluation_harness.utils.telemetry import note_queue_wait
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MAX_LIMIT = 256
+# below this share of a rate limit window left, the limit stops growing
+DEFAULT_HEADROOM = 0.1
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, provider_limits: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_concurrency (int): Calls in flight across every provider.
+            provider_limits (Dict[str, int], optional): Calls in flight per provider, uncapped
+                providers are only bound by `max_concurrency`.
+        """
+        self.max_concurrency = max_concurrency
+        self.provider_limits = dict(provider_limits or {})
+        # asyncio semaphores are bound to the loop they first wait on: one set per event loop, so
+        # a limiter serves every `asyncio.run` of its evaluator
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _loop_semaphores(self) -> Tuple[asyncio.Semaphore, Dict[str, asyncio.Semaphore]]:
+        """The global and per provider semaphores of the running loop."""
+        loop = asyncio.get_running_loop()
+        semaphores = self._semaphores.get(loop)
+        if semaphores is None:
+            semaphores = self._semaphores[loop] = (
+                asyncio.Semaphore(self.max_concurrency),
+                {name: asyncio.Semaphore(limit) for name, limit in self.provider_limits.items()})
+        return semaphores
+
+    @classmethod
+    def from_config(cls, config) -> "ConcurrencyLimiter":
+        concurrency = (config.get('concurrency') if config is not None else None) or {}
+        return cls(
+            max_concurrency=concurrency.get('max', DEFAULT_MAX_CONCURRENCY),
+            provider_limits=dict(concurrency.get('providers') or {}),
+        )
+
+    @asynccontextmanager
+    async def slot(self, provider: Optional[str] = None):
+        """Holds a provider slot (if the provider is capped) and a global slot."""
+        global_semaphore, providers = self._loop_semaphores()
+        provider_semaphore = providers.get(provider)
+        if provider_semaphore is None:
+            async with global_semaphore:
+                yield
+            return
+        # provider first, so a saturated provider doesn't hold global slots while waiting
+        async with provider_semaphore:
+            async with global_semaphore:
+                yield
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args, provider: Optional[str] = None, **kwargs) -> Any:
+        async with self.slot(provider):
+            return await func(*args, **kwargs)
+
+    async def map(
+        self, func: Callable[[Any], Awaitable[Any]], items: Iterable[Any],
+        provider: Optional[str] = None, desc: Optional[str] = None) -> List[Any]:
+        """
+        Awaits `func(item)` for every item under the limits.
+
+        Returns:
+            List[Any]: The results, in the order of `items` regardless of completion order.
+        """
+        return await tqdm.gather(*[self.run(func, item, provider=provider) for item in items], desc=desc)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """
+        Args:
+            requests_per_minute (float, optional): Requests started per minute, unbounded if None.
+            tokens_per_minute (float, optional): (Estimated) tokens sent per minute, unbounded if None.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = aiolimiter.AsyncLimiter(requests_per_minute, 60) if requests_per_minute else None
+        self._tokens = aiolimiter.AsyncLimiter(tokens_per_minute, 60) if tokens_per_minute else None
+
+    async def acquire(self, tokens: float = 0) -> None:
+        """Waits until a request of `tokens` (estimated) tokens fits in both budgets."""
+        if self._requests is not None:
+            await self._requests.acquire()
+        if self._tokens is not None and tokens:
+            # a request larger than the whole budget waits for a full minute of capacity
+            await self._tokens.acquire(min(tokens, self.tokens_per_minute))
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of a rate limit header duration: `20`, `1.5s`, `6m0s` or `59ms`. None if unparsable."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_after(headers: Optional[Mapping]) -> Optional[float]:
+    """The seconds a provider asks to wait (`retry-after-ms` / `retry-after`), None if it doesn't say."""
+    if not headers:
+        return None
+    if headers.get("retry-after-ms") is not None:
+        seconds = parse_duration(headers["retry-after-ms"])
+        return seconds / 1000 if seconds is not None else None
+    return parse_duration(headers.get("retry-after"))
+
+
+def error_headers(error: BaseException) -> Mapping:
+    """The response headers of an SDK error (e.g. `openai.RateLimitError`), empty without a response."""
+    return getattr(getattr(error, "response", None), "headers", None) or {}
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self, initial: float = DEFAULT_INITIAL_LIMIT, min_limit: float = 1, max_limit: float = DEFAULT_MAX_LIMIT,
+        increase: float = 1, decrease: float = 0.5, headroom: float = DEFAULT_HEADROOM, name: str = ""):
+        """
+        Args:
+            initial (float): Calls in flight at first.
+            min_limit (float): Lowest limit of calls in flight.
+            max_limit (float): Highest limit of calls in flight.
+            increase (float): Limit added per limit's worth of successful calls (~ per round trip).
+            decrease (float): Factor of the limit on a rate limit error.
+            headroom (float): Share of the remaining requests/tokens under which the limit stops growing.
+            name (str): For the logs, e.g. `openai/gpt-4`.
+
+        Usable from any thread and event loop at once.
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.headroom = headroom
+        self.name = name
+        self.in_flight = 0
+        self._epoch = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    @classmethod
+    def from_config(cls, config=None, name: str = "") -> Optional["AdaptiveLimiter"]:
+        """The limiter of an `adaptive_concurrency` block, None when disabled."""
+        config = dict(config or {})
+        if config.get('enabled', True) is False:
+            return None
+        return cls(
+            initial=config.get('initial', DEFAULT_INITIAL_LIMIT),
+            min_limit=config.get('min', 1),
+            max_limit=config.get('max', DEFAULT_MAX_LIMIT),
+            headroom=config.get('headroom', DEFAULT_HEADROOM),
+            name=name,
+        )
+
+    def _wake(self) -> None:
+        # under the lock: wakes as many waiters as there are free slots
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            loop, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+            free -= 1
+
+    async def acquire(self) -> int:
+        """Waits for a slot. Returns the congestion epoch the call starts in, for `rate_limited`."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                pause = self._paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return self._epoch
+                waiter = None
+                if pause <= 0:
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+            if waiter is None:
+                await asyncio.sleep(pause)
+                continue
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    # pass on a wake up this waiter may have taken
+                    self._wake()
+                raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot, yields the call's epoch. `create` calls made inside use it instead of queueing again."""
+        epoch = await self.acquire()
+        token = _held_slot.set((self, epoch))
+        try:
+            yield epoch
+        finally:
+            _held_slot.reset(token)
+            self.release()
+
+    def succeeded(self, headers: Optional[Mapping] = None) -> None:
+        """
+        A call went through: the limit grows, unless the provider's rate limit headers show less
+        than `headroom` of the window left. Once it's exhausted, calls wait for the window's reset.
+        """
+        headers = headers or {}
+        shares, resets = [], []
+        for kind in ("requests", "tokens"):
+            remaining, limit = headers.get(f"x-ratelimit-remaining-{kind}"), headers.get(f"x-ratelimit-limit-{kind}")
+            try:
+                remaining, limit = float(remaining), float(limit)
+            except (TypeError, ValueError):
+                continue
+            if limit > 0:
+                shares.append(remaining / limit)
+            if remaining <= 0:
+                resets.append(parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 0)
+        with self._lock:
+            if resets:
+                self._paused_until = max(self._paused_until, time.monotonic() + max(resets))
+            elif not shares or min(shares) >= self.headroom:
+                self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1))
+                self._wake()
+
+    def rate_limited(self, epoch: int, headers: Optional[Mapping] = None) -> Optional[float]:
+        """
+        A call started in `epoch` was rate limited: the limit is cut (once per epoch, the 429s of a
+        burst count once) and every call waits for the provider's `retry-after`.
+
+        Returns:
+            float: The seconds the provider asked to wait, None if it didn't say.
+        """
+        wait = retry_after(headers)
+        with self._lock:
+            if epoch == self._epoch:
+                self._epoch += 1
+                previous, self.limit = self.limit, max(self.min_limit, self.limit * self.decrease)
+                logger.info(f"{self.name or 'Adaptive limiter'}: rate limited, concurrency {previous:.1f} -> {self.limit:.1f}")
+            if wait:
+                self._paused_until = max(self._paused_until, time.monotonic() + wait)
+        return wait
+
+    async def create(self, resource, rate_limit_errors: Tuple[type, ...] = (), **body) -> Any:
+        """
+        `await resource.create(**body)` on an OpenAI SDK style resource, in a slot: its rate limit
+        headers (or its `rate_limit_errors`) feed the limit back.
+        """
+        held = _held_slot.get()
+        if held is not None and held[0] is self:
+            return await self.request(held[1], resource, rate_limit_errors, **body)
+        queued_at = time.perf_counter()
+        async with self.slot() as epoch:
+            note_queue_wait(time.perf_counter() - queued_at)
+            return await self.request(epoch, resource, rate_limit_errors, **body)
+
+    async def request(self, epoch: int, resource, rate_limit_errors: Tuple[type, ...] = (), **body) -> Any:
+        """The request of `create`, in a slot taken in `epoch`."""
+        try:
+            response, headers = await acreate_with_headers(resource, **body)
+        except rate_limit_errors as e:
+            self.rate_limited(epoch, error_headers(e))
+            raise
+        self.succeeded(headers)
+        return response
+
+
+# the slot held by the current task (and the hedges it starts), see `AdaptiveLimiter.slot`
+_held_slot: ContextVar[Optional[Tuple[AdaptiveLimiter, int]]] = ContextVar("lm_act_eval_adaptive_slot", default=None)
+
+_adaptive_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_adaptive_config: Any = None
+_adaptive_lock = threading.Lock()
+
+
+def configure_adaptive_concurrency(config=None) -> None:
+    """Sets the `adaptive_concurrency` block of the limiters created from now on."""
+    global _adaptive_config
+    with _adaptive_lock:
+        _adaptive_config = config
+        _adaptive_limiters.clear()
+
+
+def adaptive_limiter(provider: str, model: str) -> Optional[AdaptiveLimiter]:
+    """The process-wide limiter of a model, shared by every metric calling it. None when disabled."""
+    with _adaptive_lock:
+        key = (provider, model)
+        if key not in _adaptive_limiters:
+            _adaptive_limiters[key] = AdaptiveLimiter.from_config(_adaptive_config, name=f"{provider}/{model}")
+        return _adaptive_limiters[key]
+
+
+async def acreate_with_headers(resource, **body) -> Tuple[Any, Mapping]:
+    """`await resource.create(**body)` and its response headers, via `with_raw_response` for OpenAI SDK resources."""
+    raw = getattr(resource, "with_raw_response", None)
+    if raw is None:
+        return await resource.create(**body), {}
+    response = await raw.create(**body)
+    return response.parse(), response.headers
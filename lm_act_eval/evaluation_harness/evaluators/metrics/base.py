@@ -1,12 +1,40 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
+import asyncio
 import pandas as pd
-from datasets import Dataset
-from typing import Any, Union, Literal, Dict
+from typing import TYPE_CHECKING, Any, List, Optional, Union, Literal, Dict
 
-from lm_act_eval.evaluation_harness.helper_functions.utils import function_registry
+from lm_act_eval.evaluation_harness.evaluators.checkpoint import ascore_rows
+from lm_act_eval.evaluation_harness.evaluators.trajectory_index import trajectory_index
+from lm_act_eval.evaluation_harness.helper_functions.registry import function_registry
 from lm_act_eval.evaluation_harness.utils.url import is_screenshot_url_accessible
 
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+    from lm_act_eval.evaluation_harness.evaluators.checkpoint import MetricCheckpoint
+    from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter
+
+
+def assemble_row_results(results: List[Any], index: pd.Index) -> Union[pd.Series, pd.DataFrame]:
+    """Puts per-row results back on the rows they were computed for, a DataFrame if rows returned Series."""
+    if results and all(isinstance(r, pd.Series) for r in results):
+        return pd.DataFrame(results, index=index)
+    return pd.Series(results, index=index, dtype=object)
+
+def metric_args(config) -> Dict[str, Any]:
+    """The metric `args` as one dict, merging the list form (`- KEY: value` items) of the configs."""
+    if config is None:
+        return {}
+    if isinstance(config, (dict, DictConfig)):
+        return dict(config)
+    merged = {}
+    for item in config:
+        if isinstance(item, (dict, DictConfig)):
+            merged.update(item)
+    return merged
 
 class BaseScorer:
     def __init__(self, config: OmegaConf, *args, **kwargs):
@@ -33,6 +61,9 @@ class BaseScorer:
       return self.evaluate()
     
 class DFTableScorer(BaseScorer):
+    # the API `ascore_row` calls, selects the per-provider concurrency cap
+    provider: Optional[str] = None
+
     def __init__(self, config: OmegaConf, *args, **kwargs):
         self.config = config
         self.process_df = pd.DataFrame()
@@ -42,6 +73,10 @@ class DFTableScorer(BaseScorer):
         return ""
     
     def get_last_in_trajectory(self, df, group, idx):
+      # the evaluation's trajectory index, when attached to `df` (see `trajectory_index.py`)
+      index = trajectory_index(df)
+      if index is not None and index.keys == (group, idx) and index.aligned_with(df):
+        return index.last_steps(df)
       return df.loc[df.groupby(group)[idx].idxmax()]
     
     @abstractmethod
@@ -69,6 +104,33 @@ class DFTableScorer(BaseScorer):
       self.evals = self.evaluate()
       return self._process_result()
     
+    async def ascore_row(self, row: pd.Series) -> Any:
+      """
+      Scores a single row. I/O-bound scorers override this so their rows are evaluated
+      concurrently by the async evaluator, see `acall`.
+      """
+      raise NotImplementedError
+
+    @property
+    def supports_async(self) -> bool:
+      return type(self).ascore_row is not DFTableScorer.ascore_row
+
+    async def acall(
+      self, dataset: pd.DataFrame, limiter: ConcurrencyLimiter, checkpoint: Optional[MetricCheckpoint] = None) -> Any:
+      """
+      Async counterpart of `__call__`: `ascore_row` runs for every eligible row under the
+      limiter and the results are reassembled in row order before `_process_result`.
+      With a checkpoint, rows scored by the run being resumed are skipped, see `checkpoint.py`.
+      """
+      self.input_df = dataset
+      # eligibility checks may block (e.g. screenshot URL checks), keep them off the event loop
+      await asyncio.to_thread(self._process)
+      results = await ascore_rows(
+        self.ascore_row, self.process_df, limiter, provider=self.provider,
+        desc=f"Evaluating with {type(self).__name__}", checkpoint=checkpoint)
+      self.evals = assemble_row_results(results, self.process_df.index)
+      return self._process_result(self.evals)
+
     @property
     def evaluations(self):
       return self.evals
\ No newline at end of file
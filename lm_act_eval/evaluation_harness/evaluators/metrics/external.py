@@ -18,6 +18,8 @@ metric_registry.register("edit_distance")(levenshtein_comparator)
 
 @metric_registry.register("contextual_precision")
 class contextual_precision:
+  provider = "openai"
+
   def __init__(
     self, threshold:float=0.7, model:str="gpt-4", include_reason:bool=True ):
     """
@@ -32,10 +34,8 @@ class contextual_precision:
       )
     ```
     """
-    self.metric = ContextualPrecisionMetric(
-      threshold=threshold, model=model,
-      include_reason=include_reason
-    )
+    self._metric_kwargs = dict(threshold=threshold, model=model, include_reason=include_reason)
+    self.metric = ContextualPrecisionMetric(**self._metric_kwargs)
     self._is_called = False
     
   def __call__(
@@ -53,6 +53,23 @@ class contextual_precision:
     self._is_called = True
     return self.metric.measure(test_case)
   
+  async def ascore_row(self, row) -> Any:
+    """
+    Scores one row holding the `input`, `actual_output`, `expected_output` and
+    `retrieval_context` fields, with the judge call awaited instead of blocking.
+    """
+    retrieval_context = row.get('retrieval_context')
+    if not isinstance(retrieval_context, list):
+      retrieval_context = [retrieval_context] if retrieval_context is not None else []
+    test_case = LLMTestCase(
+      input=row['input'], actual_output=row['actual_output'],
+      expected_output=row['expected_output'], retrieval_context=retrieval_context
+    )
+    # a metric per row: deepeval stores the score & reason on the metric instance
+    metric = ContextualPrecisionMetric(**self._metric_kwargs)
+    await metric.a_measure(test_case)
+    return metric.score
+
   @property
   def score(self):
     if not self._is_called:
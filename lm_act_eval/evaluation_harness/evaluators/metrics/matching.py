@@ -0,0 +1,29 @@
+"""
+String comparisons without browser/LLM dependencies, shared by the DataFrame scorers and `StringEvaluator`
+"""
+from typing import Union
+
+from beartype import beartype
+
+
+class StringMatcher:
+    """Check whether the answer is exactly the same as the reference answer"""
+
+    @staticmethod
+    @beartype
+    def clean_answer(answer: str) -> str:
+        if answer.startswith("'") and answer.endswith("'"):
+            answer = answer[1:-1]
+        elif answer.startswith('"') and answer.endswith('"'):
+            answer = answer[1:-1]
+        return answer.lower()
+
+    @staticmethod
+    @beartype
+    def exact_match(ref: str, pred: Union[str, int]) -> float:
+        if isinstance(pred, int):
+            pred = str(pred)
+        return float(
+            StringMatcher.clean_answer(pred)
+            == StringMatcher.clean_answer(ref)
+        )
@@ -1,5 +1,4 @@
-from cv2 import DFT_COMPLEX_INPUT
-from .string import StringEvaluator
+from .matching import StringMatcher
 from typing import *
 import pandas as pd
 
@@ -29,7 +28,7 @@ class opentable_reservation_html(DFTableScorer):
             config (dict): A dictionary containing the configuration parameters.
         """
         self.config = config
-        self.str_evaluator = StringEvaluator(config)
+        self.str_evaluator = StringMatcher()
 
     def _process_input(self, df):
         """
@@ -14,38 +14,20 @@ from lm_act_eval.evaluation_harness.helper_functions import (
 )
 
 from .numeric import NumericEvaluator
+from .matching import StringMatcher
 
 
 from .. import USER_AGENT_HEADERS
 from lm_act_eval.evaluation_harness.evaluators.webarena_rl.base import Evaluator, Trajectory
 
 @beartype
-class StringEvaluator(Evaluator):
+class StringEvaluator(StringMatcher, Evaluator):
     """Check whether the answer is correct with:
     exact match: the answer is exactly the same as the reference answer
     must include: each phrase in the reference answer must be included in the answer
     fuzzy match: the answer is similar to the reference answer, using LLM judge
     """
     
-    @staticmethod
-    @beartype
-    def clean_answer(answer: str) -> str:
-        if answer.startswith("'") and answer.endswith("'"):
-            answer = answer[1:-1]
-        elif answer.startswith('"') and answer.endswith('"'):
-            answer = answer[1:-1]
-        return answer.lower()
-
-    @staticmethod
-    @beartype
-    def exact_match(ref: str, pred: Union[str, int]) -> float:
-        if isinstance(pred, int):
-            pred = str(pred)
-        return float(
-            StringEvaluator.clean_answer(pred)
-            == StringEvaluator.clean_answer(ref)
-        )
-
     @staticmethod
     @beartype
     def must_include(ref: str, pred: str) -> float:
@@ -1,17 +1,39 @@
-
-from pyclbr import Class
-from typing import Callable, Union, Type, List
+import importlib
+from typing import Callable, Dict, Optional, Union, Type, List
 
 import warnings
 
+from lm_act_eval.evaluation_harness.manifest import EVALUATOR_MANIFEST, METRIC_MANIFEST
+
+
+def resolve_reference(reference: str):
+    """
+    Imports and returns the object pointed to by a ``"module:attr"`` manifest reference.
+
+    Args:
+        reference (str): The reference, e.g. ``"package.module:ClassName"``.
+
+    Returns:
+        Any: The referenced attribute of the imported module.
+    """
+    module_name, _, attr = reference.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attr)
+
+
 class Registry:
-    def __init__(self):
+    def __init__(self, manifest: Optional[Dict[str, str]] = None):
         """
         Initializes an instance of the class with an instance-specific registry to track all registered items.
+
+        Args:
+            manifest (Optional[Dict[str, str]]): Names mapped to ``"module:attr"`` references that are
+                only imported on the first ``get`` of that name.
         """
         # Initialize an instance-specific registry to track all registered items
         self._registry = {}
-    
+        self._manifest = dict(manifest or {})
+
     def register(self, name: str) -> Callable:
         def inner(func: Union[Type, Callable]) -> Union[Type, Callable]:
             # Update the instance-specific registry
@@ -19,10 +41,21 @@ class Registry:
             return func
         return inner
 
+    def _resolve(self, name: str):
+        """Imports the manifest entry for ``name``; the module's own decorator usually registers it."""
+        reference = self._manifest[name]
+        obj = resolve_reference(reference)
+        return self._registry.setdefault(name, obj)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._registry or name in self._manifest
+
     def get(self, name: Union[str, List[str]]):
         """
         Retrieves the value associated with the given name from the registry.
 
+        Names that are only known through the manifest are imported on first access.
+
         Parameters:
             name (Union[str, List[str]]): The name or names of the values to retrieve.
 
@@ -37,8 +70,8 @@ class Registry:
             # Prepare a result dictionary for names that exist
             result = {}
             for n in name:
-                if n in self._registry:
-                    result[n] = self._registry[n]
+                if n in self:
+                    result[n] = self.get(n)
                 else:
                     warnings.warn(f"{n} doesn't exist in the registry.")
             return result
@@ -46,13 +79,15 @@ class Registry:
             # Single name case
             if name in self._registry:
                 return self._registry[name]
+            elif name in self._manifest:
+                return self._resolve(name)
             else:
                 raise Exception(f"{name} doesn't exist in the registry.")
 
     def list_registered(self):
-        # List registered items for this instance
-        return list(self._registry.keys())
-    
-metric_registry = Registry()
+        # List registered items for this instance, including the ones not imported yet
+        return list(dict.fromkeys([*self._manifest, *self._registry]))
+
+metric_registry = Registry(METRIC_MANIFEST)
 
-evaluator_registry = Registry()
\ No newline at end of file
+evaluator_registry = Registry(EVALUATOR_MANIFEST)
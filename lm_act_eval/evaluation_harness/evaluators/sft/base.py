@@ -1,19 +1,17 @@
-from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union
+from __future__ import annotations
 
-import wandb
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
-from transformers import (
-    EvalPrediction,
-    PreTrainedModel,
-    PreTrainedTokenizerBase,
-)
 import argparse
 import numpy as np
-from datasets import Dataset
-import wandb
 import pandas as pd
 
+if TYPE_CHECKING:
+    # only needed for annotations, keep transformers/datasets off the import path
+    from transformers import PreTrainedModel
+    from datasets import Dataset
+
 # from .utils import generate_completions
 # from ..metrics import Action as ActionEvaluator
 
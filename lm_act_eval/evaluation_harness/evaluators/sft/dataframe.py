@@ -1,124 +1,302 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor
 from typing import Any, Dict, List, Optional, Union
 import asyncio
-
-import wandb
+from functools import partial
+import math
+import pickle
 
 from .base import BaseEvaluator
-import wandb
 # from tqdm import tqdm
 import pandas as pd
 from tqdm.asyncio import tqdm
 
-from .utils import cfg_to_evaluator, cfg_to_function
+from omegaconf import DictConfig
+
+from ..checkpoint import MISSING, CheckpointStore, MetricCheckpoint, ascore_rows, checkpoints_for, frame_hash
+from ..concurrency import ConcurrencyLimiter
+from ..trajectory_index import TrajectoryIndex, attach_trajectory_index
+from ..metrics.base import DFTableScorer, assemble_row_results
+from .readers import iter_table, read_table
+from .scheduler import MetricGraph, make_executor
+from .streaming import MetricAggregate, iter_session_chunks
+from .utils import cfg_to_evaluator, identity, resolve_extractors
+from ...utils.telemetry import metric_context
 
 import logging
 
 tqdm.pandas()
 logger = logging.getLogger(__name__)
 
-async def apply_function_async(data, func):
-    return func(data)
+def input_fields(columns, inputs) -> List[str]:
+    """Columns matching any of the metric `inputs` by case-insensitive prefix."""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    prefixes = tuple(str(i).lower() for i in inputs or [])
+    return [c for c in columns if c.lower().startswith(prefixes)]
+
+def _apply_row_wise(source: pd.Series, extract_function) -> Union[pd.Series, pd.DataFrame]:
+    results = [extract_function(value) for value in source]
+    if results and isinstance(results[0], pd.Series):
+        # multiple fields, one column per Series entry
+        return pd.DataFrame(results, index=source.index)
+    return pd.Series(results, index=source.index, dtype=object)
+
+
+def _extract(source: pd.Series, extract_function, batch_function) -> Union[pd.Series, pd.DataFrame]:
+    if batch_function is not None:
+        return batch_function(source)
+    return _apply_row_wise(source, extract_function)
+
+
+# below this many rows per worker, shipping the rows to a process costs more than extracting them
+MIN_ROWS_PER_WORKER = 256
+
+
+def _extract_in_pool(
+    executor: Executor, workers: int, source: pd.Series, extract_function, batch_function
+) -> Union[pd.Series, pd.DataFrame]:
+    """Extracts `source` in contiguous chunks over the pool, results are concatenated in row order."""
+    # a few chunks per worker evens out rows of uneven cost (e.g. DOM sizes)
+    chunk_rows = max(MIN_ROWS_PER_WORKER, math.ceil(len(source) / (workers * 4)))
+    chunks = [source.iloc[i:i + chunk_rows] for i in range(0, len(source), chunk_rows)]
+    results = executor.map(
+        _extract, chunks, [extract_function] * len(chunks), [batch_function] * len(chunks))
+    return pd.concat(list(results))
+
+
+def _picklable(*functions) -> bool:
+    try:
+        pickle.dumps(functions)
+        return True
+    except Exception:
+        return False
+
+
+def apply_extractors(input_df: pd.DataFrame, extract_fs, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Applies the `data.extract_fs` functions to their source fields.
+
+    The vectorized implementation of a function is used when registered, the row-wise one otherwise.
+    A function returning several fields gives one column per field, named '<tgt_field>_<field>'.
+
+    Args:
+        input_df (pd.DataFrame): The input DataFrame containing the source fields.
+        extract_fs: The `data.extract_fs` config.
+        workers (int, optional): Processes to fan the extraction out to (`data.workers`). Inputs with
+            fewer than `MIN_ROWS_PER_WORKER` rows per worker, identity fields and functions that can't
+            be pickled are extracted serially. Results are identical to the serial path.
+
+    Returns:
+        pd.DataFrame: The extracted target fields, on the index of `input_df`.
+    """
+    workers = min(workers or 1, len(input_df) // MIN_ROWS_PER_WORKER)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    columns = []
+    try:
+        for (src_field, tgt_field), extract_function, batch_function in tqdm(
+            resolve_extractors(extract_fs),
+            desc="Mapping fields to processing functions"
+        ):
+            parallel = (
+                executor is not None and extract_function is not identity
+                and _picklable(extract_function, batch_function))
+            logger.info(f"Extracting to {tgt_field} from {src_field}"
+                        + (" (vectorized)" if batch_function is not None else "")
+                        + (f" over {workers} processes" if parallel else ""))
+            if parallel:
+                extracted_data = _extract_in_pool(
+                    executor, workers, input_df[src_field], extract_function, batch_function)
+            else:
+                extracted_data = _extract(input_df[src_field], extract_function, batch_function)
+
+            if isinstance(extracted_data, pd.DataFrame):
+                columns.append(extracted_data.add_prefix(f'{tgt_field}_'))
+                logger.info(f"Multiple fields extracted to prefixed '{tgt_field}' fields")
+            else:
+                columns.append(extracted_data.rename(tgt_field))
+                logger.info(f"Single field extracted to '{tgt_field}'")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    # a single concat instead of growing the frame field by field
+    if not columns:
+        return pd.DataFrame(index=input_df.index)
+    return pd.concat(columns, axis=1)
+
+def select_inputs(df: pd.DataFrame, inputs) -> pd.DataFrame:
+    """
+    The scorer input for the metric `inputs`.
+
+    Plain names select every column they prefix (case-insensitive), `{param: column}` items
+    select `column` renamed to `param` (e.g. `- actual_output: y_`), empty columns are skipped.
+    """
+    if inputs is None or isinstance(inputs, str):
+        inputs = [inputs] if inputs else []
+    selected = []
+    for item in inputs:
+        if isinstance(item, (dict, DictConfig)):
+            selected.extend(df[column].rename(param) for param, column in dict(item).items() if column is not None)
+        else:
+            selected.extend(df[c] for c in input_fields(df.columns, [item]))
+    if not selected:
+        return pd.DataFrame(index=df.index)
+    return pd.concat(selected, axis=1)
+
+
+async def ascore(
+    scorer, scorer_input: pd.DataFrame, limiter: ConcurrencyLimiter,
+    checkpoint: Optional[MetricCheckpoint] = None) -> Any:
+    """
+    Runs one metric without blocking the event loop.
+
+    Scorers exposing a per-row coroutine (`ascore_row`) are evaluated row-concurrently under the
+    limiter, with results reassembled in row order. Any other scorer runs in a worker thread.
+    With a checkpoint, row-level results are stored as each row completes and other scorers'
+    results once the scorer returns, so a resumed run only scores what is missing.
+    """
+    if isinstance(scorer, DFTableScorer):
+        if scorer.supports_async:
+            return await scorer.acall(scorer_input, limiter, checkpoint=checkpoint)
+    elif hasattr(scorer, 'ascore_row'):
+        results = await ascore_rows(
+            scorer.ascore_row, scorer_input, limiter, provider=getattr(scorer, 'provider', None),
+            desc=f"Evaluating with {type(scorer).__name__}", checkpoint=checkpoint)
+        return assemble_row_results(results, scorer_input.index)
+    if checkpoint is None:
+        return await asyncio.to_thread(scorer, scorer_input)
+    key = frame_hash(scorer_input)
+    result = checkpoint.get(key)
+    if result is MISSING:
+        result = await asyncio.to_thread(scorer, scorer_input)
+        checkpoint.put(key, result)
+    else:
+        logger.info(f"'{checkpoint.metric}' restored from checkpoint")
+    return result
+
+
+def score_metric(
+    metric_name: str, scorer, scorer_input: pd.DataFrame,
+    checkpoints: Optional[Dict[str, MetricCheckpoint]] = None, config=None) -> Any:
+    """
+    Runs one metric on a scheduler worker. Checkpointed metrics go through `ascore` in a private
+    event loop (with its own `ConcurrencyLimiter`), so rows are stored as they complete.
+    LLM calls made meanwhile are attributed to the metric (see `utils/telemetry.py`).
+    """
+    checkpoint = (checkpoints or {}).get(metric_name)
+    with metric_context(metric_name):
+        if checkpoint is None:
+            return scorer(scorer_input)
+        return asyncio.run(ascore(scorer, scorer_input, ConcurrencyLimiter.from_config(config), checkpoint))
+
 
 class AsyncDataFrameEvaluator(BaseEvaluator):
-    def __init__(self, config: dict, *args, **kwargs):
+    def __init__(self, config: dict, *args, resume: bool = False, **kwargs):
         self.config = config
+        self.input_df = read_table(config)
+        self.df = self.source_df = None
+        self.trajectory_index = None
+        # shared by every metric of the evaluation, see `concurrency.py`
+        self.limiter = ConcurrencyLimiter.from_config(config)
+        # per-metric result checkpoints of this run (or the resumed one), see `checkpoint.py`
+        self.checkpoints = checkpoints_for(CheckpointStore.from_config(config, resume=resume), self.metric_configs)
 
     @classmethod
     async def create(cls, config: dict):
         instance = cls(config)
-        instance.input_df = pd.read_csv(config, index_col=0)
-        await instance._process_inputs(instance.input_df)
+        await instance._process_input(instance.input_df)
         return instance
-    
+
     @property
     def metric_configs(self):
         return self.config.metrics
 
     async def _process_input(self, input_df):
         """
-        Processes the dataframe in preparation for evaluation using asynchronous function application.
+        Processes the dataframe in preparation for evaluation, see `apply_extractors`.
+        Extraction is CPU-bound and runs in a worker thread, keeping the event loop free.
 
         Args:
             input_df (pd.DataFrame): The input DataFrame containing the data to be processed.
         """
-        config_funcs = cfg_to_function(self.config['data']['extract_fs'])
-        tasks = []
-        
-        for (src_field, tgt_field), extract_function in config_funcs:
-            task = asyncio.create_task(apply_function_async(input_df[src_field], extract_function))
-            tasks.append((task, src_field, tgt_field))
-
-        await tqdm.gather(
-            *[t[0] for t in tasks], 
-            desc="Mapping fields to processing functions")
-
-        for task, src_field, tgt_field in tasks:
-            extracted_data = task.result()
-            if isinstance(extracted_data, pd.Series):
-                new_columns = {f'{tgt_field}_{col}': extracted_data[col] for col in extracted_data.index}
-                self.df = pd.concat([self.df, pd.DataFrame(new_columns, index=input_df.index)], axis=1)
-                logger.info(f"Multiple fields extracted to prefixed '{tgt_field}' fields")
-            else:
-                self.df[tgt_field] = extracted_data
-                logger.info(f"Single field extracted to '{tgt_field}'")
+        self.df = await asyncio.to_thread(
+            apply_extractors, input_df, self.config.data.extract_fs, self.config.data.get('workers'))
+        # the raw columns, read by the derived columns of `produces`
+        self.source_df = input_df
+        # built from the input, the extracted frame keeps its rows but not the session columns
+        self.trajectory_index = await asyncio.to_thread(TrajectoryIndex.from_frame, input_df)
 
-
-    def apply_async(self, column_data, extract_function, tgt_field):
-        results = pd.Series([extract_function(item) for item in column_data])
-        if isinstance(results.iloc[0], pd.Series):
-            # If multiple fields, process as a DataFrame with the extra fields
-            return pd.DataFrame({f'{tgt_field}_{col}': results.apply(lambda x: x[col]) for col in results.iloc[0].index})
-        else:
-            # If a single field, return as a single-column DataFrame
-            return pd.DataFrame({tgt_field: results})
-    
-    def process_result(self):
+    def process_result(self, evaluations: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
         concat_dfs = []
-        # Iterate over the dictionary items
-        for names, df in self.evaluations.items():
+        for names, df in (evaluations or self.evaluations).items():
+            if not isinstance(df, (pd.DataFrame, pd.Series)):
+                # aggregated (scalar) metric results
+                df = pd.DataFrame({'score': [df]})
+            df = df.to_frame() if isinstance(df, pd.Series) else df
             # Ensure the DataFrame index is a default RangeIndex for proper alignment
             df = df.reset_index(drop=True)
             # Create a MultiIndex for the columns with the names as the top level
             # and the original columns as the second level
             df.columns = pd.MultiIndex.from_product(
                 [[names], df.columns])
-            # Append the modified DataFrame to the list
             concat_dfs.append(df)
-        
         return pd.concat(concat_dfs, axis=1)
 
-    def evaluate(self):
-        self.evaluations = dict()
-        for scorer_name, (scorer, inputs) in zip(self.metric_configs, cfg_to_evaluator(self.metric_configs)):   
-            input_fields = [c for c in self.df.columns if c.lower().startswith(inputs)]
-            self.evaluations[scorer_name] = scorer(self.df[input_fields])
-        
+    async def aevaluate(self) -> Dict[str, Any]:
+        """
+        Evaluates every metric concurrently. I/O-bound scorers additionally run their rows
+        concurrently, all under the same `ConcurrencyLimiter`.
+
+        Returns:
+            Dict[str, Any]: The result of each metric, by metric name.
+        """
+        if self.df is None:
+            await self._process_input(self.input_df)
+        # derived columns are computed once and metrics start as soon as what they read is ready
+        graph = MetricGraph.build(self.metric_configs, cfg_to_evaluator(self.metric_configs))
+        self.evaluations, self.df = await graph.arun(
+            self.df, self._select_inputs, apply_extractors, self._ascore, source=self.source_df)
+        return self.evaluations
+
+    def _select_inputs(self, df: pd.DataFrame, inputs) -> pd.DataFrame:
+        return attach_trajectory_index(select_inputs(df, inputs), self.trajectory_index)
+
+    async def _ascore(self, metric_name: str, scorer, scorer_input: pd.DataFrame) -> Any:
+        # each metric is its own task, the context set here is the metric's only
+        with metric_context(metric_name):
+            return await ascore(scorer, scorer_input, self.limiter, self.checkpoints.get(metric_name))
+
+    def evaluate(self) -> Dict[str, Any]:
+        """Synchronous entry point, runs `aevaluate` in a new event loop."""
+        return asyncio.run(self.aevaluate())
+
     async def __call__(self, input: Union[pd.DataFrame], *args: Any, **kwds: Any) -> Any:
         await self._process_input(input)
-        evals = self.evaluate()
+        evals = await self.aevaluate()
         return self.process_result(evals)
-    
+
     @abstractmethod
     def log_artifacts(self):
         """Create and log a wandb db artifact or table object."""
-        log_config = self.config.data.logging
-        if self.results is not None:
-            table = wandb.Table(data=[list(self.results.values())], columns=list(self.results.keys()))
-            self.artifact = wandb.log({"evaluation_results": table})
-        else:
-            print("No results to log.")
 
-class AsyncDataFrameEvaluator:
-    def __init__(self, config: dict, *args, **kwargs):
+class DataFrameEvaluator(BaseEvaluator):
+    def __init__(self, config: dict, *args, resume: bool = False, **kwargs):
         self.config = config
-        self.input_df = pd.read_csv(config.data.path, index_col=0)
+        # in streaming mode the input is read chunk by chunk in `evaluate_streaming`
+        self.input_df = None if self.chunk_rows else read_table(config)
+        self.source_df = self.trajectory_index = None
+        # per-metric result checkpoints of this run (or the resumed one), see `checkpoint.py`
+        self.checkpoints = checkpoints_for(CheckpointStore.from_config(config, resume=resume), self.metric_configs)
 
     @property
     def metric_configs(self):
         return self.config.metrics
 
-    async def _process_input(self, input_df):
+    @property
+    def chunk_rows(self) -> Optional[int]:
+        return self.config.data.get('chunk_rows')
+
+    def _process_input(self, input_df):
         """
         Processes the dataframe in preparation for evaluation.
         Subclasses should implement the logic to transform or prepare the data.
@@ -131,32 +309,12 @@ class AsyncDataFrameEvaluator:
         Args:
             input_df (pd.DataFrame): The input DataFrame containing the data to be processed.
         """
-        self.df = pd.DataFrame()
-        async for (src_field, tgt_field), extract_function in tqdm(
-            cfg_to_function(self.config['data']['extract_fs']),
-            desc="Mapping fields to processing functions"
-        ):
-            logger.info(f"Extracting to {tgt_field} from {src_field}")
-            extracted_data = input_df[src_field].apply(extract_function)
-
-            if isinstance(extracted_data.iloc[0], pd.Series):
-                new_columns = {
-                    f'{tgt_field}_{col}': await extracted_data.apply(lambda x: x[col]) for col in extracted_data.iloc[0].index
-                }
-                self.df = pd.concat([self.df, pd.DataFrame(new_columns)], axis=1)
-                logger.info(f"Multiple fields extracted to prefixed '{tgt_field}' fields")
-            else:
-                self.df[tgt_field] = extracted_data
-                logger.info(f"Single field extracted to '{tgt_field}'")
-    
-    async def apply_async(df, func):
-        # Apply the async function to all elements and collect tasks
-        tasks = [func(html) for html in df['HTML']]
-        # Wait for all tasks to complete
-        results = await asyncio.gather(*tasks)
-        # Assign results
-        df['Tag_Count'] = results
-        return df
+        self.df = apply_extractors(
+            input_df, self.config.data.extract_fs, workers=self.config.data.get('workers'))
+        # the raw columns, read by the derived columns of `produces`
+        self.source_df = input_df
+        # one session sort per evaluation (or chunk), shared by every scorer
+        self.trajectory_index = TrajectoryIndex.from_frame(input_df)
     
     def process_result(self):
         concat_dfs = []
@@ -176,86 +334,49 @@ class AsyncDataFrameEvaluator:
         composite_df = pd.concat(concat_dfs, axis=1)
 
     def evaluate(self):
-        self.evaluations = dict()
-        for scorer_name, (scorer, inputs) in zip(self.metric_configs, cfg_to_evaluator(self.metric_configs)):
-            input_fields = []
-            print(inputs)
-            for i in inputs:
-                input_fields.extend([c for c in self.df.columns if c.lower().startswith(i)])
-            self.evaluations[scorer_name] = scorer(self.df[input_fields])
-        
-    async def __call__(self, input: Union[pd.DataFrame], *args: Any, **kwds: Any) -> Any:
-        await self._process_input(input)
-        evals = self.evaluate()
-        return self.process_result(evals)
-          
-class DataFrameEvaluator(BaseEvaluator):
-    def __init__(self, config: dict, *args, **kwargs):
-        self.config = config
-        self.input_df = pd.read_csv(config.data.path, index_col=0)
-
-    @property
-    def metric_configs(self):
-        return self.config.metrics
+        if self.chunk_rows and self.input_df is None:
+            return self.evaluate_streaming()
+        self.evaluations = self._run_metrics(cfg_to_evaluator(self.metric_configs))
+        return self.evaluations
 
-    def _process_input(self, input_df):
+    def _run_metrics(self, scorers) -> Dict[str, Any]:
         """
-        Processes the dataframe in preparation for evaluation.
-        Subclasses should implement the logic to transform or prepare the data.
-        
-        This method updates the dataframe by applying extract functions to specified
-        source fields and creating new target fields in the dataframe. If an extract
-        function returns multiple fields, the names of these fields are prefixed with
-        'html_' and the base target field name.
+        Runs the metrics as a dependency graph (see `scheduler.py`): shared derived columns are
+        computed once and independent metrics run concurrently on the `scheduler` executor.
+        """
+        graph = MetricGraph.build(self.metric_configs, scorers)
+        score = partial(score_metric, checkpoints=self.checkpoints, config=self.config)
+        with make_executor(self.config, graph) as executor:
+            results, self.df = graph.run(
+                self.df, self._select_inputs, apply_extractors, executor, score, source=self.source_df)
+        return results
 
-        Args:
-            input_df (pd.DataFrame): The input DataFrame containing the data to be processed.
+    def _select_inputs(self, df: pd.DataFrame, inputs) -> pd.DataFrame:
+        return attach_trajectory_index(select_inputs(df, inputs), self.trajectory_index)
+
+    def evaluate_streaming(self) -> Dict[str, Any]:
         """
-        self.df = pd.DataFrame()
-        for (src_field, tgt_field), extract_function in tqdm(
-            cfg_to_function(self.config.data.extract_fs),
-            desc="Mapping fields to processing functions"
-        ):
-            logger.info(f"Extracting to {tgt_field} from {src_field}")
-            extracted_data = input_df[src_field].apply(extract_function)
-
-            # Use DataFrame structure to determine if multiple fields are returned
-            if isinstance(extracted_data.iloc[0], pd.Series):
-                # If multiple fields, flatten them into the main DataFrame with prefixed names
-                new_columns = {f'{tgt_field}_{col}': extracted_data.apply(lambda x: x[col])
-                            for col in extracted_data.iloc[0].index}
-                self.df = pd.concat([
-                    self.df, pd.DataFrame(new_columns)], axis=1)
-                logger.info(f"Multiple fields extracted to prefixed '{tgt_field}' fields")
-            else:
-                # If a single field, use the target field name directly
-                self.df[tgt_field] = extracted_data
-                logger.info(f"Single field extracted to '{tgt_field}'")
-    
-    def process_result(self):
-        concat_dfs = []
-        # Iterate over the dictionary items
-        for names, df in self.evaluations.items():
-            # Ensure the DataFrame index is a default RangeIndex for proper alignment
-            df = df.reset_index(drop=True)
-            # Create a MultiIndex for the columns with the names as the top level
-            # and the original columns as the second level
-            df.columns = pd.MultiIndex.from_product(
-                [[names], df.columns])
-            # Append the modified DataFrame to the list
-            concat_dfs.append(df)
-        
-        # Concatenate all DataFrames along the columns
-        # This automatically handles different lengths and merges by index
-        composite_df = pd.concat(concat_dfs, axis=1)
+        Evaluates the input `data.chunk_rows` rows at a time, never splitting a session.
 
-    def evaluate(self):
-        self.evaluations = dict()
-        # Iterate over metrics to be evaluated
-        for scorer_name, (scorer, inputs) in zip(self.metric_configs, cfg_to_evaluator(self.metric_configs)):   
-            # use fields 
-            input_fields = [c for c in self.df.columns if c.lower().startswith(inputs)]
-            self.evaluations[scorer_name] = scorer(self.df[input_fields])
+        Extraction and every metric run per chunk; each metric result is folded into a
+        row-weighted running mean, so only one chunk and the aggregates are held in memory.
+
+        Returns:
+            Dict[str, Any]: The aggregated result of each metric.
+        """
+        scorers = list(cfg_to_evaluator(self.metric_configs))
+        aggregates = {scorer_name: MetricAggregate() for scorer_name in self.metric_configs}
+        chunks = iter_session_chunks(iter_table(self.config, self.chunk_rows))
+        for chunk in tqdm(chunks, desc=f"Evaluating in chunks of {self.chunk_rows} rows"):
+            self._process_input(chunk)
+            results = self._run_metrics(scorers)
+            for (scorer_name, result), (scorer, _) in zip(results.items(), scorers):
+                # scorers keeping their row-level evaluations know how many rows were actually scored
+                weight = len(getattr(scorer, 'evals', self.df))
+                aggregates[scorer_name].update(result, weight)
+            self.df = self.source_df = None
+        self.evaluations = {scorer_name: agg.value for scorer_name, agg in aggregates.items()}
+        return self.evaluations
         
     def __call__(self, input: Union[pd.DataFrame], *args: Any, **kwds: Any) -> Any:
         self._process_input(input)
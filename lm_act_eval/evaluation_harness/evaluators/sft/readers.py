@@ -0,0 +1,273 @@
+"""
+Readers for the trajectory tables consumed by the dataframe evaluators.
+
+Only the source columns referenced by the evaluation config are read:
+* the source field of every `data.extract_fs` entry
+* raw columns matched by the `metrics.*.inputs` (same case-insensitive prefix match as `evaluate`)
+* the group/idx columns of `evaluate_group_last`, the source fields of `metrics.*.produces`, and any
+  `data.read_columns` listed explicitly
+
+Parquet and Arrow/Feather files are read with column projection and memory-mapped (compressed
+Feather record batches are decompressed one at a time when streamed), anything else falls back to `pd.read_csv` with `usecols`. Every reader can also yield the
+table in row chunks (`data.chunk_rows`) for the streaming evaluation mode.
+"""
+from __future__ import annotations
+
+import logging
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+import pandas as pd
+from omegaconf import DictConfig
+
+logger = logging.getLogger(__name__)
+
+# columns the trajectory evaluators always need when they are present in the table
+SESSION_COLUMNS = ['session_id', 'idx_in_session']
+
+
+class TableReader:
+    """
+    Reads a table from disk, projecting onto `columns` when given.
+
+    Subclasses implement `schema` (the column names in the file), `read` and `iter_chunks`.
+    """
+    suffixes: List[str] = []
+
+    def schema(self, path: Path) -> List[str]:
+        raise NotImplementedError
+
+    def read(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def iter_chunks(
+        self, path: Path, chunk_rows: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        raise NotImplementedError
+
+
+_READERS: Dict[str, TableReader] = {}
+
+
+def register_reader(*suffixes: str) -> Callable:
+    """Registers a `TableReader` subclass for the given file suffixes (e.g. `.parquet`)."""
+    def decorator(cls):
+        cls.suffixes = list(suffixes)
+        for suffix in suffixes:
+            _READERS[suffix.lower()] = cls()
+        return cls
+    return decorator
+
+
+def _continue_range_index(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    # a RangeIndex isn't stored as a column, so every converted chunk restarts it
+    offset = 0
+    for chunk in chunks:
+        if isinstance(chunk.index, pd.RangeIndex):
+            chunk.index = chunk.index + offset
+        offset += len(chunk)
+        yield chunk
+
+
+@register_reader('.csv', '.tsv')
+class CSVReader(TableReader):
+    """CSV fallback. The first column is the index, as written by `DataFrame.to_csv`."""
+
+    def _sep(self, path: Path) -> str:
+        return '\t' if path.suffix.lower() == '.tsv' else ','
+
+    def schema(self, path: Path) -> List[str]:
+        return list(pd.read_csv(path, nrows=0, sep=self._sep(path)).columns)
+
+    def read(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        if columns is None:
+            return pd.read_csv(path, index_col=0, sep=self._sep(path))
+        return pd.read_csv(path, index_col=0, usecols=self._usecols(path, columns), sep=self._sep(path))
+
+    def iter_chunks(
+        self, path: Path, chunk_rows: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        usecols = self._usecols(path, columns) if columns is not None else None
+        with pd.read_csv(
+            path, index_col=0, usecols=usecols, sep=self._sep(path), chunksize=chunk_rows) as chunks:
+            yield from chunks
+
+    def _usecols(self, path: Path, columns: List[str]) -> List[str]:
+        index_col = self.schema(path)[0]
+        return [index_col] + [c for c in columns if c != index_col]
+
+
+@register_reader('.parquet', '.pq')
+class ParquetReader(TableReader):
+    def schema(self, path: Path) -> List[str]:
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+
+    def read(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+
+        # pandas metadata brings the stored index back along with the projected columns
+        table = pq.read_table(path, columns=columns, memory_map=True, use_pandas_metadata=True)
+        return table.to_pandas()
+
+    def iter_chunks(
+        self, path: Path, chunk_rows: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        batches = parquet_file.iter_batches(batch_size=chunk_rows, columns=columns, use_pandas_metadata=True)
+        yield from _continue_range_index(batch.to_pandas() for batch in batches)
+
+
+@register_reader('.feather', '.arrow', '.ipc')
+class FeatherReader(TableReader):
+    def schema(self, path: Path) -> List[str]:
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+
+    def read(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        import pyarrow.feather as feather
+
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    def iter_chunks(
+        self, path: Path, chunk_rows: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            options = None
+            if columns is not None:
+                names = pa.ipc.open_file(source).schema.names
+                options = pa.ipc.IpcReadOptions(included_fields=[names.index(column) for column in columns])
+            reader = pa.ipc.open_file(source, options=options)
+            yield from _continue_range_index(self._rechunk(reader, chunk_rows, columns))
+
+    @staticmethod
+    def _rechunk(reader, chunk_rows: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        # record batches are read one at a time, only the projected columns: uncompressed ones stay
+        # memory-mapped, compressed ones (LZ4 by default for Feather v2) are decompressed batch by batch
+        import pyarrow as pa
+
+        pending, pending_rows = [], 0
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= chunk_rows:
+                table = pa.Table.from_batches(pending, schema=reader.schema)
+                chunk, rest = table.slice(0, chunk_rows), table.slice(chunk_rows)
+                yield (chunk.select(columns) if columns is not None else chunk).to_pandas()
+                pending, pending_rows = rest.to_batches(), rest.num_rows
+        if pending_rows:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield (table.select(columns) if columns is not None else table).to_pandas()
+
+
+def get_reader(path: Path | str, format: Optional[str] = None) -> TableReader:
+    """
+    Returns the reader for `format` (a suffix such as `parquet`) or the file suffix, CSV if unknown.
+    """
+    suffix = f".{format.lstrip('.')}" if format else Path(path).suffix
+    reader = _READERS.get(suffix.lower())
+    if reader is None:
+        logger.info(f"No reader registered for '{suffix}', reading {path} as CSV")
+        reader = _READERS['.csv']
+    return reader
+
+
+def _metric_input_names(inputs) -> Iterable[str]:
+    # inputs are either plain names or single-key mappings such as `- actual_output: y_`
+    if inputs is None:
+        return
+    if isinstance(inputs, str):
+        yield inputs
+        return
+    for item in inputs:
+        if isinstance(item, (dict, DictConfig)):
+            yield from (v for v in item.values() if isinstance(v, str))
+        elif isinstance(item, str):
+            yield item
+
+
+def referenced_columns(config: DictConfig | Dict, available: List[str]) -> Optional[List[str]]:
+    """
+    Computes the source columns an evaluation config reads from the table.
+
+    Args:
+        config (DictConfig | Dict): The evaluation track config, with `data` and `metrics`.
+        available (List[str]): The columns present in the table.
+
+    Returns:
+        Optional[List[str]]: The referenced columns in table order, or None to read every column
+            (when `data.extract_fs` is not configured).
+    """
+    data_config = config.get('data') or {}
+    extract_fs = data_config.get('extract_fs')
+    if not extract_fs:
+        return None
+
+    required: Set[str] = set()
+    for function_query in extract_fs.values():
+        required.update(dict(function_query).keys())
+    required.update(data_config.get('read_columns') or [])
+    missing = sorted(required - set(available))
+    if missing:
+        warnings.warn(f"Columns {missing} referenced by the config are not in the table")
+
+    wanted = set(required) | set(SESSION_COLUMNS)
+    wanted.update(c for c in (data_config.get('columns') or {}).values() if isinstance(c, str))
+
+    for metric_config in (config.get('metrics') or {}).values():
+        if not isinstance(metric_config, (dict, DictConfig)):
+            continue
+        for name in _metric_input_names(metric_config.get('inputs')):
+            wanted.update(c for c in available if c.lower().startswith(name.lower()))
+        group_last = metric_config.get('evaluate_group_last')
+        if isinstance(group_last, (dict, DictConfig)):
+            wanted.update(v for v in group_last.values() if isinstance(v, str))
+        # the source fields of the derived columns (`produces`, see `scheduler.py`)
+        for spec in (metric_config.get('produces') or {}).values():
+            wanted.update(dict(spec).keys())
+    return [c for c in available if c in wanted]
+
+
+def _reader_and_columns(config: DictConfig | Dict):
+    data_config = config['data']
+    path = Path(data_config['path'])
+    reader = get_reader(path, data_config.get('format'))
+    columns = None
+    if data_config.get('project_columns', True):
+        columns = referenced_columns(config, reader.schema(path))
+    logger.info(
+        f"Reading {path} with {type(reader).__name__}"
+        + (f", columns: {columns}" if columns is not None else ""))
+    return reader, path, columns
+
+
+def read_table(config: DictConfig | Dict) -> pd.DataFrame:
+    """
+    Reads `config.data.path`, projected onto the columns referenced by the config.
+
+    `data.format` overrides the format inferred from the file suffix, `data.project_columns: false`
+    reads every column.
+
+    Args:
+        config (DictConfig | Dict): The evaluation track config.
+
+    Returns:
+        pd.DataFrame: The input table.
+    """
+    reader, path, columns = _reader_and_columns(config)
+    return reader.read(path, columns)
+
+
+def iter_table(config: DictConfig | Dict, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Same as `read_table`, but yields the table in chunks of at most `chunk_rows` rows.
+
+    Chunks are cut by row count only, see `streaming.iter_session_chunks` to keep sessions whole.
+    """
+    reader, path, columns = _reader_and_columns(config)
+    yield from reader.iter_chunks(path, chunk_rows, columns)
@@ -0,0 +1,226 @@
+"""
+Dependency-aware scheduling of the metrics of an evaluation track.
+
+Metrics declare the columns they read (`inputs`) and may declare derived columns they produce,
+with the `extract_fs` syntax, either in the config or as a `produces` attribute of the scorer:
+
+    metrics:
+      opentable_html:
+        inputs:
+          - HTML
+        produces:
+          HTML:
+            DOM: opentable_extract_reservation_details
+
+A derived column is computed once, however many metrics read it, and a metric starts as soon as
+the derived columns it reads are available. Its source is an extracted or derived column, else a
+column of the raw input (`source`). Independent metrics run concurrently, so the wall
+time of a track is set by its slowest chain rather than the sum of its metrics.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import pickle
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from graphlib import CycleError, TopologicalSorter
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+import pandas as pd
+from omegaconf import DictConfig
+
+logger = logging.getLogger(__name__)
+
+COLUMN, METRIC = "column", "metric"
+
+Node = Tuple[str, str]
+
+
+def _call_scorer(metric_name: str, scorer, scorer_input: pd.DataFrame) -> Any:
+    return scorer(scorer_input)
+
+
+def _input_names(inputs) -> Iterable[Tuple[str, bool]]:
+    # (name, is_prefix): plain names match columns by prefix, `{param: column}` items by exact name
+    if inputs is None or isinstance(inputs, str):
+        inputs = [inputs] if inputs else []
+    for item in inputs:
+        if isinstance(item, (dict, DictConfig)):
+            yield from ((column, False) for column in dict(item).values() if column is not None)
+        else:
+            yield str(item), True
+
+
+class MetricGraph:
+    def __init__(self, metrics: Dict[str, Tuple[Any, Any]], derived: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            metrics (Dict[str, Tuple[Any, Any]]): (scorer, inputs) by metric name.
+            derived (Dict[str, Dict[str, Any]], optional): The derived columns, `{column: {source field: function}}`.
+
+        Raises:
+            ValueError: If the derived columns depend on each other in a cycle.
+        """
+        self.metrics = metrics
+        self.derived = derived or {}
+        self.dependencies = self._dependencies()
+        try:
+            TopologicalSorter(self.dependencies).prepare()
+        except CycleError as e:
+            raise ValueError(f"Derived columns depend on each other in a cycle: {e.args[1]}") from None
+
+    @classmethod
+    def build(cls, metric_configs, scorers: Iterable[Tuple[Any, Any]]) -> "MetricGraph":
+        """
+        Builds the graph from the `metrics` config and the matching `cfg_to_evaluator` output.
+
+        Raises:
+            ValueError: If two metrics produce the same column differently.
+        """
+        metrics, derived = {}, {}
+        for metric_name, (scorer, inputs) in zip(metric_configs, scorers):
+            metrics[metric_name] = (scorer, inputs)
+            metric_config = metric_configs[metric_name]
+            produces = dict(getattr(scorer, 'produces', None) or {})
+            if isinstance(metric_config, (dict, DictConfig)):
+                produces.update(metric_config.get('produces') or {})
+            for column, spec in produces.items():
+                spec = dict(spec)
+                if column in derived and derived[column] != spec:
+                    raise ValueError(
+                        f"'{metric_name}' produces '{column}' as {spec}, already produced as {derived[column]}")
+                derived[column] = spec
+        return cls(metrics, derived)
+
+    def _derived_matching(self, name: str, is_prefix: bool) -> Set[str]:
+        if not is_prefix:
+            return {name} if name in self.derived else set()
+        return {c for c in self.derived if c.lower().startswith(name.lower())}
+
+    def _dependencies(self) -> Dict[Node, Set[Node]]:
+        dependencies = {}
+        for column, spec in self.derived.items():
+            sources = set().union(*[self._derived_matching(src, False) for src in spec]) - {column}
+            dependencies[(COLUMN, column)] = {(COLUMN, c) for c in sources}
+        for metric_name, (_, inputs) in self.metrics.items():
+            columns = set().union(*[self._derived_matching(*name) for name in _input_names(inputs)])
+            dependencies[(METRIC, metric_name)] = {(COLUMN, c) for c in columns}
+        return dependencies
+
+    def run(
+        self, df: pd.DataFrame,
+        prepare_input: Callable[[pd.DataFrame, Any], pd.DataFrame],
+        compute_column: Callable[[pd.DataFrame, Dict], pd.DataFrame],
+        executor: Executor,
+        score: Callable[[str, Any, pd.DataFrame], Any] = _call_scorer,
+        source: Optional[pd.DataFrame] = None,
+    ) -> Tuple[Dict[str, Any], pd.DataFrame]:
+        """
+        Runs every node on `executor` as soon as its dependencies are done.
+
+        Args:
+            df (pd.DataFrame): The extracted input.
+            prepare_input (Callable): (df, inputs) -> the scorer input, run in the calling thread.
+            compute_column (Callable): (df, {column: spec}) -> the derived column(s), e.g. `apply_extractors`.
+            executor (Executor): Runs the scorers and derived columns.
+            score (Callable, optional): (metric name, scorer, scorer input) -> the metric result,
+                run on `executor`. Defaults to calling the scorer.
+            source (pd.DataFrame, optional): The raw input `df` was extracted from (same index), read by
+                the derived columns whose source isn't in `df`.
+
+        Returns:
+            Tuple[Dict[str, Any], pd.DataFrame]: The result of each metric, in config order, and `df`
+                with the derived columns.
+        """
+        sorter = TopologicalSorter(self.dependencies)
+        sorter.prepare()
+        results, pending = {}, {}
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                pending[self._submit(node, df, source, prepare_input, compute_column, executor, score)] = node
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                df = self._complete(node, future.result(), df, results)
+                sorter.done(node)
+        return {name: results[name] for name in self.metrics}, df
+
+    async def arun(
+        self, df: pd.DataFrame,
+        prepare_input: Callable[[pd.DataFrame, Any], pd.DataFrame],
+        compute_column: Callable[[pd.DataFrame, Dict], pd.DataFrame],
+        ascore: Callable[[str, Any, pd.DataFrame], Any],
+        source: Optional[pd.DataFrame] = None,
+    ) -> Tuple[Dict[str, Any], pd.DataFrame]:
+        """
+        `run` on the event loop: derived columns are computed in worker threads and metrics are
+        awaited through `ascore(metric_name, scorer, scorer_input)`.
+        """
+        sorter = TopologicalSorter(self.dependencies)
+        sorter.prepare()
+        results, pending = {}, {}
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                kind, name = node
+                if kind == COLUMN:
+                    coroutine = asyncio.to_thread(
+                        compute_column, self._column_input(name, df, source), {name: self.derived[name]})
+                else:
+                    scorer, inputs = self.metrics[name]
+                    coroutine = ascore(name, scorer, prepare_input(df, inputs))
+                pending[asyncio.ensure_future(coroutine)] = node
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node = pending.pop(task)
+                df = self._complete(node, task.result(), df, results)
+                sorter.done(node)
+        return {name: results[name] for name in self.metrics}, df
+
+    def _column_input(self, column: str, df: pd.DataFrame, source: Optional[pd.DataFrame]) -> pd.DataFrame:
+        # the sources of a derived column missing from `df` are raw input columns
+        raw = [src for src in self.derived[column] if src not in df.columns]
+        if source is None or not raw:
+            return df
+        return pd.concat([df, source[[src for src in raw if src in source.columns]]], axis=1)
+
+    def _submit(self, node: Node, df, source, prepare_input, compute_column, executor: Executor, score):
+        kind, name = node
+        logger.info(f"Scheduling {kind} '{name}'")
+        if kind == COLUMN:
+            return executor.submit(
+                compute_column, self._column_input(name, df, source), {name: self.derived[name]})
+        scorer, inputs = self.metrics[name]
+        return executor.submit(score, name, scorer, prepare_input(df, inputs))
+
+    @staticmethod
+    def _complete(node: Node, value, df: pd.DataFrame, results: Dict[str, Any]) -> pd.DataFrame:
+        kind, name = node
+        if kind == COLUMN:
+            logger.info(f"Derived column(s) {list(value.columns)} computed")
+            return pd.concat([df, value], axis=1)
+        results[name] = value
+        return df
+
+
+def _picklable(*objects) -> bool:
+    try:
+        pickle.dumps(objects)
+        return True
+    except Exception:
+        return False
+
+
+def make_executor(config, graph: MetricGraph) -> Executor:
+    """
+    The executor configured by `scheduler: {executor: thread | process, max_workers: N}`.
+
+    Threads (the default) suit I/O-bound scorers; processes suit CPU-bound ones and are only
+    used when every scorer can be pickled.
+    """
+    scheduler_config = (config.get('scheduler') if config is not None else None) or {}
+    max_workers = scheduler_config.get('max_workers') or max(len(graph.dependencies), 1)
+    if scheduler_config.get('executor', 'thread') == 'process':
+        if _picklable(*[scorer for scorer, _ in graph.metrics.values()]):
+            return ProcessPoolExecutor(max_workers=max_workers)
+        logger.warning("Not every scorer can be pickled, running metrics on threads instead of processes")
+    return ThreadPoolExecutor(max_workers=max_workers)
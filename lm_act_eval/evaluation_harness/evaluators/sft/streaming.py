@@ -0,0 +1,106 @@
+"""
+Building blocks for the chunked (streaming) evaluation mode, enabled with `data.chunk_rows`.
+
+* `iter_session_chunks` re-cuts row chunks so that a session is never split across chunks
+* `MetricAggregate` folds per-chunk metric results into a running, row-weighted mean
+"""
+from __future__ import annotations
+
+import logging
+import math
+import warnings
+from numbers import Number
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def iter_session_chunks(
+    chunks: Iterable[pd.DataFrame], session_col: str = 'session_id') -> Iterator[pd.DataFrame]:
+    """
+    Re-cuts a stream of row chunks at session boundaries.
+
+    The rows of the last session of every chunk are held back and prepended to the next chunk, so
+    each yielded chunk holds complete sessions. Sessions are expected to be stored contiguously
+    (as exported, sorted by session); a session seen again after it was yielded is warned about.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): The row chunks, in table order.
+        session_col (str, optional): The session column. Chunks without it are yielded as is.
+
+    Yields:
+        pd.DataFrame: Chunks that never split a session. A chunk may exceed the requested size by
+            the rows of one session.
+    """
+    carry: Optional[pd.DataFrame] = None
+    done_sessions = set()
+    warned = False
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+            carry = None
+        if chunk.empty:
+            continue
+        if session_col not in chunk.columns:
+            yield chunk
+            continue
+
+        sessions = chunk[session_col].to_numpy()
+        if not warned and done_sessions and not done_sessions.isdisjoint(sessions):
+            warnings.warn(
+                f"'{session_col}' values are not contiguous in the input, "
+                "sort the table by session to keep sessions within a chunk")
+            warned = True
+        # start of the trailing run of the last session
+        others = np.flatnonzero(sessions != sessions[-1])
+        tail_start = others[-1] + 1 if len(others) else 0
+        carry = chunk.iloc[tail_start:]
+        if tail_start:
+            head = chunk.iloc[:tail_start]
+            done_sessions.update(head[session_col].unique())
+            yield head
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+class MetricAggregate:
+    """
+    Running mean of a metric over chunks, weighted by the number of rows each result covers.
+
+    Scalars fold into a scalar, `pd.Series` fold element-wise by index and `pd.DataFrame` fold
+    their numeric column means. NaN results carry no weight. Only the running sums are kept.
+    """
+
+    def __init__(self):
+        self._sum: Union[float, pd.Series, None] = None
+        self._weight: Union[float, pd.Series, None] = None
+        self.n_chunks = 0
+
+    def update(self, result, weight: int) -> None:
+        self.n_chunks += 1
+        if isinstance(result, pd.DataFrame):
+            weight = len(result)
+            result = result.select_dtypes('number').mean()
+        if isinstance(result, pd.Series):
+            result = pd.to_numeric(result, errors='coerce')
+            weights = result.notna().astype(float) * weight
+            values = result.fillna(0.0) * weight
+            self._sum = values if self._sum is None else self._sum.add(values, fill_value=0.0)
+            self._weight = weights if self._weight is None else self._weight.add(weights, fill_value=0.0)
+            return
+        if not isinstance(result, Number) or math.isnan(result):
+            logger.info(f"Skipping non-numeric metric result: {result!r}")
+            return
+        self._sum = (self._sum or 0.0) + float(result) * weight
+        self._weight = (self._weight or 0.0) + weight
+
+    @property
+    def value(self) -> Union[float, pd.Series, None]:
+        if self._sum is None:
+            return None
+        if isinstance(self._sum, pd.Series):
+            return self._sum / self._weight.replace(0.0, np.nan)
+        return self._sum / self._weight if self._weight else None
@@ -1,8 +1,8 @@
 from typing import *
 import pandas as pd
-import wandb
 
 from lm_act_eval.evaluation_harness.evaluators.registry import evaluator_registry
+from lm_act_eval.evaluation_harness.evaluators.trajectory_index import trajectory_index
 
 import warnings
 
@@ -11,7 +11,7 @@ def extract_trajectory(
   session_cols: List[str]=['session_id', 'idx_in_session']
   ) -> List:
   """
-  Extracts a trajectory from a DataFrame.
+  Extracts a trajectory from a DataFrame, through its attached `TrajectoryIndex` when there is one.
 
   Args:
       traj_df (DataFrame): The DataFrame containing the trajectory data.
@@ -21,6 +21,9 @@ def extract_trajectory(
   Returns:
       List: The extracted trajectory as a list of target values, sorted by session and index within session.
   """
+  index = trajectory_index(traj_df)
+  if index is not None and list(index.keys) == list(session_cols) and index.aligned_with(traj_df):
+    return index.trajectories(traj_df, target_col)
   sorted_grouped_texts = (
     traj_df.sort_values(by=session_cols)
     .groupby('session_id')[target_col]
@@ -35,10 +38,12 @@ class AsyncTableTrajectoryEvaluator(AsyncDataFrameEvaluator):
         """
         Handles evaluation of all the metrics in the given evaluation track
         """
-        super().__init__(config)
+        super().__init__(config, *args, **kwargs)
         
     def log_artifacts(self):
         """Create and log a wandb db artifact or table object."""
+        import wandb
+
         log_config = self.config.data.logging
         if self.results is not None:
             table = wandb.Table(data=[list(self.results.values())], columns=list(self.results.keys()))
@@ -46,16 +51,20 @@ class AsyncTableTrajectoryEvaluator(AsyncDataFrameEvaluator):
         else:
             print("No results to log.")
             
+@evaluator_registry.register("sft.trajectory.table")
 class TableTrajectoryEvaluator(DataFrameEvaluator):
     def __init__(self, config, *args, **kwargs):
         """
         Handles evaluation of all the metrics in the given evaluation track
         """
-        super().__init__(config)
-        self._process_input(self.input_df)
+        super().__init__(config, *args, **kwargs)
+        if self.input_df is not None:
+            self._process_input(self.input_df)
         
     def log_artifacts(self):
         """Create and log a wandb db artifact or table object."""
+        import wandb
+
         log_config = self.config.data.logging
         if self.results is not None:
             table = wandb.Table(data=[list(self.results.values())], columns=list(self.results.keys()))
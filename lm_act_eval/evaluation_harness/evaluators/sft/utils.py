@@ -1,19 +1,24 @@
-from sqlalchemy import desc
+from __future__ import annotations
+
 from tqdm import tqdm
 import warnings 
 
-from transformers import pipeline, PreTrainedTokenizerBase
-
-from torch.utils.data import DataLoader
-from datasets import Dataset
 import pandas as pd
-import torch
 
 from omegaconf import OmegaConf
-from torch.utils.data.dataloader import default_collate
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase
+
+# torch / transformers / datasets are imported inside the generation helpers below,
+# `cfg_to_function` & `cfg_to_evaluator` are on the startup path of every evaluation run
 
 
 def custom_collate(batch):
+    from torch.utils.data.dataloader import default_collate
+
     batch = [item for item in batch if item is not None]  # Filter out None values
     return default_collate(batch)
 
@@ -32,6 +37,8 @@ def text_from_prompt_and_action(
 
 
 def generate_completions(tokenizer, model, prompts: list[str]) -> list[str]:
+    from transformers import pipeline
+
     pipe = pipeline(
         "text-generation",
         model=model,
@@ -75,6 +82,10 @@ def generate_text_and_merge(
     Returns:
         pandas.DataFrame: The original DataFrame with an additional column containing the generated text.
     """
+    import torch
+    from torch.utils.data import DataLoader
+    from datasets import Dataset
+
     df = df.copy().dropna(subset=[input_text_column])
     if len(df) != len(df):
         warnings.warn(f"{len(df) - len(df)} rows dropped due to NaN in {input_text_column}.")
@@ -113,41 +124,67 @@ def generate_text_and_merge(
     return df
 
 
-from lm_act_eval.evaluation_harness.helper_functions.utils import function_registry
+from lm_act_eval.evaluation_harness.helper_functions.registry import function_registry
 from lm_act_eval.evaluation_harness.evaluators.registry import evaluator_registry
 from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
 
 from typing import *
 from .base import BaseEvaluator
-def cfg_to_function(
-    funct_pairs: OmegaConf | Dict[str, Dict[str, str]]) -> Generator[Tuple[Tuple[str, str], str], None, None]:
+def identity(x):
+    return x
+
+
+def resolve_extractors(
+    funct_pairs: OmegaConf | Dict[str, Dict[str, str]]) -> List[Tuple[Tuple[str, str], Callable, Optional[Callable]]]:
     """
-    A function that processes a function query along with a function pair and returns a tuple containing a source field, target field, and function name.
+    Resolves the `extract_fs` config into extract functions along with their vectorized implementation.
 
     Parameters:
-        function_query (Dict): A dictionary containing the function query.
-        funct_pair (List[Dict]): A list of dictionaries containing function pairs.
+        funct_pairs (Dict): Maps each target field to a single `{source field: function name}` pair,
+            `function name` being a `function_registry` name, "name.method" for a method of a
+            registered class, or None for the identity.
 
     Returns:
-        Tuple[Tuple[str, str], str]: A tuple containing a tuple with source field and target field, and a string representing the function name.
+        List[Tuple[Tuple[str, str], Callable, Optional[Callable]]]: ((source field, target field), row-wise
+            function, batch function taking the whole source column or None) for each target field.
     """
+    extractors = []
     for tgt_field, function_query in funct_pairs.items():
         src_field, func_name = dict(function_query).popitem()
-        # Immediately yield an identity function for None func_name and skip further processing
         if func_name is None:
-            yield (src_field, tgt_field), lambda x: x
-            continue  # Skip to the next iteration
+            extractors.append(((src_field, tgt_field), identity, identity))
+            continue
         # Determine if a class method is specified and split accordingly
         _function_is_cls = '.' in func_name
         if _function_is_cls:
-            func_name, cls_func = func_name.split(".")
+            cls_name, cls_func = func_name.split(".")
+            # the batch implementation is bound to the same instance as the row-wise method
+            instance = function_registry.get(cls_name)()
+            function = getattr(instance, cls_func)
+            batch_function = function_registry.get_batch(func_name)
+            if batch_function is not None:
+                batch_function = batch_function.__get__(instance)
+        else:
+            function = function_registry.get(func_name)
+            batch_function = function_registry.get_batch(func_name)
+        extractors.append(((src_field, tgt_field), function, batch_function))
+    return extractors
 
-        # Retrieve function or class method
-        function = function_registry.get(func_name)
-        if _function_is_cls:
-            function = getattr(function(), cls_func)
 
-        yield (src_field, tgt_field), function
+def cfg_to_function(
+    funct_pairs: OmegaConf | Dict[str, Dict[str, str]]) -> Generator[Tuple[Tuple[str, str], str], None, None]:
+    """
+    A function that processes a function query along with a function pair and returns a tuple containing a source field, target field, and function name.
+
+    Parameters:
+        function_query (Dict): A dictionary containing the function query.
+        funct_pair (List[Dict]): A list of dictionaries containing function pairs.
+
+    Returns:
+        Tuple[Tuple[str, str], str]: A tuple containing a tuple with source field and target field, and a string representing the function name.
+    """
+    for fields, function, _ in resolve_extractors(funct_pairs):
+        yield fields, function
 
     
 def cfg_to_evaluator(eval_pairs: OmegaConf | Dict[str, Dict[str, str]]) -> Generator[Tuple[BaseEvaluator, list[str]], None, None]:
@@ -0,0 +1,172 @@
+"""
+Session (trajectory) index of an evaluation table, built once per evaluation.
+
+A `TrajectoryIndex` is one stable sort of the rows by (`session_id`, `idx_in_session`) plus the
+offset of every session in that order, giving O(1) access to a session's rows, its first and
+last step and its step count. Evaluators attach it to the frame passed to every scorer (see
+`attach_trajectory_index`), so session-aware metrics don't regroup the table:
+
+    index = trajectory_index(df)
+    if index is not None and index.aligned_with(df):
+        last_steps = index.last_steps(df)
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TRAJECTORY_INDEX_ATTR = 'trajectory_index'
+
+
+class TrajectoryIndex:
+    def __init__(self, df: pd.DataFrame, session_col: str = 'session_id', step_col: Optional[str] = 'idx_in_session'):
+        """
+        Args:
+            df (pd.DataFrame): The table, one row per step.
+            session_col (str): The session column, rows without a session are left out.
+            step_col (str, optional): The step order within a session; without it (or if missing)
+                steps keep their row order.
+        """
+        self.session_col = session_col
+        self.step_col = step_col if step_col in df.columns else None
+        self.index = df.index
+        codes, sessions = pd.factorize(df[session_col], sort=True)
+        # stable sorts: ties keep their row order
+        order = self._sort(codes, df[self.step_col].to_numpy() if self.step_col is not None else None)
+        self.order = order[codes[order] >= 0]
+        sorted_codes = codes[self.order]
+        starts = np.flatnonzero(np.diff(sorted_codes)) + 1
+        self.offsets = np.concatenate([[0], starts, [len(self.order)]]).astype(np.intp)
+        self.sessions = pd.Index(sessions[sorted_codes[self.offsets[:-1]]] if len(self.order) else sessions[:0])
+
+    @staticmethod
+    def _sort(codes: np.ndarray, steps: Optional[np.ndarray]) -> np.ndarray:
+        if steps is None:
+            return np.argsort(codes, kind='stable')
+        if steps.dtype.kind in 'iu' and len(steps):
+            # a single integer key sorts much faster than `lexsort`
+            low, span = int(steps.min()), int(steps.max()) - int(steps.min()) + 1
+            if (len(codes) + 1) * span < np.iinfo(np.int64).max:
+                return np.argsort((codes.astype(np.int64) + 1) * span + (steps - low), kind='stable')
+        return np.lexsort([steps, codes])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, session_col: str = 'session_id',
+                   step_col: Optional[str] = 'idx_in_session') -> Optional["TrajectoryIndex"]:
+        """The index of `df`, None if it has no session column."""
+        if df is None or session_col not in df.columns:
+            return None
+        return cls(df, session_col, step_col)
+
+    def restrict(self, df: pd.DataFrame) -> "TrajectoryIndex":
+        """
+        The index of `df`, a subset of the indexed rows (matched by label, e.g. filtered rows),
+        without regrouping. Sessions left without rows are dropped.
+        """
+        positions = self.index.get_indexer(df.index)
+        if (positions < 0).any():
+            raise KeyError("`df` holds rows missing from the index")
+        # indexed position -> position in `df`, -1 for the dropped rows
+        new_positions = np.full(len(self.index), -1, dtype=np.intp)
+        new_positions[positions] = np.arange(len(positions))
+        mapped = new_positions[self.order]
+        kept = mapped >= 0
+        counts = np.bincount(
+            np.repeat(np.arange(len(self.sessions)), np.diff(self.offsets))[kept], minlength=len(self.sessions))
+        restricted = object.__new__(type(self))
+        restricted.session_col, restricted.step_col = self.session_col, self.step_col
+        restricted.index = df.index
+        restricted.order = mapped[kept]
+        restricted.offsets = np.concatenate([[0], np.cumsum(counts[counts > 0])]).astype(np.intp)
+        restricted.sessions = self.sessions[counts > 0]
+        return restricted
+
+    def __deepcopy__(self, memo):
+        # immutable, shared by every frame pandas derives from the indexed one (`attrs` are deep-copied)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, session: Hashable) -> bool:
+        return session in self.sessions
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self)} sessions, {len(self.order)} steps)"
+
+    @property
+    def keys(self) -> tuple:
+        return self.session_col, self.step_col
+
+    def aligned_with(self, df: pd.DataFrame) -> bool:
+        """Whether `df` holds the indexed rows, in the indexed order (columns may differ)."""
+        return df.index is self.index or (len(df.index) == len(self.index) and df.index.equals(self.index))
+
+    def _bounds(self, session: Hashable) -> tuple:
+        i = self.sessions.get_loc(session)
+        return self.offsets[i], self.offsets[i + 1]
+
+    def positions(self, session: Hashable) -> np.ndarray:
+        """Row positions of a session's steps, in step order."""
+        start, stop = self._bounds(session)
+        return self.order[start:stop]
+
+    def step_count(self, session: Hashable) -> int:
+        start, stop = self._bounds(session)
+        return int(stop - start)
+
+    def first(self, session: Hashable) -> Hashable:
+        """Index label of a session's first step."""
+        return self.index[self.order[self._bounds(session)[0]]]
+
+    def last(self, session: Hashable) -> Hashable:
+        """Index label of a session's last step."""
+        return self.index[self.order[self._bounds(session)[1] - 1]]
+
+    def session(self, df: pd.DataFrame, session: Hashable) -> pd.DataFrame:
+        """A session's rows of the (aligned) `df`, in step order."""
+        return df.iloc[self.positions(session)]
+
+    @property
+    def step_counts(self) -> pd.Series:
+        return pd.Series(np.diff(self.offsets), index=self.sessions.rename(self.session_col), name='steps')
+
+    @property
+    def first_positions(self) -> np.ndarray:
+        return self.order[self.offsets[:-1]]
+
+    @property
+    def last_positions(self) -> np.ndarray:
+        return self.order[self.offsets[1:] - 1]
+
+    def first_steps(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The first step of every session, in session order."""
+        return df.iloc[self.first_positions]
+
+    def last_steps(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The last step of every session, in session order."""
+        return df.iloc[self.last_positions]
+
+    def trajectories(self, df: pd.DataFrame, column: str) -> pd.Series:
+        """The values of `column` as one step-ordered list per session."""
+        values = df[column].to_numpy()[self.order]
+        trajectories: List[Any] = [
+            values[start:stop].tolist() for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+        return pd.Series(trajectories, index=self.sessions.rename(self.session_col), name=column)
+
+
+def attach_trajectory_index(df: pd.DataFrame, index: Optional[TrajectoryIndex]) -> pd.DataFrame:
+    """Attaches `index` to `df` (in place, through `DataFrame.attrs`) and returns `df`."""
+    if index is not None:
+        df.attrs[TRAJECTORY_INDEX_ATTR] = index
+    return df
+
+
+def trajectory_index(df: pd.DataFrame) -> Optional[TrajectoryIndex]:
+    """The index attached to `df`, if any."""
+    return df.attrs.get(TRAJECTORY_INDEX_ATTR)
@@ -23,7 +23,7 @@ from llms import (
     generate_from_openai_completion,
     lm_config,
 )
-from llms.tokenizers import Tokenizer
+from llms.tokenizers import cached_tokenizer
 
 
 class Agent:
@@ -165,7 +165,8 @@ class PromptAgent(Agent):
         lm_config = self.lm_config
         n = 0
         while True:
-            response = call_llm(lm_config, prompt)
+            # a retry must sample a new response, not replay the cached one
+            response = call_llm(lm_config, prompt, cache=False)
             force_prefix = self.prompt_constructor.instruction[
                 "meta_data"
             ].get("force_prefix", "")
@@ -210,7 +211,7 @@ def construct_agent(args: argparse.Namespace, captioning_fn=None) -> Agent:
     elif args.agent_type == "prompt":
         with open(args.instruction_path) as f:
             constructor_type = json.load(f)["meta_data"]["prompt_constructor"]
-        tokenizer = Tokenizer(args.provider, args.model)
+        tokenizer = cached_tokenizer(args.provider, args.model)
         prompt_constructor = eval(constructor_type)(
             args.instruction_path, lm_config=llm_config, tokenizer=tokenizer
         )
@@ -1,3 +1,4 @@
+import functools
 import json
 import re
 from pathlib import Path
@@ -11,10 +12,21 @@ from llms import lm_config
 from llms.tokenizers import Tokenizer
 from llms.utils import APIInput
 
+# Llama-2 chat format
+B_INST, E_INST = "[INST]", "[/INST]"
+B_SYS, E_SYS = "<<SYS>>\n", "\n<</SYS>>\n\n"
+BOS, EOS = "<s>", "</s>"
+
 URL_MAPPINGS = {}
 for name, site_config in browse_config.params.sites.items():
     URL_MAPPINGS.update({name: site_config.url})
 
+@functools.lru_cache(maxsize=64)
+def example_b64(path: str) -> str:
+    """The base64 data URL of a few-shot example screenshot, shared by every agent"""
+    return pil_to_b64(Image.open(path))
+
+
 class Instruction(TypedDict):
     """Instruction for constructing prompt"""
 
@@ -38,12 +50,14 @@ class PromptConstructor(object):
         instruction["examples"] = [tuple(e) for e in instruction["examples"]]
         self.instruction: Instruction = instruction
         self.tokenizer = tokenizer
+        # the intro and few-shot examples of every prompt, compiled once
+        self._prefix = self.compile_prefix(instruction["intro"], instruction["examples"])
+        self.prefix_tokens = self.count_prefix_tokens(self._prefix)
 
-    def get_lm_api_input(
-        self, intro: str, examples: list[tuple[str, str]], current: str
+    def compile_prefix(
+        self, intro: str, examples: list[tuple[str, str]]
     ) -> APIInput:
-
-        """Return the require format for an API"""
+        """Return the static head of the prompt: the intro and the few-shot examples"""
         message: list[dict[str, str]] | str
         if "openai" in self.lm_config.provider:
             if self.lm_config.mode == "chat":
@@ -63,9 +77,6 @@ class PromptConstructor(object):
                             "content": y,
                         }
                     )
-                message.append(
-                    {"role": "user", "content": current}
-                )
                 return message
             elif self.lm_config.mode == "completion":
                 message = f"{intro}\n\n"
@@ -74,8 +85,6 @@ class PromptConstructor(object):
                     message += f"Observation\n:{example[0]}\n\n"
                     message += f"Action: {example[1]}\n\n"
                 message += "Now make prediction given the observation\n\n"
-                message += f"Observation\n:{current}\n\n"
-                message += "Action:"
                 return message
             else:
                 raise ValueError(
@@ -86,9 +95,6 @@ class PromptConstructor(object):
             # https://github.com/facebookresearch/llama/blob/main/llama/generation.py#L320
             if "Llama-2" in self.lm_config.model:
                 if self.lm_config.mode == "chat":
-                    B_INST, E_INST = "[INST]", "[/INST]"
-                    B_SYS, E_SYS = "<<SYS>>\n", "\n<</SYS>>\n\n"
-                    BOS, EOS = "<s>", "</s>"
                     # adding the system message to be the starting of the first example
                     examples = [
                         (
@@ -102,9 +108,6 @@ class PromptConstructor(object):
                             for (x, y) in examples
                         ]
                     )
-                    # add the current observation
-                    message += f"{BOS}{B_INST} {current.strip()} {E_INST} {self.instruction['meta_data'].get('force_prefix', '')}"
-
                     return message
                 else:
                     raise ValueError("Only chat mode is supported for Llama-2")
@@ -117,6 +120,42 @@ class PromptConstructor(object):
                 f"Provider {self.lm_config.provider} not implemented"
             )
 
+    def prefix(self, intro: str, examples: list) -> APIInput:
+        """The compiled prefix, built once for the instruction's own intro and examples"""
+        if intro is self.instruction["intro"] and examples is self.instruction["examples"]:
+            return self._prefix
+        return self.compile_prefix(intro, examples)
+
+    def count_prefix_tokens(self, prefix: APIInput) -> int:
+        """Tokens of the text of `prefix` (images aside)"""
+        texts: list[str] = []
+        for part in [prefix] if isinstance(prefix, str) else prefix:
+            if isinstance(part, str):
+                texts.append(part)
+            elif isinstance(part, dict):
+                content = part["content"]
+                if isinstance(content, str):
+                    texts.append(content)
+                else:
+                    texts.extend(c["text"] for c in content if c["type"] == "text")
+        return sum(self.tokenizer.count_tokens(texts))
+
+    def get_lm_api_input(
+        self, intro: str, examples: list[tuple[str, str]], current: str
+    ) -> APIInput:
+
+        """Return the require format for an API"""
+        # the prefix first and untouched, so providers can cache it across steps
+        prefix = self.prefix(intro, examples)
+        if "openai" in self.lm_config.provider:
+            if self.lm_config.mode == "chat":
+                return prefix + [{"role": "user", "content": current}]
+            else:
+                return prefix + f"Observation\n:{current}\n\nAction:"
+        else:
+            # add the current observation
+            return prefix + f"{BOS}{B_INST} {current.strip()} {E_INST} {self.instruction['meta_data'].get('force_prefix', '')}"
+
     def construct(
         self,
         trajectory: Trajectory,
@@ -185,7 +224,7 @@ class DirectPromptConstructor(PromptConstructor):
                 print("NOTE: This is a Gemini model, so we use characters instead of tokens for max_obs_length.")
                 obs = obs[:max_obs_length]
             else:
-                obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+                obs = self.tokenizer.truncate(obs, max_obs_length)
 
         page = state_info["info"]["page"]
         url = page.url
@@ -247,7 +286,7 @@ class CoTPromptConstructor(PromptConstructor):
                 print("NOTE: This is a Gemini model, so we use characters instead of tokens for max_obs_length.")
                 obs = obs[:max_obs_length]
             else:
-                obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+                obs = self.tokenizer.truncate(obs, max_obs_length)
 
         page = state_info["info"]["page"]
         url = page.url
@@ -310,7 +349,7 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
                 print("NOTE: This is a Gemini model, so we use characters instead of tokens for max_obs_length.")
                 obs = obs[:max_obs_length]
             else:
-                obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+                obs = self.tokenizer.truncate(obs, max_obs_length)
 
         page = state_info["info"]["page"]
         url = page.url
@@ -329,16 +368,11 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
         )
         return prompt
 
-    def get_lm_api_input(
-        self,
-        intro: str,
-        examples: list[tuple[str, str, str]],
-        current: str,
-        page_screenshot_img: Image.Image,
-        images: list[Image.Image],
+    def compile_prefix(
+        self, intro: str, examples: list[tuple[str, str, str]]
     ) -> APIInput:
-        """Return the require format for an API"""
-        message: list[dict[str, str]] | str | list[str | Image.Image]
+        """Return the static head of the prompt, the example screenshots encoded once"""
+        message: list[dict[str, str]] | list[str | Image.Image]
         if "openai" in self.lm_config.provider:
             if self.lm_config.mode == "chat":
                 message = [
@@ -348,7 +382,6 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
                     }
                 ]
                 for (x, y, z) in examples:
-                    example_img = Image.open(z)
                     message.append(
                         {
                             "role": "system",
@@ -362,7 +395,7 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
                                 {
                                     "type": "image_url",
                                     "image_url": {
-                                        "url": pil_to_b64(example_img)
+                                        "url": example_b64(z)
                                     },
                                 },
                             ],
@@ -375,35 +408,6 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
                             "content": [{"type": "text", "text": y}],
                         }
                     )
-
-                # Encode images and page_screenshot_img as base64 strings.
-                current_prompt = current
-                content = [
-                    {
-                        "type": "text",
-                        "text": "IMAGES: (1) current page screenshot",
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": pil_to_b64(page_screenshot_img)},
-                    },
-                ]
-                for image_i, image in enumerate(images):
-                    content.extend(
-                        [
-                            {
-                                "type": "text",
-                                "text": f"({image_i+2}) input image {image_i+1}",
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": pil_to_b64(image)},
-                            },
-                        ]
-                    )
-                content = [{"type": "text", "text": current_prompt}] + content
-
-                message.append({"role": "user", "content": content})
                 return message
             else:
                 raise ValueError(
@@ -427,22 +431,6 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
                     )
                     message.append(f"Action: {y}")
                 message.append("Now make prediction given the observation")
-                message.append(f"Observation\n:{current}\n")
-                message.extend(
-                    [
-                        "IMAGES:",
-                        "(1) current page screenshot:",
-                        pil_to_vertex(page_screenshot_img),
-                    ]
-                )
-                for image_i, image in enumerate(images):
-                    message.extend(
-                        [
-                            f"({image_i+2}) input image {image_i+1}",
-                            pil_to_vertex(image),
-                        ]
-                    )
-                message.append("Action:")
                 return message
             else:
                 raise ValueError(
@@ -452,3 +440,61 @@ class MultimodalCoTPromptConstructor(CoTPromptConstructor):
             raise NotImplementedError(
                 f"Provider {self.lm_config.provider} not implemented"
             )
+
+    def get_lm_api_input(
+        self,
+        intro: str,
+        examples: list[tuple[str, str, str]],
+        current: str,
+        page_screenshot_img: Image.Image,
+        images: list[Image.Image],
+    ) -> APIInput:
+        """Return the require format for an API"""
+        # the prefix first and untouched, so providers can cache it across steps
+        prefix = self.prefix(intro, examples)
+        if "openai" in self.lm_config.provider:
+            # Encode images and page_screenshot_img as base64 strings.
+            current_prompt = current
+            content = [
+                {
+                    "type": "text",
+                    "text": "IMAGES: (1) current page screenshot",
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": pil_to_b64(page_screenshot_img)},
+                },
+            ]
+            for image_i, image in enumerate(images):
+                content.extend(
+                    [
+                        {
+                            "type": "text",
+                            "text": f"({image_i+2}) input image {image_i+1}",
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": pil_to_b64(image)},
+                        },
+                    ]
+                )
+            content = [{"type": "text", "text": current_prompt}] + content
+            return prefix + [{"role": "user", "content": content}]
+        else:
+            message = [f"Observation\n:{current}\n"]
+            message.extend(
+                [
+                    "IMAGES:",
+                    "(1) current page screenshot:",
+                    pil_to_vertex(page_screenshot_img),
+                ]
+            )
+            for image_i, image in enumerate(images):
+                message.extend(
+                    [
+                        f"({image_i+2}) input image {image_i+1}",
+                        pil_to_vertex(image),
+                    ]
+                )
+            message.append("Action:")
+            return prefix + message
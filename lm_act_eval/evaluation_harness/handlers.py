@@ -1,23 +1,26 @@
 from omegaconf import DictConfig
 from lm_act_eval.evaluation_harness.evaluators import evaluator_registry, metric_registry
 
-def handle_sft(eval_config: DictConfig) -> None:
+def handle_sft(eval_config: DictConfig, resume: bool = False) -> None:
    for eval_track, track_conf in eval_config.items():
         match eval_track:
             case "trajectory":
-                handle_sft_trajectory(track_conf)
+                handle_sft_trajectory(track_conf, resume=resume)
             case _:
                 raise ValueError(
                   f"Unsupported evaluation track: {eval_track}")
 
 
 
-def handle_sft_trajectory(eval_detail: DictConfig) -> None:
+def handle_sft_trajectory(eval_detail: DictConfig, resume: bool = False) -> None:
     """
     Handles the SFT trajectory by creating a trajectory evaluator and evaluating it.
 
     Args:
         detail (DictConfig): The detail configuration for the trajectory.
+        resume (bool): Continue the last checkpointed run of this track instead of starting a new one.
     """
-    traj_evaluator = evaluator_registry.get('sft.trajectory')(eval_detail)
+    # `data.chunk_rows` streams the input through the synchronous table evaluator
+    evaluator_name = 'sft.trajectory.table' if eval_detail.data.get('chunk_rows') else 'sft.trajectory'
+    traj_evaluator = evaluator_registry.get(evaluator_name)(eval_detail, resume=resume)
     traj_evaluator.evaluate()
\ No newline at end of file
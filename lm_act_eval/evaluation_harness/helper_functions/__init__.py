@@ -1,35 +1,36 @@
-from .base import PseudoPage
+import importlib
 
-from .gitlab import gitlab_get_project_memeber_role
+from .registry import FunctionRegistry, function_registry
 
-from .llm import llm_fuzzy_match, llm_ua_match
-
-from .utils import get_query_text, get_query_text_lowercase
-
-from .reddit import (
-  reddit_get_latest_comment_content_by_username,
-  reddit_get_latest_comment_obj_by_username,
-  reddit_get_parent_comment_username_of_latest_comment_by_username,
-  reddit_get_post_comment_tree,
-  reddit_get_post_url
-)
-from .shopping import (
-  shopping_get_latest_order_url, shopping_get_num_reviews,
-  shopping_get_order_product_name_list, shopping_get_order_product_option,
-  shopping_get_order_product_quantity, shopping_get_product_attributes,
-  shopping_get_product_price, shopping_get_rating_as_percentage,
-  shopping_get_sku_latest_review_author, shopping_get_sku_latest_review_rating,
-  shopping_get_sku_latest_review_text
-)
-from .opentable import (
-  opentable_extract_reservation_details
-)
+# submodules are imported on first attribute access, most of them pull in playwright or an LLM client
+_LAZY_ATTRS = {
+  "PseudoPage": ".base",
+  "gitlab_get_project_memeber_role": ".gitlab",
+  "llm_fuzzy_match": ".llm", "llm_ua_match": ".llm",
+  "allm_fuzzy_match": ".llm", "allm_ua_match": ".llm",
+  "llm_fuzzy_match_batch": ".llm", "llm_ua_match_batch": ".llm",
+  "get_query_text": ".utils", "get_query_text_lowercase": ".utils",
+  "reddit_get_latest_comment_content_by_username": ".reddit",
+  "reddit_get_latest_comment_obj_by_username": ".reddit",
+  "reddit_get_parent_comment_username_of_latest_comment_by_username": ".reddit",
+  "reddit_get_post_comment_tree": ".reddit",
+  "reddit_get_post_url": ".reddit",
+  "shopping_get_latest_order_url": ".shopping", "shopping_get_num_reviews": ".shopping",
+  "shopping_get_order_product_name_list": ".shopping", "shopping_get_order_product_option": ".shopping",
+  "shopping_get_order_product_quantity": ".shopping", "shopping_get_product_attributes": ".shopping",
+  "shopping_get_product_price": ".shopping", "shopping_get_rating_as_percentage": ".shopping",
+  "shopping_get_sku_latest_review_author": ".shopping", "shopping_get_sku_latest_review_rating": ".shopping",
+  "shopping_get_sku_latest_review_text": ".shopping",
+  "opentable_extract_reservation_details": ".opentable",
+}
 
 __all__ = [
   "PseudoPage",
   "get_query_text",
   "get_query_text_lowercase",
   "gitlab_get_project_memeber_role", "llm_fuzzy_match", "llm_ua_match",
+  "allm_fuzzy_match", "allm_ua_match",
+  "llm_fuzzy_match_batch", "llm_ua_match_batch",
   "reddit_get_latest_comment_content_by_username",
   "reddit_get_latest_comment_obj_by_username",
   "reddit_get_parent_comment_username_of_latest_comment_by_username",
@@ -45,6 +46,13 @@ __all__ = [
   "opentable_extract_reservation_details"
 ]
 
-from .utils import FunctionRegistry
 
-from .multion import *
\ No newline at end of file
+def __getattr__(name):
+  if name.startswith("__"):
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+  # everything else used to be star-imported from `.multion`
+  module = importlib.import_module(_LAZY_ATTRS.get(name, ".multion"), __name__)
+  try:
+    return getattr(module, name)
+  except AttributeError:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
@@ -0,0 +1,325 @@
+"""
+Backends of the LLM judge of `llm_fuzzy_match` / `llm_ua_match`.
+
+`judge_backend()` is the process-wide judge, selected by the top-level `judge` block:
+
+* `backend: openai` (default) asks `gpt-4-1106-preview` (or `model`), one request per judgment;
+* `backend: local` runs a Hugging Face causal LM on CPU: concurrent judgments (e.g. `allm_fuzzy_match`
+  under a `ConcurrencyLimiter`, or `llm_fuzzy_match_batch`) are grouped into padding-aware batches
+  by a `DynamicBatcher`, with no network round trip nor rate limit.
+
+    judge:
+      backend: local
+      model: Qwen/Qwen2.5-1.5B-Instruct
+      batch_size: 16
+
+Both return the judge's text, cached like every LLM response (see `utils/llm_cache.py`).
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from lm_act_eval.evaluation_harness.utils.llm_cache import acached_completion, cached_completion, request_key
+from lm_act_eval.evaluation_harness.utils.telemetry import note_tokens, track_call
+
+logger = logging.getLogger(__name__)
+
+JUDGE_GEN_KWARGS = dict(
+    model="gpt-4-1106-preview",
+    temperature=0,
+    max_tokens=768,
+    top_p=1.0,
+    context_length=0,
+)
+# the generation params of a judgment, as sent (and as cached, see `utils/llm_cache.py`)
+JUDGE_PARAMS = {k: v for k, v in JUDGE_GEN_KWARGS.items() if k not in ("model", "context_length")}
+
+DEFAULT_LOCAL_JUDGE_MODEL = "Qwen/Qwen2.5-1.5B-Instruct"
+# the judgments are a word or two ('correct', 'partially correct', 'same', 'different'), but small
+# models often lead with a sentence ("The student's answer is ..."); the first label found is scored
+DEFAULT_LOCAL_MAX_NEW_TOKENS = 32
+DEFAULT_BATCH_SIZE = 16
+# prompts x longest prompt of a batch, padding included
+DEFAULT_MAX_BATCH_TOKENS = 16384
+# seconds a judgment waits for others to batch with
+DEFAULT_MAX_WAIT = 0.01
+
+
+class JudgeBackend:
+    provider = ""
+
+    def __init__(self, model: str, params: Dict[str, Any]):
+        self.model = model
+        self.params = params
+
+    def judge(self, messages: List[Dict[str, Any]]) -> str:
+        """The judge's answer to chat `messages`."""
+        raise NotImplementedError
+
+    async def ajudge(self, messages: List[Dict[str, Any]]) -> str:
+        """Async `judge`."""
+        return await asyncio.to_thread(self.judge, messages)
+
+    def judge_many(self, messages_list: Sequence[List[Dict[str, Any]]]) -> List[str]:
+        """`judge` of many conversations, in order. Safe to call from a running event loop."""
+        async def judge_all():
+            return await asyncio.gather(*[self.ajudge(messages) for messages in messages_list])
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(judge_all())
+        # `asyncio.run` can't nest: the judgments get their own loop, on a worker thread
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, judge_all()).result()
+
+
+class OpenAIJudge(JudgeBackend):
+    provider = "openai"
+
+    def __init__(self, model: str = JUDGE_GEN_KWARGS["model"]):
+        super().__init__(model, JUDGE_PARAMS)
+        self.gen_kwargs = {**JUDGE_GEN_KWARGS, "model": model}
+
+    @classmethod
+    def from_config(cls, config=None) -> "OpenAIJudge":
+        return cls(model=dict(config or {}).get('model', JUDGE_GEN_KWARGS["model"]))
+
+    def judge(self, messages: List[Dict[str, Any]]) -> str:
+        # imported here, the local judge doesn't need the LLM provider clients
+        from .llms.providers.openai_utils import generate_from_openai_chat_completion
+
+        return cached_completion(
+            self.provider, self.model, messages, self.params,
+            lambda: generate_from_openai_chat_completion(messages=messages, **self.gen_kwargs))
+
+    async def ajudge(self, messages: List[Dict[str, Any]]) -> str:
+        from .llms.providers.openai_utils import agenerate_one_from_openai_chat_completion
+
+        return await acached_completion(
+            self.provider, self.model, messages, self.params,
+            lambda: agenerate_one_from_openai_chat_completion(messages=messages, **self.gen_kwargs))
+
+
+Item = Tuple[Sequence[int], concurrent.futures.Future]
+
+
+class DynamicBatcher:
+    def __init__(
+        self, generate: Callable[[List[Sequence[int]]], List[Tuple[str, int]]], batch_size: int = DEFAULT_BATCH_SIZE,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS, max_wait: float = DEFAULT_MAX_WAIT, name: str = "judge"):
+        """
+        Groups the token ids submitted from any thread or event loop into batches for `generate`,
+        run one after the other on a worker thread.
+
+        Args:
+            generate (Callable): Generates from a batch of token ids, returning (text, generated tokens) of each.
+            batch_size (int): Prompts per batch at most.
+            max_batch_tokens (int): Prompts x longest prompt of a batch at most (one prompt longer than that is a batch on its own).
+            max_wait (float): Seconds a prompt waits for others before its batch starts.
+            name (str): Of the worker thread.
+        """
+        self.generate = generate
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait
+        self.name = name
+        self._pending: List[Item] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, ids: Sequence[int]) -> concurrent.futures.Future:
+        """The future (text, generated tokens) of a prompt."""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._condition:
+            self._pending.append((ids, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future
+
+    def batches(self, items: List[Item]) -> Iterator[List[Item]]:
+        """`items` sorted by length, cut so a batch pads to at most `max_batch_tokens`."""
+        batch: List[Item] = []
+        for item in sorted(items, key=lambda item: len(item[0])):
+            # sorted: the item is the longest of the batch it joins
+            if batch and (len(batch) == self.batch_size or (len(batch) + 1) * len(item[0]) > self.max_batch_tokens):
+                yield batch
+                batch = []
+            batch.append(item)
+        if batch:
+            yield batch
+
+    def _take(self) -> List[Item]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # let concurrent prompts join, up to a full batch
+            until = time.monotonic() + self.max_wait
+            while len(self._pending) < self.batch_size and (left := until - time.monotonic()) > 0:
+                self._condition.wait(left)
+            items, self._pending = self._pending, []
+        return [(ids, future) for ids, future in items if future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            for batch in self.batches(self._take()):
+                try:
+                    outputs = self.generate([ids for ids, _ in batch])
+                except Exception as e:
+                    logger.warning(f"Batch of {len(batch)} {self.name} prompts failed: {e}")
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+
+
+_models: Dict[Tuple[str, str, Optional[str]], Tuple[Any, Any]] = {}
+_models_lock = threading.Lock()
+
+
+def load_local_model(model: str, device: str = "cpu", torch_dtype: Optional[str] = None) -> Tuple[Any, Any]:
+    """The process-wide (tokenizer, model) of a Hugging Face causal LM, loaded on first use."""
+    key = (model, device, torch_dtype)
+    with _models_lock:
+        if key not in _models:
+            # imported here, torch and transformers are only needed by the local judge
+            import torch  # type: ignore
+            from transformers import AutoModelForCausalLM, AutoTokenizer  # type: ignore
+
+            logger.info(f"Loading the local judge {model} on {device}")
+            tokenizer = AutoTokenizer.from_pretrained(model, use_fast=True)
+            if tokenizer.pad_token_id is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            lm = AutoModelForCausalLM.from_pretrained(
+                model, torch_dtype=getattr(torch, torch_dtype) if torch_dtype else None).to(device).eval()
+            _models[key] = (tokenizer, lm)
+        return _models[key]
+
+
+class LocalHFJudge(JudgeBackend):
+    provider = "local"
+
+    def __init__(
+        self, model: str = DEFAULT_LOCAL_JUDGE_MODEL, max_new_tokens: int = DEFAULT_LOCAL_MAX_NEW_TOKENS,
+        batch_size: int = DEFAULT_BATCH_SIZE, max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        max_wait: float = DEFAULT_MAX_WAIT, device: str = "cpu", torch_dtype: Optional[str] = None):
+        """
+        Args:
+            model (str): A Hugging Face causal LM, with a chat template.
+            max_new_tokens (int): Tokens of a judgment at most.
+            batch_size (int): Judgments generated at once at most.
+            max_batch_tokens (int): Prompts x longest prompt of a batch at most.
+            max_wait (float): Seconds a judgment waits for others to batch with.
+            device (str): The torch device, `cpu` unless there's a GPU to spare.
+            torch_dtype (str, optional): e.g. `bfloat16`, the model's default if unset.
+        """
+        super().__init__(model, {"max_new_tokens": max_new_tokens, "temperature": 0})
+        self.max_new_tokens = max_new_tokens
+        self.device = device
+        self.torch_dtype = torch_dtype
+        self.batcher = DynamicBatcher(self.generate, batch_size, max_batch_tokens, max_wait, name="local-judge")
+
+    @classmethod
+    def from_config(cls, config=None) -> "LocalHFJudge":
+        config = dict(config or {})
+        return cls(
+            model=config.get('model', DEFAULT_LOCAL_JUDGE_MODEL),
+            max_new_tokens=config.get('max_new_tokens', DEFAULT_LOCAL_MAX_NEW_TOKENS),
+            batch_size=config.get('batch_size', DEFAULT_BATCH_SIZE),
+            max_batch_tokens=config.get('max_batch_tokens', DEFAULT_MAX_BATCH_TOKENS),
+            max_wait=config.get('max_wait', DEFAULT_MAX_WAIT),
+            device=config.get('device', 'cpu'),
+            torch_dtype=config.get('torch_dtype'),
+        )
+
+    def _load(self) -> Tuple[Any, Any]:
+        return load_local_model(self.model, self.device, self.torch_dtype)
+
+    def encode(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """The token ids of the chat prompt of `messages`."""
+        tokenizer, _ = self._load()
+        return tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=True, return_dict=False)
+
+    def generate(self, batch: List[Sequence[int]]) -> List[Tuple[str, int]]:
+        """Greedy generation of a batch of prompts, left padded to the longest."""
+        import torch  # type: ignore
+
+        tokenizer, model = self._load()
+        width = max(map(len, batch))
+        input_ids = torch.tensor(
+            [[tokenizer.pad_token_id] * (width - len(ids)) + list(ids) for ids in batch], device=self.device)
+        attention_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in batch], device=self.device)
+        with torch.inference_mode():
+            outputs = model.generate(
+                input_ids=input_ids, attention_mask=attention_mask, max_new_tokens=self.max_new_tokens,
+                do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        generated = outputs[:, width:]
+        return [
+            (tokenizer.decode(ids, skip_special_tokens=True).strip(), int((ids != tokenizer.pad_token_id).sum()))
+            for ids in generated]
+
+    async def _agenerate(self, messages: List[Dict[str, Any]]) -> str:
+        with track_call(self.provider, self.model):
+            # loading the model and the chat template are CPU bound, off the event loop
+            ids = await asyncio.to_thread(self.encode, messages)
+            text, tokens_out = await asyncio.wrap_future(self.batcher.submit(ids))
+            note_tokens(len(ids), tokens_out)
+            return text
+
+    def judge(self, messages: List[Dict[str, Any]]) -> str:
+        def generate():
+            with track_call(self.provider, self.model):
+                ids = self.encode(messages)
+                text, tokens_out = self.batcher.submit(ids).result()
+                note_tokens(len(ids), tokens_out)
+                return text
+        return cached_completion(self.provider, self.model, messages, self.params, generate)
+
+    async def ajudge(self, messages: List[Dict[str, Any]]) -> str:
+        return await acached_completion(
+            self.provider, self.model, messages, self.params, lambda: self._agenerate(messages))
+
+    def judge_many(self, messages_list: Sequence[List[Dict[str, Any]]]) -> List[str]:
+        """
+        `judge` of many conversations, in order, without an event loop: the distinct ones are submitted
+        from `batch_size` threads at once and batched by the worker thread.
+        """
+        keys = [request_key(self.provider, self.model, messages, self.params) for messages in messages_list]
+        distinct = dict(zip(keys, messages_list))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.batcher.batch_size) as executor:
+            answers = dict(zip(distinct, executor.map(self.judge, distinct.values())))
+        return [answers[key] for key in keys]
+
+
+JUDGE_BACKENDS = {"openai": OpenAIJudge, "local": LocalHFJudge}
+
+_judge: Optional[JudgeBackend] = None
+_judge_config: Any = None
+_judge_lock = threading.Lock()
+
+
+def configure_judge(config=None) -> None:
+    """Sets the `judge` block of the judge created from now on."""
+    global _judge, _judge_config
+    with _judge_lock:
+        _judge_config, _judge = config, None
+
+
+def judge_backend() -> JudgeBackend:
+    """The process-wide judge of the `judge` block, created on first use."""
+    global _judge
+    with _judge_lock:
+        if _judge is None:
+            config = dict(_judge_config or {})
+            backend = config.pop('backend', 'openai')
+            if backend not in JUDGE_BACKENDS:
+                raise ValueError(f"Unknown judge backend {backend!r}, expected one of {sorted(JUDGE_BACKENDS)}")
+            _judge = JUDGE_BACKENDS[backend].from_config(config)
+        return _judge
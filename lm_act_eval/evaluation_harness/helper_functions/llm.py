@@ -1,16 +1,50 @@
-from typing import Any
+import logging
+import re
+from typing import Any, Callable, List, Optional, Sequence
 from beartype import beartype
 
-from .llms.providers.openai_utils import (
-    generate_from_openai_chat_completion,
-)
+from lm_act_eval.evaluation_harness.openai.batch import BatchRunner
 
-@beartype
-def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
-    """
-    Check whether the prediction matches the reference with GPT-4-turbo
-    """
-    messages: list[dict[str, Any]] = []
+from .judges import JUDGE_GEN_KWARGS, JUDGE_PARAMS, OpenAIJudge, judge_backend
+
+logger = logging.getLogger(__name__)
+
+# the score of every label a judgment may conclude with
+FUZZY_MATCH_LABELS = {"partially correct": 0.0, "incorrect": 0.0, "correct": 1.0}
+UA_MATCH_LABELS = {"different": 0.0, "same": 1.0}
+
+
+class UnparsableJudgment(ValueError):
+    """A judgment without any of the expected labels."""
+
+
+def _label_score(response: str, labels: dict[str, float]) -> float:
+    """The score of the first label in `response`, e.g. of a small local judge that rambles before concluding."""
+    # longest first, so 'partially correct' wins over 'correct' at the same position
+    alternatives = "|".join(map(re.escape, sorted(labels, key=len, reverse=True)))
+    match = re.search(rf"\b({alternatives})\b", response.lower())
+    if match is None:
+        raise UnparsableJudgment(f"None of {list(labels)} in the judgment {response!r}")
+    return labels[match.group(1)]
+
+
+def _score_or_zero(score: Callable[[str], float], response: str) -> float:
+    try:
+        return score(response)
+    except UnparsableJudgment as e:
+        logger.warning(f"{e}, graded 0")
+        return 0.0
+
+
+def _judge(messages: list[dict[str, Any]]) -> str:
+    return judge_backend().judge(messages)
+
+
+async def _ajudge(messages: list[dict[str, Any]]) -> str:
+    return await judge_backend().ajudge(messages)
+
+
+def _fuzzy_match_messages(pred: str, reference: str, question: str) -> list[dict[str, Any]]:
     # construct the question to ask
     message = "Help a teacher to grade the answer of a student given a question. Keep in mind that the student may use different phrasing or wording to answer the question. The goal is to evaluate whether the answer is semantically equivalent to the reference answer.\n"
     message += f"question: {question}\n"
@@ -18,30 +52,17 @@ def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
     message += "all the string 'N/A' that you see is a special sequence that means 'not achievable'\n"
     message += f"student answer: {pred}\n"
     message += "Conclude the judgement by 'correct', 'incorrect', or 'partially correct'. Only output one of these options, and nothing else."
-    messages = [
+    return [
         {"role": "system", "content": "You are a helpful assistant"},
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
-    print(response)
-    if "partially correct" in response or "incorrect" in response:
-        return 0.0
-    else:
-        assert "correct" in response, response
-        return 1.0
 
+def _fuzzy_match_score(response: str) -> float:
+    return _label_score(response, FUZZY_MATCH_LABELS)
 
-def llm_ua_match(pred: str, reference: str, question: str) -> float:
-    """Check whether the prediction matches the reference with GPT-4-turbo"""
-    messages: list[dict[str, Any]] = []
+
+def _ua_match_messages(pred: str, reference: str, question: str) -> list[dict[str, Any]]:
     # construct the question to ask
     message = ""
     message += f"task: {question}\n"
@@ -54,21 +75,88 @@ def llm_ua_match(pred: str, reference: str, question: str) -> float:
         "Determine if the reported reason aligns with the actual reason, even if implicitly. "
         "If the stated reason is in line with the actual reason, respond with 'same'. Otherwise, respond with 'different'."
     )
-    messages = [
+    return [
         {"role": "system", "content": "You are a helpful assistant"},
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
-    if "different" in response:
-        return 0.0
-    else:
-        assert "same" in response
-        return 1.0
\ No newline at end of file
+
+def _ua_match_score(response: str) -> float:
+    return _label_score(response, UA_MATCH_LABELS)
+
+
+@beartype
+def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
+    """
+    Check whether the prediction matches the reference with the LLM judge (GPT-4-turbo, or a local model, see `judges.py`),
+    graded by the first label of the judgment (0 if it has none)
+    """
+    response = _judge(_fuzzy_match_messages(pred, reference, question))
+    print(response)
+    return _score_or_zero(_fuzzy_match_score, response)
+
+
+@beartype
+async def allm_fuzzy_match(pred: str, reference: str, question: str) -> float:
+    """Async `llm_fuzzy_match`, to grade many answers concurrently (e.g. under a `ConcurrencyLimiter`)."""
+    response = await _ajudge(_fuzzy_match_messages(pred, reference, question))
+    return _score_or_zero(_fuzzy_match_score, response)
+
+
+def llm_ua_match(pred: str, reference: str, question: str) -> float:
+    """Check whether the prediction matches the reference with the LLM judge (see `judges.py`)"""
+    response = _judge(_ua_match_messages(pred, reference, question))
+    return _score_or_zero(_ua_match_score, response)
+
+
+async def allm_ua_match(pred: str, reference: str, question: str) -> float:
+    """Async `llm_ua_match`."""
+    response = await _ajudge(_ua_match_messages(pred, reference, question))
+    return _score_or_zero(_ua_match_score, response)
+
+
+def _score_or_none(score: Callable[[str], float], response: Optional[str], item: int) -> Optional[float]:
+    # one unparsable judgment mustn't throw away the rest of the batch
+    if response is None:
+        return None
+    try:
+        return score(response)
+    except UnparsableJudgment as e:
+        logger.warning(f"Item {item} left unscored: {e}")
+        return None
+
+
+def _batch_judge(
+    messages_list: List[list[dict[str, Any]]], score: Callable[[str], float],
+    runner: Optional[BatchRunner] = None) -> List[Optional[float]]:
+    judge = judge_backend()
+    if not isinstance(judge, OpenAIJudge) and runner is None:
+        # the local judge batches on its own
+        return [_score_or_none(score, response, i) for i, response in enumerate(judge.judge_many(messages_list))]
+    runner = runner or BatchRunner()
+    model = judge.model if isinstance(judge, OpenAIJudge) else JUDGE_GEN_KWARGS["model"]
+    requests = {
+        f"item-{i}": {"model": model, **JUDGE_PARAMS, "messages": messages}
+        for i, messages in enumerate(messages_list)}
+    responses = runner.run_chat(requests)
+    return [_score_or_none(score, responses.get(f"item-{i}"), i) for i in range(len(messages_list))]
+
+
+def llm_fuzzy_match_batch(
+    preds: Sequence[str], references: Sequence[str], questions: Sequence[str],
+    runner: Optional[BatchRunner] = None) -> List[Optional[float]]:
+    """
+    `llm_fuzzy_match` over many answers through the OpenAI Batch API (see `openai/batch.py`), or
+    the local judge's batches (see `judges.py`), in order; None for answers whose request failed
+    every attempt or whose judgment is unparsable.
+    """
+    return _batch_judge(
+        [_fuzzy_match_messages(*item) for item in zip(preds, references, questions)], _fuzzy_match_score, runner)
+
+
+def llm_ua_match_batch(
+    preds: Sequence[str], references: Sequence[str], questions: Sequence[str],
+    runner: Optional[BatchRunner] = None) -> List[Optional[float]]:
+    """`llm_ua_match` over many answers through the OpenAI Batch API, see `llm_fuzzy_match_batch`."""
+    return _batch_judge(
+        [_ua_match_messages(*item) for item in zip(preds, references, questions)], _ua_match_score, runner)
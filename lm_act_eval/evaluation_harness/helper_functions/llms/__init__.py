@@ -9,7 +9,7 @@ from .providers.openai_utils import (
     generate_from_openai_chat_completion,
     generate_from_openai_completion,
 )
-from .utils import call_llm
+from .utils import acall_llm, acall_llm_batch, call_llm, call_llm_batch
 
 __all__ = [
     "generate_from_openai_completion",
@@ -17,4 +17,7 @@ __all__ = [
     "generate_from_huggingface_completion",
     "generate_from_gemini_completion",
     "call_llm",
+    "acall_llm",
+    "call_llm_batch",
+    "acall_llm_batch",
 ]
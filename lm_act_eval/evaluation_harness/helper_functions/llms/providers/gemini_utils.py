@@ -1,10 +1,7 @@
 """Tools to generate from Gemini prompts."""
 
-import random
-import time
-from typing import Any
+import functools
 
-from google.api_core.exceptions import InvalidArgument
 from vertexai.preview.generative_models import (
     GenerativeModel,
     HarmBlockThreshold,
@@ -12,54 +9,55 @@ from vertexai.preview.generative_models import (
     Image,
 )
 
+from lm_act_eval.evaluation_harness.utils.resilience import resilience_policy
+from lm_act_eval.evaluation_harness.utils.telemetry import instrumented, note_tokens
+
 model = GenerativeModel("gemini-pro-vision")
 
 
 def retry_with_exponential_backoff(  # type: ignore
     func,
     initial_delay: float = 1,
-    exponential_base: float = 1,
-    jitter: bool = True,
     max_retries: int = 10,
-    errors: tuple[Any] = (InvalidArgument,),
 ):
-    """Retry a function with exponential backoff."""
+    """
+    Retry a function with exponential backoff on retryable errors, under the circuit breaker of its
+    `engine` and the current deadline (see `utils/resilience.py`).
+    """
 
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):  # type: ignore
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
-
-        # Loop until a successful response or max_retries is hit or an exception is raised
-        while True:
-            try:
+        policy = resilience_policy("google", kwargs.get("engine") or "")
+        return policy.call(lambda: func(*args, **kwargs), max_retries=max_retries, initial_delay=initial_delay)
 
-                return func(*args, **kwargs)
+    return wrapper
 
-            # Retry on specified errors
-            except errors as e:
-                # Increment retries
-                num_retries += 1
 
-                # Check if max retries has been reached
-                if num_retries > max_retries:
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
+def aretry_with_exponential_backoff(  # type: ignore
+    func,
+    initial_delay: float = 1,
+    max_retries: int = 10,
+):
+    """Async `retry_with_exponential_backoff`, whose slow attempts are also hedged."""
 
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):  # type: ignore
+        policy = resilience_policy("google", kwargs.get("engine") or "")
+        return await policy.acall(lambda: func(*args, **kwargs), max_retries=max_retries, initial_delay=initial_delay)
 
-                # Sleep for the delay
-                time.sleep(delay)
+    return wrapper
 
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                raise e
 
-    return wrapper
+SAFETY_CONFIG = {
+    HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+}
 
 
+@instrumented("google", model_args=("engine",))
 @retry_with_exponential_backoff
 def generate_from_gemini_completion(
     prompt: list[str | Image],
@@ -69,13 +67,6 @@ def generate_from_gemini_completion(
     top_p: float,
 ) -> str:
     del engine
-    safety_config = {
-        HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    }
     response = model.generate_content(
         prompt,
         generation_config=dict(
@@ -84,8 +75,39 @@ def generate_from_gemini_completion(
             top_p=top_p,
             temperature=temperature,
         ),
-        safety_settings=safety_config,
+        safety_settings=SAFETY_CONFIG,
+    )
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        note_tokens(usage.prompt_token_count, usage.candidates_token_count)
+    answer = response.text
+    return answer
+
+
+@instrumented("google", model_args=("engine",))
+@aretry_with_exponential_backoff
+async def agenerate_from_gemini_completion(
+    prompt: list[str | Image],
+    engine: str,
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+) -> str:
+    """Async `generate_from_gemini_completion`."""
+    del engine
+    response = await model.generate_content_async(
+        prompt,
+        generation_config=dict(
+            candidate_count=1,
+            max_output_tokens=max_tokens,
+            top_p=top_p,
+            temperature=temperature,
+        ),
+        safety_settings=SAFETY_CONFIG,
     )
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        note_tokens(usage.prompt_token_count, usage.candidates_token_count)
     answer = response.text
     return answer
 
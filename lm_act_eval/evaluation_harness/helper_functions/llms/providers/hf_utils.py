@@ -1,6 +1,9 @@
-from text_generation import Client  # type: ignore
+from lm_act_eval.evaluation_harness.utils.telemetry import instrumented, note_tokens
 
+from .tgi_client import tgi_client
 
+
+@instrumented("huggingface", model_args=("model_endpoint",))
 def generate_from_huggingface_completion(
     prompt: str,
     model_endpoint: str,
@@ -8,14 +11,47 @@ def generate_from_huggingface_completion(
     top_p: float,
     max_new_tokens: int,
     stop_sequences: list[str] | None = None,
+    stream: bool = False,
+    timeout: float | None = None,
+    max_retries: int | None = None,
 ) -> str:
-    client = Client(model_endpoint, timeout=60)
-    generation: str = client.generate(
-        prompt=prompt,
+    generation = tgi_client(model_endpoint).generate_sync(
+        prompt,
+        max_new_tokens=max_new_tokens,
         temperature=temperature,
         top_p=top_p,
-        max_new_tokens=max_new_tokens,
         stop_sequences=stop_sequences,
-    ).generated_text
+        stream=stream,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
+    note_tokens(tokens_out=generation.generated_tokens)
+
+    return generation.text
 
-    return generation
+
+@instrumented("huggingface", model_args=("model_endpoint",))
+async def agenerate_from_huggingface_completion(
+    prompt: str,
+    model_endpoint: str,
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    stop_sequences: list[str] | None = None,
+    stream: bool = False,
+    timeout: float | None = None,
+    max_retries: int | None = None,
+) -> str:
+    """Async `generate_from_huggingface_completion`."""
+    generation = await tgi_client(model_endpoint).generate(
+        prompt,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stop_sequences=stop_sequences,
+        stream=stream,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
+    note_tokens(tokens_out=generation.generated_tokens)
+    return generation.text
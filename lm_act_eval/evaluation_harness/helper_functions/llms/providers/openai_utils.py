@@ -2,10 +2,12 @@
 Adopted from https://github.com/zeno-ml/zeno-build/"""
 
 import asyncio
+import functools
 import logging
 import os
-import random
 import time
+import weakref
+from contextlib import asynccontextmanager, nullcontext
 from typing import Any
 
 import aiolimiter
@@ -16,88 +18,124 @@ from tqdm.asyncio import tqdm_asyncio
 
 import warnings
 
+from lm_act_eval.evaluation_harness.evaluators.concurrency import adaptive_limiter
+from lm_act_eval.evaluation_harness.utils.resilience import CircuitOpenError, attempt_timeout, resilience_policy
+from lm_act_eval.evaluation_harness.utils.telemetry import (
+    instrumented,
+    note_error,
+    note_queue_wait,
+    note_usage,
+)
+
 try:
     client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    aclient = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
 except KeyError as e:
     warnings.warn("Please set your OpenAI API key in the environment variable `OPENAI_API_KEY` to use this part of the modules functionality.\n{e}")
 
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def async_client() -> AsyncOpenAI:
+    """
+    The async client of the running event loop: its connection pool is shared by every
+    coroutine of the loop (a pool can't outlive the loop it was opened on).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    return client
+
+
+@asynccontextmanager
+async def _slot(model: str, limiter: aiolimiter.AsyncLimiter | None = None):
+    """The local queue of a request: the `requests_per_minute` limiter, then the model's adaptive slot."""
+    queued_at = time.perf_counter()
+    async with limiter or nullcontext():
+        adaptive = adaptive_limiter("openai", model)
+        async with adaptive.slot() if adaptive is not None else nullcontext():
+            note_queue_wait(time.perf_counter() - queued_at)
+            yield
+
+
+async def _acreate(resource, **body) -> Any:
+    """`resource.create(**body)`, under the adaptive limiter of `body["model"]` (in the slot held, if any)."""
+    limiter = adaptive_limiter("openai", body["model"])
+    if limiter is None:
+        return await resource.create(**body)
+    return await limiter.create(resource, (openai.RateLimitError,), **body)
+
+
+def _request_timeout() -> Any:
+    # the attempt's share of the call timeout & deadline, see `ResiliencePolicy.call`
+    timeout = attempt_timeout()
+    return openai.NOT_GIVEN if timeout is None else timeout
+
+
 def retry_with_exponential_backoff(  # type: ignore
     func,
     initial_delay: float = 1,
-    exponential_base: float = 2,
-    jitter: bool = True,
     max_retries: int = 3,
-    errors: tuple[Any] = (
-        openai.RateLimitError,
-        openai.BadRequestError,
-        openai.InternalServerError,
-    ),
 ):
-    """Retry a function with exponential backoff."""
+    """
+    Retry a function with exponential backoff on retryable errors (rate limits, timeouts, connection
+    and server errors), under the circuit breaker of its `model`/`engine` and the current deadline
+    (see `utils/resilience.py`). Other errors, e.g. `openai.BadRequestError`, are raised at once.
+    """
 
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):  # type: ignore
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
+        policy = resilience_policy("openai", kwargs.get("model") or kwargs.get("engine") or "")
+        return policy.call(lambda: func(*args, **kwargs), max_retries=max_retries, initial_delay=initial_delay)
 
-        # Loop until a successful response or max_retries is hit or an exception is raised
-        while True:
-            try:
-
-                return func(*args, **kwargs)
-
-            # Retry on specified errors
-            except errors as e:
-                # Increment retries
-                num_retries += 1
-
-                # Check if max retries has been reached
-                if num_retries > max_retries:
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
+    return wrapper
 
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
 
-                # Sleep for the delay
-                time.sleep(delay)
+def aretry_with_exponential_backoff(  # type: ignore
+    func,
+    initial_delay: float = 1,
+    max_retries: int = 3,
+):
+    """`retry_with_exponential_backoff` for coroutine functions, whose slow attempts are also hedged."""
 
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                raise e
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):  # type: ignore
+        model = kwargs.get("model") or kwargs.get("engine") or ""
+        return await resilience_policy("openai", model).acall(
+            lambda: func(*args, **kwargs), max_retries=max_retries, initial_delay=initial_delay,
+            slot=lambda: _slot(model))
 
     return wrapper
 
 
+@instrumented("openai")
 async def _throttled_openai_completion_acreate(
     engine: str,
     prompt: str,
     temperature: float,
     max_tokens: int,
     top_p: float,
-    limiter: aiolimiter.AsyncLimiter,
+    limiter: aiolimiter.AsyncLimiter | None,
 ) -> dict[str, Any]:
-    async with limiter:
-        for _ in range(3):
-            try:
-                return await aclient.completions.create(
-                    engine=engine,
-                    prompt=prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p,
-                )
-            except openai.RateLimitError:
-                logging.warning(
-                    "OpenAI API rate limit exceeded. Sleeping for 10 seconds."
-                )
-                await asyncio.sleep(10)
-            except openai.APIError as e:
-                logging.warning(f"OpenAI API error: {e}")
-                break
+    async def attempt():
+        return await _acreate(
+            async_client().completions,
+            model=engine,
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+        )
+
+    try:
+        response = await resilience_policy("openai", engine).acall(
+            attempt, max_retries=2, slot=lambda: _slot(engine, limiter))
+    except (openai.APIError, TimeoutError, CircuitOpenError) as e:
+        logging.warning(f"OpenAI API error: {e}")
+        note_error(e)
         return {"choices": [{"message": {"content": ""}}]}
+    note_usage(getattr(response, "usage", None))
+    return response
 
 
 async def agenerate_from_openai_completion(
@@ -107,7 +145,7 @@ async def agenerate_from_openai_completion(
     max_tokens: int,
     top_p: float,
     context_length: int,
-    requests_per_minute: int = 300,
+    requests_per_minute: int | None = None,
 ) -> list[str]:
     """Generate from OpenAI Completion API.
 
@@ -117,7 +155,8 @@ async def agenerate_from_openai_completion(
         max_tokens: Maximum number of tokens to generate.
         top_p: Top p to use.
         context_length: Length of context to use.
-        requests_per_minute: Number of requests per minute to allow.
+        requests_per_minute: Number of requests per minute to allow, on top of the
+            model's adaptive concurrency. None to only follow the API's rate limits.
 
     Returns:
         List of generated responses.
@@ -127,7 +166,7 @@ async def agenerate_from_openai_completion(
             "OPENAI_API_KEY environment variable must be set when using OpenAI API."
         )
 
-    limiter = aiolimiter.AsyncLimiter(requests_per_minute)
+    limiter = aiolimiter.AsyncLimiter(requests_per_minute) if requests_per_minute else None
     async_responses = [
         _throttled_openai_completion_acreate(
             engine=engine,
@@ -143,6 +182,7 @@ async def agenerate_from_openai_completion(
     return [x["choices"][0]["text"] for x in responses]
 
 
+@instrumented("openai")
 @retry_with_exponential_backoff
 def generate_from_openai_completion(
     prompt: str,
@@ -165,41 +205,41 @@ def generate_from_openai_completion(
         max_tokens=max_tokens,
         top_p=top_p,
         stop=[stop_token],
+        timeout=_request_timeout(),
     )
+    note_usage(getattr(response, "usage", None))
     answer: str = response["choices"][0]["text"]
     return answer
 
 
+@instrumented("openai")
 async def _throttled_openai_chat_completion_acreate(
     model: str,
     messages: list[dict[str, str]],
     temperature: float,
     max_tokens: int,
     top_p: float,
-    limiter: aiolimiter.AsyncLimiter,
+    limiter: aiolimiter.AsyncLimiter | None,
 ) -> dict[str, Any]:
-    async with limiter:
-        for _ in range(3):
-            try:
-                return await aclient.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p,
-                )
-            except openai.RateLimitError:
-                logging.warning(
-                    "OpenAI API rate limit exceeded. Sleeping for 10 seconds."
-                )
-                await asyncio.sleep(10)
-            except asyncio.exceptions.TimeoutError:
-                logging.warning("OpenAI API timeout. Sleeping for 10 seconds.")
-                await asyncio.sleep(10)
-            except openai.APIError as e:
-                logging.warning(f"OpenAI API error: {e}")
-                break
+    async def attempt():
+        return await _acreate(
+            async_client().chat.completions,
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+        )
+
+    try:
+        response = await resilience_policy("openai", model).acall(
+            attempt, max_retries=2, slot=lambda: _slot(model, limiter))
+    except (openai.APIError, TimeoutError, CircuitOpenError) as e:
+        logging.warning(f"OpenAI API error: {e}")
+        note_error(e)
         return {"choices": [{"message": {"content": ""}}]}
+    note_usage(getattr(response, "usage", None))
+    return response
 
 
 async def agenerate_from_openai_chat_completion(
@@ -209,7 +249,7 @@ async def agenerate_from_openai_chat_completion(
     max_tokens: int,
     top_p: float,
     context_length: int,
-    requests_per_minute: int = 300,
+    requests_per_minute: int | None = None,
 ) -> list[str]:
     """Generate from OpenAI Chat Completion API.
 
@@ -219,7 +259,8 @@ async def agenerate_from_openai_chat_completion(
         max_tokens: Maximum number of tokens to generate.
         top_p: Top p to use.
         context_length: Length of context to use.
-        requests_per_minute: Number of requests per minute to allow.
+        requests_per_minute: Number of requests per minute to allow, on top of the
+            model's adaptive concurrency. None to only follow the API's rate limits.
 
     Returns:
         List of generated responses.
@@ -229,7 +270,7 @@ async def agenerate_from_openai_chat_completion(
             "OPENAI_API_KEY environment variable must be set when using OpenAI API."
         )
 
-    limiter = aiolimiter.AsyncLimiter(requests_per_minute)
+    limiter = aiolimiter.AsyncLimiter(requests_per_minute) if requests_per_minute else None
     async_responses = [
         _throttled_openai_chat_completion_acreate(
             model=engine,
@@ -245,6 +286,7 @@ async def agenerate_from_openai_chat_completion(
     return [x["choices"][0]["message"]["content"] for x in responses]
 
 
+@instrumented("openai")
 @retry_with_exponential_backoff
 def generate_from_openai_chat_completion(
     messages: list[dict[str, str]],
@@ -265,11 +307,72 @@ def generate_from_openai_chat_completion(
         temperature=temperature,
         max_tokens=max_tokens,
         top_p=top_p,
+        timeout=_request_timeout(),
     )
+    note_usage(response.usage)
     answer: str = response.choices[0].message.content
     return answer
 
 
+@instrumented("openai")
+@aretry_with_exponential_backoff
+async def agenerate_one_from_openai_chat_completion(
+    messages: list[dict[str, str]],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+    context_length: int,
+    stop_token: str | None = None,
+) -> str:
+    """Async `generate_from_openai_chat_completion`, for callers that bound their own concurrency."""
+    if "OPENAI_API_KEY" not in os.environ:
+        raise ValueError(
+            "OPENAI_API_KEY environment variable must be set when using OpenAI API."
+        )
+    response = await _acreate(
+        async_client().chat.completions,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p,
+    )
+    note_usage(response.usage)
+    answer: str = response.choices[0].message.content
+    return answer
+
+
+@instrumented("openai")
+@aretry_with_exponential_backoff
+async def agenerate_one_from_openai_completion(
+    prompt: str,
+    engine: str,
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+    context_length: int,
+    stop_token: str | None = None,
+) -> str:
+    """Async `generate_from_openai_completion`, for callers that bound their own concurrency."""
+    if "OPENAI_API_KEY" not in os.environ:
+        raise ValueError(
+            "OPENAI_API_KEY environment variable must be set when using OpenAI API."
+        )
+    response = await _acreate(
+        async_client().completions,
+        prompt=prompt,
+        model=engine,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p,
+        stop=[stop_token] if stop_token else None,
+    )
+    note_usage(response.usage)
+    answer: str = response.choices[0].text
+    return answer
+
+
 @retry_with_exponential_backoff
 # debug only
 def fake_generate_from_openai_chat_completion(
@@ -0,0 +1,294 @@
+"""
+Pooled client of Hugging Face text-generation-inference (TGI) endpoints.
+
+`tgi_client(endpoint)` is the process-wide client of an endpoint: its requests share one keep-alive
+connection pool (up to `max_connections` at once) on a background event loop, so sync callers,
+threads and any event loop use the same pool. Connection errors, timeouts and overloaded or
+unavailable servers are retried with exponential backoff. `stream=True` reads the generation token
+by token (`/generate_stream`) and returns as soon as a stop sequence shows up, closing the stream
+so the server stops generating.
+
+    generation = await tgi_client(endpoint).generate(prompt, max_new_tokens=64, stream=True, stop_sequences=["\\n"])
+    generation.text, generation.generated_tokens
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import json
+import logging
+import random
+import threading
+from typing import Any, Coroutine, Dict, List, NamedTuple, Optional
+
+import aiohttp
+from text_generation.errors import (  # type: ignore
+    OverloadedError,
+    RateLimitExceededError,
+    ShardNotReadyError,
+    ShardTimeoutError,
+    parse_error,
+)
+
+from lm_act_eval.evaluation_harness.utils.telemetry import note_retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_CONNECTIONS = 64
+# TGI's default `--max-stop-sequences`: further ones are only checked client-side, when streaming
+MAX_SERVER_STOP_SEQUENCES = 4
+RETRYABLE_STATUSES = (408, 424, 429, 502, 503, 504)
+RETRYABLE_ERRORS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+    OverloadedError,
+    RateLimitExceededError,
+    ShardNotReadyError,
+    ShardTimeoutError,
+)
+
+
+class Generation(NamedTuple):
+    text: str
+    generated_tokens: int = 0
+    finish_reason: Optional[str] = None
+
+
+def _error(status: int, payload: Any) -> Exception:
+    if not isinstance(payload, dict) or "error" not in payload:
+        payload = {"error": str(payload)}
+    error = parse_error(status, payload)
+    error.status = status
+    return error
+
+
+def _retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS) or getattr(error, "status", None) in RETRYABLE_STATUSES
+
+
+def _stop_end(text: str, stop_sequences: List[str], start: int = 0) -> Optional[int]:
+    """The end of the first stop sequence in `text` (searched from `start`), None if there's none."""
+    ends = [i + len(stop) for stop in stop_sequences if (i := text.find(stop, start)) >= 0]
+    return min(ends) if ends else None
+
+
+class _BackgroundLoop:
+    """An event loop on a daemon thread, where the clients' sessions live."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="tgi-client", daemon=True).start()
+            return self._loop
+
+    @staticmethod
+    async def _in_context(coro: Coroutine, context: contextvars.Context) -> Any:
+        return await asyncio.get_running_loop().create_task(coro, context=context)
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        # the caller's context (e.g. the telemetry of its call) follows the request
+        return asyncio.run_coroutine_threadsafe(
+            self._in_context(coro, contextvars.copy_context()), self.loop())
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+
+_background = _BackgroundLoop()
+
+
+class TGIClient:
+    def __init__(
+        self, endpoint: str, timeout: float = DEFAULT_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        initial_delay: float = 1, headers: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            endpoint (str): The TGI server, e.g. `http://localhost:8080`.
+            timeout (float): Seconds per request (the whole generation), unless overridden per call.
+            connect_timeout (float): Seconds to open a connection.
+            max_retries (int): Retries of a failed request, unless overridden per call.
+            max_connections (int): Connections kept open (and requests in flight) at once.
+            initial_delay (float): Seconds before the first retry, doubling (with jitter) after.
+            headers (Dict[str, str], optional): Sent with every request, e.g. an `Authorization`.
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.initial_delay = initial_delay
+        self.headers = dict(headers or {})
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _client_session(self) -> aiohttp.ClientSession:
+        # only ever called on the background loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections),
+                headers=self.headers,
+            )
+        return self._session
+
+    def _request_timeout(self, timeout: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=timeout or self.timeout, connect=self.connect_timeout)
+
+    @staticmethod
+    def parameters(
+        max_new_tokens: int, temperature: Optional[float] = None, top_p: Optional[float] = None,
+        stop_sequences: Optional[List[str]] = None, **parameters) -> Dict[str, Any]:
+        """The TGI `parameters` of a request. Greedy (0) temperatures and `top_p` 1 are left to the server."""
+        parameters = {"max_new_tokens": max_new_tokens, "details": True, **parameters}
+        if temperature:
+            parameters["temperature"] = temperature
+        if top_p is not None and 0 < top_p < 1:
+            parameters["top_p"] = top_p
+        if stop_sequences:
+            parameters["stop"] = list(stop_sequences)[:MAX_SERVER_STOP_SEQUENCES]
+        return parameters
+
+    async def generate(
+        self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None, top_p: Optional[float] = None,
+        stop_sequences: Optional[List[str]] = None, stream: bool = False, timeout: Optional[float] = None,
+        max_retries: Optional[int] = None, **parameters) -> Generation:
+        """
+        Generates from `prompt`, from any event loop.
+
+        Args:
+            prompt (str): The prompt.
+            max_new_tokens (int): Tokens generated at most.
+            temperature (float, optional): Sampling temperature, greedy if unset or 0.
+            top_p (float, optional): Nucleus sampling mass.
+            stop_sequences (List[str], optional): Sequences ending the generation (included in the text).
+            stream (bool): Stream the generation and stop reading at the first stop sequence.
+            timeout (float, optional): Overrides the client's `timeout`.
+            max_retries (int, optional): Overrides the client's `max_retries`.
+            **parameters: Further TGI parameters, e.g. `seed` or `repetition_penalty`.
+        """
+        return await asyncio.wrap_future(self._submit(
+            prompt, max_new_tokens, temperature, top_p, stop_sequences, stream, timeout, max_retries, **parameters))
+
+    def generate_sync(self, prompt: str, max_new_tokens: int, **kwargs) -> Generation:
+        """`generate`, blocking."""
+        return self._submit(prompt, max_new_tokens, **kwargs).result()
+
+    def _submit(
+        self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None, top_p: Optional[float] = None,
+        stop_sequences: Optional[List[str]] = None, stream: bool = False, timeout: Optional[float] = None,
+        max_retries: Optional[int] = None, **parameters) -> concurrent.futures.Future:
+        return _background.submit(self._generate(
+            prompt, self.parameters(max_new_tokens, temperature, top_p, stop_sequences, **parameters),
+            list(stop_sequences or []), stream, timeout, max_retries))
+
+    async def _generate(
+        self, prompt: str, parameters: Dict[str, Any], stop_sequences: List[str], stream: bool,
+        timeout: Optional[float], max_retries: Optional[int]) -> Generation:
+        max_retries = self.max_retries if max_retries is None else max_retries
+        delay = self.initial_delay
+        for attempt in range(max_retries + 1):
+            try:
+                if stream:
+                    return await self._stream(prompt, parameters, stop_sequences, timeout)
+                return await self._request(prompt, parameters, timeout)
+            except Exception as e:
+                if attempt == max_retries or not _retryable(e):
+                    raise
+                logger.warning(f"TGI request to {self.endpoint} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                note_retry(e, delay)
+                await asyncio.sleep(delay)
+                delay *= 2 * (1 + random.random())
+
+    async def _request(self, prompt: str, parameters: Dict[str, Any], timeout: Optional[float]) -> Generation:
+        async with self._client_session().post(
+            f"{self.endpoint}/generate", json={"inputs": prompt, "parameters": parameters},
+            timeout=self._request_timeout(timeout)) as response:
+            payload = await response.json(content_type=None)
+            if response.status != 200:
+                raise _error(response.status, payload)
+        if isinstance(payload, list):
+            payload = payload[0]
+        details = payload.get("details") or {}
+        return Generation(payload["generated_text"], details.get("generated_tokens", 0), details.get("finish_reason"))
+
+    async def _stream(
+        self, prompt: str, parameters: Dict[str, Any], stop_sequences: List[str],
+        timeout: Optional[float]) -> Generation:
+        longest_stop = max(map(len, stop_sequences), default=0)
+        async with self._client_session().post(
+            f"{self.endpoint}/generate_stream", json={"inputs": prompt, "parameters": parameters, "stream": True},
+            timeout=self._request_timeout(timeout)) as response:
+            if response.status != 200:
+                raise _error(response.status, await response.json(content_type=None))
+            text, tokens = "", 0
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
+                event = json.loads(line[len(b"data:"):])
+                if "error" in event:
+                    raise _error(response.status, event)
+                token = event.get("token") or {}
+                searched = max(len(text) - longest_stop + 1, 0)
+                if not token.get("special"):
+                    text += token.get("text", "")
+                tokens += 1
+                if event.get("generated_text") is not None:
+                    details = event.get("details") or {}
+                    return Generation(
+                        event["generated_text"], details.get("generated_tokens", tokens), details.get("finish_reason"))
+                end = _stop_end(text, stop_sequences, searched) if stop_sequences else None
+                if end is not None:
+                    # dropping the connection is what stops the server
+                    response.close()
+                    return Generation(text[:end], tokens, "stop_sequence")
+        raise aiohttp.ClientPayloadError(f"The stream of {self.endpoint} ended before the generation")
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self) -> None:
+        """Closes the connection pool, the next request opens a new one."""
+        if _background.started:
+            _background.submit(self.aclose()).result(timeout=5)
+
+
+_clients: Dict[str, TGIClient] = {}
+_clients_lock = threading.Lock()
+
+
+def tgi_client(endpoint: str, **options) -> TGIClient:
+    """The process-wide client of `endpoint`, created with `options` (see `TGIClient`) on first use."""
+    key = endpoint.rstrip("/")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = TGIClient(endpoint, **options)
+        return client
+
+
+def close_tgi_clients() -> None:
+    """Closes the connection pools of the process-wide clients."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Closing the TGI client of {client.endpoint} failed: {e}")
+
+
+atexit.register(close_tgi_clients)
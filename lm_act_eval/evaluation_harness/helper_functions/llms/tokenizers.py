@@ -1,29 +1,70 @@
-from typing import Any
+import threading
+from typing import Dict, Sequence, Tuple
 
 import tiktoken
-from transformers import LlamaTokenizer  # type: ignore
 
 
 class Tokenizer(object):
     def __init__(self, provider: str, model_name: str) -> None:
+        self.provider = provider
         if provider == "openai":
             self.tokenizer = tiktoken.encoding_for_model(model_name)
         elif provider == "huggingface":
-            self.tokenizer = LlamaTokenizer.from_pretrained(model_name)
-            # turn off adding special tokens automatically
-            self.tokenizer.add_special_tokens = False  # type: ignore[attr-defined]
-            self.tokenizer.add_bos_token = False  # type: ignore[attr-defined]
-            self.tokenizer.add_eos_token = False  # type: ignore[attr-defined]
+            # imported here, transformers takes seconds to import and only Hugging Face models need it
+            from transformers import AutoTokenizer  # type: ignore
+
+            # the Rust (fast) tokenizer, batched and an order of magnitude faster than `LlamaTokenizer`
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
         elif provider == "google":
             self.tokenizer = None  # Not used for input length computation, as Gemini is based on characters
         else:
             raise NotImplementedError
 
     def encode(self, text: str) -> list[int]:
+        if self.provider == "huggingface":
+            # no special tokens added automatically
+            return self.tokenizer.encode(text, add_special_tokens=False)
         return self.tokenizer.encode(text)
 
     def decode(self, ids: list[int]) -> str:
         return self.tokenizer.decode(ids)
 
+    def encode_batch(self, texts: Sequence[str]) -> list[list[int]]:
+        """`encode` of many texts at once, tokenized in parallel."""
+        if self.provider == "huggingface":
+            return self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return self.tokenizer.encode_batch(list(texts))
+
+    def count_tokens(self, texts: Sequence[str]) -> list[int]:
+        """The token count of each of `texts` (characters for Gemini)."""
+        if self.tokenizer is None:
+            return [len(text) for text in texts]
+        return [len(ids) for ids in self.encode_batch(texts)]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """`text` cut to its first `max_tokens` tokens (characters for Gemini), tokenized only if it may be longer."""
+        if self.tokenizer is None:
+            return text[:max_tokens]
+        # a token spans at least a UTF-8 byte, Llama may add a leading space token: shorter texts fit
+        if len(text) < max_tokens // 4 or len(text.encode("utf-8")) < max_tokens:
+            return text
+        ids = self.encode(text)
+        if len(ids) <= max_tokens:
+            return text
+        return self.decode(ids[:max_tokens])
+
     def __call__(self, text: str) -> list[int]:
-        return self.tokenizer.encode(text)
+        return self.encode(text)
+
+
+_tokenizers: Dict[Tuple[str, str], Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def cached_tokenizer(provider: str, model_name: str) -> Tokenizer:
+    """The process-wide `Tokenizer` of a model, loaded once and shared by every agent."""
+    with _tokenizers_lock:
+        key = (provider, model_name)
+        if key not in _tokenizers:
+            _tokenizers[key] = Tokenizer(provider, model_name)
+        return _tokenizers[key]
@@ -1,25 +1,107 @@
 import argparse
-from typing import Any
+import asyncio
+from functools import partial
+from typing import Any, Optional
 
 try:
     from vertexai.preview.generative_models import Image
-    from .providers.gemini_utils import generate_from_gemini_completion
+    from .providers.gemini_utils import agenerate_from_gemini_completion, generate_from_gemini_completion
 except:
     print('Google Cloud not set up, skipping import of vertexai.preview.generative_models.Image and llms.generate_from_gemini_completion')
 
-from .providers.hf_utils import generate_from_huggingface_completion
+from .providers.hf_utils import agenerate_from_huggingface_completion, generate_from_huggingface_completion
 from .providers.openai_utils import (
+    agenerate_one_from_openai_chat_completion,
+    agenerate_one_from_openai_completion,
     generate_from_openai_chat_completion,
     generate_from_openai_completion
 )
 from . import lm_config
+from lm_act_eval.evaluation_harness.evaluators.concurrency import DEFAULT_MAX_CONCURRENCY, ConcurrencyLimiter
+from lm_act_eval.evaluation_harness.utils.llm_cache import acached_completion, cached_completion
 
 APIInput = str | list[Any] | dict[str, Any]
 
+# gen_config entries steering the calls rather than the generation, kept out of cache keys
+SCHEDULING_KEYS = ("concurrency", "batch_size", "stream", "timeout", "max_retries")
+# gen_config entries passed on to the TGI client when set
+TGI_OPTIONS = ("stream", "timeout", "max_retries")
+
+
+def _cache_params(lm_config: lm_config.LMConfig) -> dict[str, Any]:
+    gen_config = {k: v for k, v in lm_config.gen_config.items() if k not in SCHEDULING_KEYS}
+    return {"mode": lm_config.mode, **gen_config}
+
 
 def call_llm(
     lm_config: lm_config.LMConfig,
     prompt: APIInput,
+    cache: bool = True,
+) -> str:
+    """
+    The response of the configured model to `prompt`, through the LLM response cache unless
+    `cache` is False (e.g. an agent asking again after an unparsable response).
+    """
+    if not cache:
+        return _call_llm(lm_config, prompt)
+    return cached_completion(
+        lm_config.provider, lm_config.model, prompt, _cache_params(lm_config),
+        lambda: _call_llm(lm_config, prompt))
+
+
+async def acall_llm(
+    lm_config: lm_config.LMConfig,
+    prompt: APIInput,
+    cache: bool = True,
+) -> str:
+    """Async `call_llm`, on the async client of the provider."""
+    if not cache:
+        return await _acall_llm(lm_config, prompt)
+    return await acached_completion(
+        lm_config.provider, lm_config.model, prompt, _cache_params(lm_config),
+        lambda: _acall_llm(lm_config, prompt))
+
+
+async def acall_llm_batch(
+    lm_config: lm_config.LMConfig,
+    prompts: list[APIInput],
+    concurrency: Optional[int] = None,
+) -> list[str]:
+    """
+    The responses of the configured model to `prompts`, in order.
+
+    Args:
+        lm_config (LMConfig): The model; `gen_config["concurrency"]` bounds the calls in flight and
+            `gen_config["batch_size"]` the prompts scheduled at once (all of them by default).
+        prompts (list[APIInput]): The prompts.
+        concurrency (int, optional): Overrides `gen_config["concurrency"]`.
+
+    Returns:
+        list[str]: The responses, in the order of `prompts`.
+    """
+    concurrency = concurrency or lm_config.gen_config.get("concurrency") or DEFAULT_MAX_CONCURRENCY
+    batch_size = lm_config.gen_config.get("batch_size") or len(prompts) or 1
+    limiter = ConcurrencyLimiter(concurrency)
+    responses: list[str] = []
+    for start in range(0, len(prompts), batch_size):
+        responses += await limiter.map(
+            partial(acall_llm, lm_config), prompts[start:start + batch_size],
+            provider=lm_config.provider, desc=f"{lm_config.provider}/{lm_config.model}")
+    return responses
+
+
+def call_llm_batch(
+    lm_config: lm_config.LMConfig,
+    prompts: list[APIInput],
+    concurrency: Optional[int] = None,
+) -> list[str]:
+    """`acall_llm_batch` on a new event loop, not to be called from a running one."""
+    return asyncio.run(acall_llm_batch(lm_config, prompts, concurrency=concurrency))
+
+
+def _call_llm(
+    lm_config: lm_config.LMConfig,
+    prompt: APIInput,
 ) -> str:
     response: str
     if lm_config.provider == "openai":
@@ -57,6 +139,7 @@ def call_llm(
             top_p=lm_config.gen_config["top_p"],
             stop_sequences=lm_config.gen_config["stop_sequences"],
             max_new_tokens=lm_config.gen_config["max_new_tokens"],
+            **{k: lm_config.gen_config[k] for k in TGI_OPTIONS if k in lm_config.gen_config},
         )
     elif lm_config.provider == "google":
         assert isinstance(prompt, list)
@@ -76,3 +159,66 @@ def call_llm(
         )
 
     return response
+
+
+async def _acall_llm(
+    lm_config: lm_config.LMConfig,
+    prompt: APIInput,
+) -> str:
+    response: str
+    if lm_config.provider == "openai":
+        if lm_config.mode == "chat":
+            assert isinstance(prompt, list)
+            response = await agenerate_one_from_openai_chat_completion(
+                messages=prompt,
+                model=lm_config.model,
+                temperature=lm_config.gen_config["temperature"],
+                top_p=lm_config.gen_config["top_p"],
+                context_length=lm_config.gen_config["context_length"],
+                max_tokens=lm_config.gen_config["max_tokens"],
+                stop_token=None,
+            )
+        elif lm_config.mode == "completion":
+            assert isinstance(prompt, str)
+            response = await agenerate_one_from_openai_completion(
+                prompt=prompt,
+                engine=lm_config.model,
+                temperature=lm_config.gen_config["temperature"],
+                max_tokens=lm_config.gen_config["max_tokens"],
+                top_p=lm_config.gen_config["top_p"],
+                context_length=lm_config.gen_config["context_length"],
+                stop_token=lm_config.gen_config["stop_token"],
+            )
+        else:
+            raise ValueError(
+                f"OpenAI models do not support mode {lm_config.mode}"
+            )
+    elif lm_config.provider == "huggingface":
+        assert isinstance(prompt, str)
+        response = await agenerate_from_huggingface_completion(
+            prompt=prompt,
+            model_endpoint=lm_config.gen_config["model_endpoint"],
+            temperature=lm_config.gen_config["temperature"],
+            top_p=lm_config.gen_config["top_p"],
+            stop_sequences=lm_config.gen_config["stop_sequences"],
+            max_new_tokens=lm_config.gen_config["max_new_tokens"],
+            **{k: lm_config.gen_config[k] for k in TGI_OPTIONS if k in lm_config.gen_config},
+        )
+    elif lm_config.provider == "google":
+        assert isinstance(prompt, list)
+        assert all(
+            [isinstance(p, str) or isinstance(p, Image) for p in prompt]
+        )
+        response = await agenerate_from_gemini_completion(
+            prompt=prompt,
+            engine=lm_config.model,
+            temperature=lm_config.gen_config["temperature"],
+            max_tokens=lm_config.gen_config["max_tokens"],
+            top_p=lm_config.gen_config["top_p"],
+        )
+    else:
+        raise NotImplementedError(
+            f"Provider {lm_config.provider} not implemented"
+        )
+
+    return response
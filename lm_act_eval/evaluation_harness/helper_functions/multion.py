@@ -7,9 +7,8 @@ from typing import Optional, Dict
 
 from beartype import beartype
 import pandas as pd
-from datasets import Dataset
 
-from .utils import function_registry
+from .registry import function_registry
 
 COMMANDS_PREFIX = "COMMANDS:"
 ANSWER_PREFIX = "ANSWER:"
@@ -94,6 +93,47 @@ def extract_status(text: str) -> str:
         return ""
     return clean_extracted_text(match.group(1) + match.group(2))
 
+# Vectorized equivalents of the extractors above, row-for-row equal on string inputs.
+# `pd.Series.str.extract` runs the same `re.search` per row in C, without a Python call per row.
+
+def _clean_batch(texts: pd.Series) -> pd.Series:
+    return texts.str.strip().str.strip(r"\n")
+
+def _extract_batch(texts: pd.Series, pattern: str, groups: list[int]) -> pd.Series:
+    extracted = texts.str.extract(pattern, flags=re.DOTALL)
+    matched = extracted[groups[0]]
+    for group in groups[1:]:
+        matched = matched + extracted[group]
+    cleaned = _clean_batch(matched)
+    # no match returns "", non-string rows stay missing
+    return cleaned.where(cleaned.notna() | texts.isna(), "")
+
+@function_registry.register_batch('extract_first')
+def extract_first_batch(texts: pd.Series, term: str = "") -> pd.Series:
+    pattern = rf'{term}:\s*([\s\S]+?)(?=\n[A-Z]+:|$)'
+    matched = texts.str.extract(pattern, expand=False).str.strip()
+    return matched.astype(object).where(matched.notna(), None)
+
+@function_registry.register_batch('extract_thought')
+def extract_thought_batch(texts: pd.Series) -> pd.Series:
+    return _extract_batch(
+        texts, r"(.*?)(COMMANDS:|ANSWER:|ASK_USER_HELP:|EXPLANATION:|STATUS:|$)", [0])
+
+@function_registry.register_batch('extract_action')
+def extract_action_batch(texts: pd.Series) -> pd.Series:
+    return _extract_batch(
+        texts, r"(COMMANDS:|ANSWER:|ASK_USER_HELP:)(.*?)(EXPLANATION:|STATUS:|$)", [1])
+
+@function_registry.register_batch('extract_explanation')
+def extract_explanation_batch(texts: pd.Series) -> pd.Series:
+    return _extract_batch(
+        texts, r"(EXPLANATION:)(.*?)(STATUS:|COMMANDS:|ANSWER:|ASK_USER_HELP:|$)", [0, 1])
+
+@function_registry.register_batch('extract_status')
+def extract_status_batch(texts: pd.Series) -> pd.Series:
+    return _extract_batch(
+        texts, r"(STATUS:)(.*?)(COMMANDS:|ANSWER:|ASK_USER_HELP:|EXPLANATION:|$)", [0, 1])
+
 @function_registry.register('extract_commands')
 def extract_commands(action: str) -> list[str]:
     if COMMANDS_PREFIX in action:
@@ -172,6 +212,16 @@ class ParseChatCompletion:
         else: 
             warnings.warn(f"Unexpected format, returning suspicious content of type {type(chat_completion_msgs)}, using as is")
             return chat_completion_msgs
+
+    @function_registry.register_batch('parse_completion.parse_content')
+    def parse_content_batch(self, texts: pd.Series) -> pd.Series:
+        """
+        `parse_content` over a column. Parsing (`ast.literal_eval`) can't be vectorized,
+        so each distinct message is parsed once and the results are mapped back.
+        """
+        unique_texts = texts.drop_duplicates()
+        parsed = pd.Series([self.parse_content(s) for s in unique_texts], index=unique_texts.to_numpy(), dtype=object)
+        return texts.map(parsed)
   
 
 @dataclass
@@ -256,7 +306,9 @@ class StateActionDataset:
     def df(self) -> pd.DataFrame:
         return self._df
 
-    def as_dataset(self) -> Dataset:
+    def as_dataset(self) -> "Dataset":
+        from datasets import Dataset
+
         return Dataset.from_pandas(self.df)
 
     def save(self, path: Path | str) -> None:
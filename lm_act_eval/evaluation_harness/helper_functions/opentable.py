@@ -1,12 +1,15 @@
+from __future__ import annotations
+
 import asyncio
 from bs4 import BeautifulSoup
 import re
 import requests
+from typing import TYPE_CHECKING
 
-from playwright.async_api import async_playwright
-from playwright.sync_api import Page, sync_playwright
+if TYPE_CHECKING:
+    from playwright.sync_api import Page
 
-from .utils import function_registry
+from .registry import function_registry
 
 @function_registry.register('opentable_extract_reservation_details')
 def extract_reservation_info(html_context: str, url_params=None):
@@ -84,6 +87,8 @@ async def opentable_extract_reservation_details(html_context: str | Page):
             - first_name (str): The first name of the user.
             - last_name (str): The last name of the user.
     """
+    from playwright.async_api import async_playwright
+
     page = None
     browser = None
     playwright = None
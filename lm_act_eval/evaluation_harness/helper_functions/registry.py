@@ -0,0 +1,65 @@
+from typing import Callable, Optional
+
+from lm_act_eval.evaluation_harness.evaluators.registry import resolve_reference
+from lm_act_eval.evaluation_harness.manifest import FUNCTION_MANIFEST
+
+
+class FunctionRegistry:
+    registry = {}
+    # optional vectorized implementations (pd.Series -> pd.Series | pd.DataFrame), keyed like `registry`
+    # or as "name.method" for methods of registered classes
+    batch_registry = {}
+    # names resolvable without importing their module up front, see `manifest.py`
+    manifest = FUNCTION_MANIFEST
+
+    @classmethod
+    def register(cls, name, batch: Optional[Callable] = None):
+        """
+        Registers a row-wise function under `name`.
+
+        Args:
+            name (str): The registry name.
+            batch (Callable, optional): A vectorized equivalent taking the whole source column
+                (pd.Series -> pd.Series | pd.DataFrame), preferred by the dataframe evaluators.
+        """
+        def decorator(func):
+            cls.registry[name] = func
+            if batch is not None:
+                cls.batch_registry[name] = batch
+            return func
+        return decorator
+
+    @classmethod
+    def register_batch(cls, name):
+        """Registers the vectorized implementation of `name` (or `name.method`), see `register`."""
+        def decorator(func):
+            cls.batch_registry[name] = func
+            return func
+        return decorator
+
+    @classmethod
+    def get_batch(cls, name) -> Optional[Callable]:
+        """
+        Retrieve the vectorized implementation of `name` (or `name.method`), None if there is none.
+        For methods, the unbound function is returned.
+        """
+        # importing the module of the row-wise function registers its batch implementation
+        cls.get(name.split('.')[0])
+        return cls.batch_registry.get(name)
+    
+    @classmethod
+    def get(cls, name):
+        """Retrieve a function by name, importing its module on first use."""
+        if name in cls.registry:
+            return cls.registry.get(name)
+        elif name in cls.manifest:
+            return cls.registry.setdefault(name, resolve_reference(cls.manifest[name]))
+        else:
+            raise Exception(f"{name} doesn't exist in the registry. Choose from: {cls.list()}")
+    
+    @classmethod
+    def list(cls):
+        """List all registered functions."""
+        return list(dict.fromkeys([*cls.manifest, *cls.registry]))
+
+function_registry = FunctionRegistry()
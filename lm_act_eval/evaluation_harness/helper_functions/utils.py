@@ -33,27 +33,4 @@ def get_query_text_lowercase(page: Page | PseudoPage, selector: str) -> str:
     """Get the lowercase text content of the element matching the given selector."""
     return get_query_text(page, selector).lower()
 
-class FunctionRegistry:
-    registry = {}
-
-    @classmethod
-    def register(cls, name):
-        def decorator(func):
-            cls.registry[name] = func
-            return func
-        return decorator
-    
-    @classmethod
-    def get(cls, name):
-        """Retrieve a function by name."""
-        if name in cls.registry:
-            return cls.registry.get(name)
-        else:
-            raise Exception(f"{name} doesn't exist in the registry. Choose from: {cls.registry}")
-    
-    @classmethod
-    def list(cls):
-        """List all registered functions."""
-        return list(cls.registry.keys())
-
-function_registry = FunctionRegistry()
\ No newline at end of file
+from .registry import FunctionRegistry, function_registry
@@ -0,0 +1,41 @@
+"""
+Declarative manifest of everything the registries can resolve.
+
+Each entry maps a registry name to ``"module:attr"``. Modules are only
+imported when the name is requested through ``Registry.get`` (or
+``function_registry.get``), so a run never pays for the dependencies
+(torch, transformers, playwright, deepeval, ...) of metrics it doesn't use.
+
+When adding a new ``@metric_registry.register(...)`` /
+``@evaluator_registry.register(...)`` / ``@function_registry.register(...)``,
+add the matching entry here so it can be discovered without importing it.
+"""
+
+_METRICS = "lm_act_eval.evaluation_harness.evaluators.metrics"
+_SFT = "lm_act_eval.evaluation_harness.evaluators.sft"
+_HELPERS = "lm_act_eval.evaluation_harness.helper_functions"
+
+METRIC_MANIFEST = {
+  "edit_distance": f"{_METRICS}.external:levenshtein_comparator",
+  "contextual_precision": f"{_METRICS}.external:contextual_precision",
+  "opentable_html": f"{_METRICS}.opentable:opentable_reservation_html",
+  "gpt-v": "lm_act_eval.evaluation_harness.openai.vision.evaluator:GPTVScorer",
+}
+
+EVALUATOR_MANIFEST = {
+  "sft.trajectory": f"{_SFT}.trajectory:AsyncTableTrajectoryEvaluator",
+  "sft.trajectory.table": f"{_SFT}.trajectory:TableTrajectoryEvaluator",
+}
+
+FUNCTION_MANIFEST = {
+  "clean": f"{_HELPERS}.multion:clean_extracted_text",
+  "extract_first": f"{_HELPERS}.multion:extract_first",
+  "extract_thought": f"{_HELPERS}.multion:extract_thought",
+  "extract_action": f"{_HELPERS}.multion:extract_action",
+  "extract_explanation": f"{_HELPERS}.multion:extract_explanation",
+  "extract_status": f"{_HELPERS}.multion:extract_status",
+  "extract_commands": f"{_HELPERS}.multion:extract_commands",
+  "extract_user_info": f"{_HELPERS}.multion:extract_user_info",
+  "parse_completion": f"{_HELPERS}.multion:ParseChatCompletion",
+  "opentable_extract_reservation_details": f"{_HELPERS}.opentable:extract_reservation_info",
+}
@@ -0,0 +1,295 @@
+"""
+OpenAI Batch API runner, for judgments that don't need answers in seconds.
+
+Requests (`{custom_id: request body}`) are written to JSONL batch files, submitted, polled with
+backoff and their results mapped back by `custom_id`; requests that failed with a retryable status
+(408, 409, 429, 5xx, see `utils/resilience.py`) are resubmitted, the others given up on. Batches
+still running after `timeout` seconds are cancelled and their requests given up on.
+Chat requests answered by the LLM response cache (`utils/llm_cache.py`) aren't submitted.
+Batches are half-price and don't count against the synchronous rate limits.
+
+The API calls go through a `BatchTransport`. `OpenAIBatchTransport` talks to the OpenAI API, or
+to any server implementing the files & batches endpoints (e.g. a local stand-in, via `base_url`).
+Configured by the `batch` args of a metric:
+
+    batch:
+      completion_window: 24h
+      poll_interval: 30
+      max_attempts: 3
+      timeout: 90000
+      base_url: http://localhost:8000/v1
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from lm_act_eval.evaluation_harness.utils.llm_cache import CacheMiss, ResponseCache, request_key, response_cache
+from lm_act_eval.evaluation_harness.utils.resilience import RETRYABLE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# per batch file limits of the Batch API (requests and bytes), with some headroom on the size
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+
+# seconds a run waits on its batches: the default 24h completion window, plus an hour to finalize
+DEFAULT_TIMEOUT = 25 * 60 * 60
+
+
+class BatchTransport(ABC):
+    """The Batch API calls a `BatchRunner` needs."""
+
+    @abstractmethod
+    def upload(self, content: bytes, filename: str) -> str:
+        """Uploads a JSONL batch input file, returns its file id."""
+
+    @abstractmethod
+    def create(self, input_file_id: str, endpoint: str, completion_window: str) -> str:
+        """Creates a batch from an uploaded file, returns the batch id."""
+
+    @abstractmethod
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        """The batch, with at least `status`, `output_file_id` and `error_file_id`."""
+
+    @abstractmethod
+    def download(self, file_id: str) -> str:
+        """The content of a (JSONL) output or error file."""
+
+    def cancel(self, batch_id: str) -> None:
+        """Cancels a batch, by default it is left to run."""
+        logger.warning(f"Can't cancel batch {batch_id} through {type(self).__name__}, left running")
+
+
+class OpenAIBatchTransport(BatchTransport):
+    def __init__(self, client=None, base_url: Optional[str] = None):
+        """
+        Args:
+            client (openai.OpenAI, optional): The client to use, created from the environment if None.
+            base_url (str, optional): Another server implementing the files & batches endpoints.
+        """
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(base_url=base_url) if base_url else OpenAI()
+        self.client = client
+
+    def upload(self, content: bytes, filename: str) -> str:
+        return self.client.files.create(file=(filename, content), purpose="batch").id
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str) -> str:
+        return self.client.batches.create(
+            input_file_id=input_file_id, endpoint=endpoint, completion_window=completion_window).id
+
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.model_dump() if hasattr(batch, "model_dump") else dict(batch)
+
+    def download(self, file_id: str) -> str:
+        return self.client.files.content(file_id).text
+
+    def cancel(self, batch_id: str) -> None:
+        self.client.batches.cancel(batch_id)
+
+
+def completion_content(response_body: Dict[str, Any]) -> str:
+    """The message content of a chat completion response body."""
+    return response_body["choices"][0]["message"]["content"]
+
+
+def _is_retryable(status_code: Optional[int], error: Any) -> bool:
+    """Whether a failed request may succeed if resubmitted: it didn't run (no status) or its status is retryable."""
+    return status_code is None or status_code in RETRYABLE_STATUSES
+
+
+class BatchRunner:
+    def __init__(
+        self, transport: Optional[BatchTransport] = None, endpoint: str = CHAT_COMPLETIONS_ENDPOINT,
+        completion_window: str = "24h", poll_interval: float = 30, max_poll_interval: float = 600,
+        max_attempts: int = 3, max_batch_requests: int = MAX_BATCH_REQUESTS, max_batch_bytes: int = MAX_BATCH_BYTES,
+        timeout: Optional[float] = DEFAULT_TIMEOUT):
+        """
+        Args:
+            transport (BatchTransport, optional): Defaults to `OpenAIBatchTransport()`.
+            endpoint (str): The endpoint every request is sent to.
+            completion_window (str): The Batch API completion window.
+            poll_interval (float): Seconds between the first polls, growing by half up to `max_poll_interval`.
+            max_attempts (int): Submissions of a request (failing with a retryable status) before it is given up on.
+            max_batch_requests (int): Requests per batch file.
+            max_batch_bytes (int): Bytes per batch file.
+            timeout (float, optional): Seconds a run waits on its batches, attempts included, before
+                cancelling the unfinished ones. None to wait as long as they run.
+        """
+        self._transport = transport
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_attempts = max_attempts
+        self.max_batch_requests = max_batch_requests
+        self.max_batch_bytes = max_batch_bytes
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config=None, transport: Optional[BatchTransport] = None) -> "BatchRunner":
+        """The runner configured by a `batch` args block, see the module docstring."""
+        config = dict(config or {})
+        base_url = config.pop('base_url', None)
+        if transport is None and base_url:
+            transport = OpenAIBatchTransport(base_url=base_url)
+        return cls(transport=transport, **config)
+
+    @property
+    def transport(self) -> BatchTransport:
+        # created on first use, so a runner can be configured without credentials
+        if self._transport is None:
+            self._transport = OpenAIBatchTransport()
+        return self._transport
+
+    def _batch_files(self, requests: Dict[str, Dict[str, Any]]) -> Iterator[bytes]:
+        lines, size = [], 0
+        for custom_id, body in requests.items():
+            line = json.dumps(
+                {"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": body}).encode() + b"\n"
+            if lines and (len(lines) == self.max_batch_requests or size + len(line) > self.max_batch_bytes):
+                yield b"".join(lines)
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line)
+        if lines:
+            yield b"".join(lines)
+
+    def submit(self, requests: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Uploads and creates the batches of `requests`, returns their ids."""
+        batch_ids = []
+        for i, content in enumerate(self._batch_files(requests)):
+            file_id = self.transport.upload(content, f"batch-{i}.jsonl")
+            batch_ids.append(self.transport.create(file_id, self.endpoint, self.completion_window))
+        logger.info(f"Submitted {len(requests)} requests in {len(batch_ids)} batch(es): {batch_ids}")
+        return batch_ids
+
+    def wait(self, batch_ids: List[str], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Polls the batches with backoff until every one of them is done, or until `deadline`
+        (a `time.monotonic()` time), past which the unfinished ones are cancelled and returned as last seen.
+        """
+        done, interval = {}, self.poll_interval
+        while True:
+            last_seen = {}
+            for batch_id in batch_ids:
+                if batch_id not in done:
+                    batch = self.transport.retrieve(batch_id)
+                    if batch.get("status") in TERMINAL_STATUSES:
+                        done[batch_id] = batch
+                    else:
+                        last_seen[batch_id] = batch
+            if len(done) == len(batch_ids):
+                return [done[batch_id] for batch_id in batch_ids]
+            if deadline is not None and time.monotonic() >= deadline:
+                for batch_id, batch in last_seen.items():
+                    logger.warning(f"Batch {batch_id} still {batch.get('status')} after the timeout, cancelling it")
+                    self.transport.cancel(batch_id)
+                return [done.get(batch_id) or last_seen[batch_id] for batch_id in batch_ids]
+            sleep = interval if deadline is None else max(min(interval, deadline - time.monotonic()), 0)
+            time.sleep(sleep)
+            interval = min(interval * 1.5, self.max_poll_interval)
+
+    def collect(self, batch: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Tuple[Optional[int], Any]]]: The response bodies of the
+                successful requests and the status code (None for requests that didn't run, e.g. of an
+                expired batch) and error of the failed ones, by `custom_id`.
+        """
+        if batch.get("status") != "completed":
+            logger.warning(f"Batch {batch.get('id')} ended {batch.get('status')}: {batch.get('errors')}")
+        results, errors = {}, {}
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            for line in self.transport.download(batch[file_key]).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200 and not record.get("error"):
+                    results[record["custom_id"]] = response["body"]
+                else:
+                    errors[record["custom_id"]] = (
+                        response.get("status_code"), record.get("error") or response.get("body"))
+        return results, errors
+
+    def run(self, requests: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Runs `requests` to completion, resubmitting the ones failing with a retryable status, or
+        whose batch failed, up to `max_attempts` times, within `timeout`.
+
+        Args:
+            requests (Dict[str, Dict[str, Any]]): Request bodies by `custom_id`.
+
+        Returns:
+            Dict[str, Any]: The response body of every successful request, by `custom_id`;
+                requests given up on are missing.
+        """
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        results, pending = {}, dict(requests)
+        for attempt in range(1, self.max_attempts + 1):
+            errors = {}
+            for batch in self.wait(self.submit(pending), deadline):
+                batch_results, batch_errors = self.collect(batch)
+                results.update(batch_results)
+                errors.update(batch_errors)
+            failed = [custom_id for custom_id in pending if custom_id not in results]
+            # client errors (bad request, context length, ...) fail the same way every time
+            given_up = {
+                custom_id: errors[custom_id] for custom_id in failed
+                if custom_id in errors and not _is_retryable(*errors[custom_id])}
+            if given_up:
+                logger.warning(
+                    f"Giving up on {len(given_up)} request(s) failing with a non-retryable status, "
+                    f"e.g. {next(iter(given_up.items()))}")
+            pending = {custom_id: pending[custom_id] for custom_id in failed if custom_id not in given_up}
+            if not pending:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f"Giving up on {len(pending)} request(s), past the {self.timeout}s timeout")
+                break
+            sample = next(((custom_id, errors[custom_id]) for custom_id in pending if custom_id in errors), None)
+            logger.warning(
+                f"{len(pending)} request(s) failed on attempt {attempt}/{self.max_attempts}, e.g. {sample}")
+        return results
+
+    def run_chat(self, requests: Dict[str, Dict[str, Any]], cache: Optional[ResponseCache] = None) -> Dict[str, str]:
+        """
+        `run` for chat completions, returning the message contents. Only the requests missing from
+        the response cache (`cache`, else the process-wide one) are submitted, their responses cached.
+        """
+        cache = cache or response_cache()
+        if cache is None:
+            return {custom_id: completion_content(body) for custom_id, body in self.run(requests).items()}
+
+        def key(body):
+            params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+            return request_key("openai", body.get("model", ""), body.get("messages"), params)
+
+        keys = {custom_id: key(body) for custom_id, body in requests.items()}
+        contents = {}
+        for custom_id, request_hash in keys.items():
+            cached = cache.get(request_hash)
+            if cached is not None:
+                contents[custom_id] = cached
+        missing = {custom_id: body for custom_id, body in requests.items() if custom_id not in contents}
+        if missing and cache.read_only:
+            raise CacheMiss(f"{len(missing)} batch request(s) are not cached ({cache.path}, read-only)")
+        if contents:
+            logger.info(f"{len(contents)} of {len(requests)} batch request(s) answered from the response cache")
+        if missing:
+            for custom_id, body in self.run(missing).items():
+                contents[custom_id] = completion_content(body)
+                cache.put(keys[custom_id], contents[custom_id], "openai", requests[custom_id].get("model", ""))
+        return contents
@@ -1,50 +1,102 @@
-from portkey_ai import Portkey
 from portkey_ai import AsyncPortkey
 
 import os
+import weakref
 from dotenv import load_dotenv
 import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter
+from lm_act_eval.evaluation_harness.utils.llm_cache import acached_completion
+from lm_act_eval.evaluation_harness.utils.telemetry import note_usage, track_call
 
 # Load environment variables
 load_dotenv()
 
-async def match_model_to_virtual_key_env(model):
-  match model:
-    case "gemini-1.5-pro-latest":
-      key = os.getenv("GEMINI_VIRTUAL_KEY")
-    case "gpt4":
-      key = os.getenv("GPT4_VIRTUAL_KEY")
-    case "gpt4-vision":
-      key = os.getenv("GPT4V_VIRTUAL_KEY")
-    case "gpt3.5":
-      key = os.getenv("GPT3.5_VIRTUAL_KEY")
+DEFAULT_MODEL = "gemini-1.5-pro-latest"
+DEFAULT_CONCURRENCY = 8
+# the environment variable holding the key of each model
+VIRTUAL_KEY_ENVS = {
+  "gemini-1.5-pro-latest": "GEMINI_VIRTUAL_KEY",
+  "gpt4": "GPT4_VIRTUAL_KEY",
+  "gpt4-vision": "GPT4V_VIRTUAL_KEY",
+  "gpt3.5": "GPT3.5_VIRTUAL_KEY",
+}
+
+# (api key, virtual key, gateway config) of a client
+ClientKey = Tuple[str, Optional[str], Optional[str]]
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[ClientKey, AsyncPortkey]]" = weakref.WeakKeyDictionary()
+
+
+def model_virtual_key(model: str) -> str:
+  env = VIRTUAL_KEY_ENVS.get(model)
+  key = os.getenv(env) if env else None
   assert key, f"Matching key not found for model {model}"
   return key
 
+async def match_model_to_virtual_key_env(model):
+  return model_virtual_key(model)
+
+
+def client_key(model: str) -> ClientKey:
+    """What a model's client is made of, read from the environment (never written to)."""
+    config = os.getenv("PORTKEY_GPT4_CONFIG") if model.lower().startswith("gpt4") else None
+    return model_virtual_key(model), os.getenv("VIRTUAL_KEY"), config
+
+
+def portkey_client(model: str) -> AsyncPortkey:
+    """
+    The client of `model` on the running event loop, shared by every call with the same keys and
+    gateway config: its connection pool is reused (a pool can't outlive the loop it was opened on).
+    """
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    key = client_key(model)
+    client = clients.get(key)
+    if client is None:
+        api_key, virtual_key, config = key
+        client = AsyncPortkey(api_key=api_key, virtual_key=virtual_key)
+        if model.lower().startswith("gpt4"):
+            client = client.with_options(config=config)
+        clients[key] = client
+    return client
+
+
 async def query_model(
-    user_message, model='gemini-1.5-pro-latest'
+    user_message, model=DEFAULT_MODEL
     ):
     """
-    Reads a message from a file and sends it to the Google Gemini model via Portkey.
-    
+    Sends a message to `model` (Google Gemini by default) via Portkey.
+
     Args:
-    file_path (str): Path to the text file containing the user's message.
+    user_message (str): The user's message.
+    model (str): A model of `VIRTUAL_KEY_ENVS`.
+
+    Responses are cached, see `utils/llm_cache.py`.
     """
-    # Initialize Portkey with your API and virtual keys from environment variables
-    os.environ["PORTKEY_API_KEY"] = await match_model_to_virtual_key_env(model)
-    portkey = AsyncPortkey(
-        api_key=os.getenv("PORTKEY_API_KEY"),  # 
-        virtual_key=os.getenv("VIRTUAL_KEY")   # 
-    )
-    if model.lower().startswith("gpt4"):
-      portkey=portkey.with_options(
-        config=os.getenv("PORTKEY_GPT4_CONFIG"))
+    messages = [{"role": "user", "content": user_message}]
+    return await acached_completion("portkey", model, messages, {}, lambda: _query_model(messages, model))
+
+
+async def aquery_many(
+    user_messages: Sequence[str], model: str = DEFAULT_MODEL, concurrency: int = DEFAULT_CONCURRENCY) -> List[str]:
+    """
+    `query_model` of many messages over the model's pooled client, at most `concurrency` in flight.
+
+    Returns:
+        List[str]: The responses, in the order of `user_messages`.
+    """
+    limiter = ConcurrencyLimiter(concurrency)
+    return await limiter.map(lambda user_message: query_model(user_message, model), user_messages)
+
+
+async def _query_model(messages, model):
+    portkey = portkey_client(model)
     # Invoke chat completions with Google Gemini
-    completion = await portkey.chat.completions.create(
-        messages=[
-            {"role": "user", "content": user_message}
-        ],
-        model=model
-    )
+    with track_call("portkey", model):
+        completion = await portkey.chat.completions.create(
+            messages=messages,
+            model=model
+        )
+        note_usage(getattr(completion, "usage", None))
     # Extract and print the response
-    return completion.choices[0].message.content
\ No newline at end of file
+    return completion.choices[0].message.content
@@ -25,7 +25,6 @@ class Pipeline(ABC):
         pass
    
 from abc import ABC, abstractmethod
-import wandb
 
 @beartype
 class metric(ABC):
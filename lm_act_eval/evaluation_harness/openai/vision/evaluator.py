@@ -1,10 +1,13 @@
+import asyncio
+import logging
 from typing import Any
 from omegaconf import OmegaConf
 from openai import completions
 import pandas
 
-from lm_act_eval.evaluation_harness.utils.url import is_screenshot_url_accessible
+from lm_act_eval.evaluation_harness.utils.url import is_screenshot_url_accessible, screenshots_accessible
 from .gptv import GPTV
+import numpy as np
 import pandas as pd
 from typing import *
 from tqdm.auto import tqdm
@@ -25,12 +28,35 @@ from lm_act_eval.evaluation_harness.helper_functions.multion import (
 
 
 from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
-from lm_act_eval.evaluation_harness.evaluators.metrics.base import DFTableScorer
+from lm_act_eval.evaluation_harness.evaluators.checkpoint import ascore_rows, unscored
+from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter, RateLimiter
+from lm_act_eval.evaluation_harness.evaluators.metrics.base import DFTableScorer, assemble_row_results, metric_args
+from lm_act_eval.evaluation_harness.evaluators.trajectory_index import TrajectoryIndex, trajectory_index
+from lm_act_eval.evaluation_harness.openai.batch import BatchRunner
+from lm_act_eval.evaluation_harness.utils.resilience import DeadlineExceeded, deadline
 
 from lm_act_eval.ontology.inputs import GPTVScorerInput, Optional
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IMAGES_PER_SESSION = 8
+
+# `STEP <n>: SCORE: <score>` then `EXPLANATION: <text>`, up to the next step
+SESSION_STEP_PATTERN = re.compile(
+  r'STEP\s*(\d+)\s*:\s*SCORE:\s*([^\n]*?)\s*(?:\n\s*)?EXPLANATION:\s*([\s\S]*?)\s*(?=\n\s*STEP\s*\d+\s*:|$)')
+
+
+def select_steps(n_steps: int, k: int) -> np.ndarray:
+  """Positions of up to `k` of `n_steps` steps, evenly spaced and always including the last one."""
+  if n_steps <= k:
+    return np.arange(n_steps)
+  return np.unique(np.linspace(n_steps - 1, 0, k).round().astype(int))
+
 @metric_registry.register('gpt-v')
 class GPTVScorer(DFTableScorer):
+    provider = "openai"
+    required_cols = ['QUERY', 'GOAL', 'screenshot']
+
     def __init__(self, config: OmegaConf, *args, **kwargs):
         """
             A description of the entire function, its parameters, and its return types.
@@ -41,11 +67,24 @@ class GPTVScorer(DFTableScorer):
         else: 
           self.gptv = GPTV(**config)
         self.config = config    
+        # concurrent mode (`concurrency` > 1) and API limits, from the metric args
+        args = metric_args(config)
+        self.concurrency = int(args.get('concurrency') or 1)
+        self.max_retries = int(args.get('max_retries', 3))
+        self.rate_limiter = RateLimiter(args.get('requests_per_minute'), args.get('tokens_per_minute'))
+        # seconds a row may take, retries included, before it's left unscored
+        self.row_deadline = args.get('row_deadline')
+        # `mode: batch` scores through the OpenAI Batch API instead, see `evaluate_batch`
+        self.mode = args.get('mode')
+        self.batch_runner = BatchRunner.from_config(args.get('batch')) if self.mode == 'batch' else None
+        # `granularity: session` judges up to `max_images_per_session` screenshots of a session in one request
+        self.granularity = args.get('granularity', 'step')
+        self.max_images_per_session = int(args.get('max_images_per_session') or DEFAULT_MAX_IMAGES_PER_SESSION)
     
     def _process(self):
       assert all([c in self.input_df.columns for c in self.required_cols]), f"Missing all required columns: {self.required_cols}"
-      tqdm.pandas(desc='Determining entry eligibility')
-      self.process_df = self.input_df[self.input_df.progress_apply(self.is_eligible, axis=1)]
+      # one pooled, cached check per distinct screenshot URL (see `utils/url.py`)
+      self.process_df = self.input_df[screenshots_accessible(self.input_df['screenshot'])]
     
     def is_eligible(self, row):
       return is_screenshot_url_accessible(row)
@@ -66,9 +105,44 @@ class GPTVScorer(DFTableScorer):
       prompt = self.eval_prompt.format(**row)
       
       # Generate model completion (assuming this function takes named arguments for text and image)
-      completion = self.gptv.generate_completion(
-        text=prompt, images=[row.screenshot])
+      try:
+        with deadline(self.row_deadline):
+          completion = self.gptv.generate_completion(
+            text=prompt, images=[row.screenshot])
+      except DeadlineExceeded as e:
+        return self._unscored(row, e)
       
+      return self._parse_completion(completion)
+
+    async def ascore_row(self, row):
+      """
+      Async `_synthesize_and_evaluate`, run concurrently over the rows by the async evaluator.
+      """
+      prompt = self.eval_prompt.format(**row)
+      try:
+        with deadline(self.row_deadline):
+          completion = await self.gptv.agenerate_completion(
+            text=prompt, images=[row.screenshot], rate_limiter=self.rate_limiter, max_retries=self.max_retries)
+      except DeadlineExceeded as e:
+        return self._unscored(row, e)
+      return self._parse_completion(completion)
+
+    def _unscored(self, row, error: Exception) -> pd.Series:
+      logger.warning(f"Row {row.name} left unscored, past its {self.row_deadline}s deadline: {error}")
+      # not checkpointed, a resumed run retries the row
+      return unscored(pd.Series({'Score': None, 'Explanation': None}))
+
+    @property
+    def session_prompt(self):
+      # GOAL, QUERY & the number of screenshots (STEPS) of a session
+      return GPTV_EVAL_PROMPTS.get('multion_session')
+
+    @property
+    def supports_async(self) -> bool:
+      # batch mode and session granularity submit every row at once, from `evaluate`
+      return self.mode != 'batch' and self.granularity != 'session' and super().supports_async
+
+    def _parse_completion(self, completion: str) -> pd.Series:
       # Process and split the completion into Score and Explanation
       score, explanation = completion.split('\n', 1)
       score = extract_first(score, 'SCORE')
@@ -79,12 +153,112 @@ class GPTVScorer(DFTableScorer):
         'Explanation': explanation
         })
     
+    def _parse_session_completion(self, completion: str, n_steps: int) -> List[pd.Series]:
+      # steps missing from the completion get no score
+      parsed = {
+        int(step): pd.Series({'Score': score.strip() or None, 'Explanation': explanation.strip() or None})
+        for step, score, explanation in SESSION_STEP_PATTERN.findall(completion)}
+      return [parsed.get(step, pd.Series({'Score': None, 'Explanation': None})) for step in range(1, n_steps + 1)]
+
+    def session_requests(self) -> List[Tuple[pd.Index, str, List[str]]]:
+      """
+      One request per session of the eligible rows: up to `max_images_per_session` of its steps
+      (see `select_steps`), in step order.
+
+      Returns:
+          List[Tuple[pd.Index, str, List[str]]]: The judged rows, the prompt and the screenshots of every request.
+      """
+      index = trajectory_index(self.process_df)
+      if index is None:
+        index = TrajectoryIndex.from_frame(self.process_df)
+      elif not index.aligned_with(self.process_df):
+        # the eligible rows are a subset of the indexed ones, which may lack the session column
+        index = index.restrict(self.process_df)
+      if index is None:
+        raise ValueError("`granularity: session` needs a `session_id` column")
+      requests = []
+      for session in index.sessions:
+        steps = index.session(self.process_df, session)
+        steps = steps.iloc[select_steps(len(steps), self.max_images_per_session)]
+        prompt = self.session_prompt.format(**{**steps.iloc[0].to_dict(), 'STEPS': len(steps)})
+        requests.append((steps.index, prompt, steps['screenshot'].tolist()))
+      return requests
+
+    async def _agenerate_session(self, request):
+      labels, prompt, images = request
+      return await self.gptv.agenerate_completion(
+        text=prompt, images=images, rate_limiter=self.rate_limiter, max_retries=self.max_retries,
+        max_tokens=self.gptv.config.max_tokens * len(labels))
+
+    def evaluate_sessions(self):
+      """
+      Session granularity `evaluate`: one multi-image request per session (sequential, concurrent or
+      through the Batch API, as configured) returning per-step scores, mapped back to the judged rows.
+      Steps left out of a request, or missing from its completion, get no score.
+      """
+      requests = self.session_requests()
+      if self.mode == 'batch':
+        results = self.batch_runner.run_chat({
+          f"session-{i}": self.gptv.completion_body(
+            text=prompt, images=images, max_tokens=self.gptv.config.max_tokens * len(labels))
+          for i, (labels, prompt, images) in enumerate(requests)})
+        completions = [results.get(f"session-{i}") for i in range(len(requests))]
+      elif self.concurrency > 1:
+        completions = asyncio.run(ConcurrencyLimiter(self.concurrency).map(
+          self._agenerate_session, requests, provider=self.provider, desc='Evaluating sessions with GPT-V'))
+      else:
+        completions = [
+          self.gptv.generate_completion(
+            text=prompt, images=images, max_tokens=self.gptv.config.max_tokens * len(labels))
+          for labels, prompt, images in tqdm(requests, desc='Evaluating sessions with GPT-V')]
+      scores, explanations = {}, {}
+      for (labels, _, _), completion in zip(requests, completions):
+        if completion is None:
+          continue
+        for label, step_eval in zip(labels, self._parse_session_completion(completion, len(labels))):
+          scores[label], explanations[label] = step_eval['Score'], step_eval['Explanation']
+      return pd.DataFrame({
+        'Score': pd.Series(scores, dtype=object),
+        'Explanation': pd.Series(explanations, dtype=object),
+      }).reindex(self.process_df.index)
+
     def evaluate(self):
+      if self.granularity == 'session':
+        return self.evaluate_sessions()
+      if self.mode == 'batch':
+        return self.evaluate_batch()
+      if self.concurrency > 1:
+        return asyncio.run(self.aevaluate())
       tqdm.pandas(desc='Evaluating with GPT-V')
       evals = self.process_df.progress_apply(
         self._synthesize_and_evaluate, axis=1)
       return evals
 
+    async def aevaluate(self):
+      """
+      Concurrent `evaluate`: up to `concurrency` completions in flight through the async client,
+      under the requests/tokens per minute limits, with scores put back in input order.
+      """
+      results = await ascore_rows(
+        self.ascore_row, self.process_df, ConcurrencyLimiter(self.concurrency),
+        provider=self.provider, desc='Evaluating with GPT-V')
+      return assemble_row_results(results, self.process_df.index)
+
+    def evaluate_batch(self):
+      """
+      Batch API `evaluate`: one request per row (its position is the `custom_id`), results mapped
+      back to the rows. Rows whose request failed every attempt get no score.
+      """
+      requests = {
+        f"row-{i}": self.gptv.completion_body(text=self.eval_prompt.format(**row), images=[row.screenshot])
+        for i, (_, row) in enumerate(self.process_df.iterrows())}
+      completions = self.batch_runner.run_chat(requests)
+      evals = [
+        self._parse_completion(completions[custom_id]) if custom_id in completions
+        else pd.Series({'Score': None, 'Explanation': None})
+        for custom_id in requests]
+      return assemble_row_results(evals, self.process_df.index)
+
     def _process_result(self, evals):
       return evals['Score'].mean()
     
@@ -1,27 +1,39 @@
+import asyncio
 import base64
 import requests
 import logging
 import os
-import io
 from urllib.parse import urlparse
-import mimetypes
+from contextlib import asynccontextmanager, nullcontext
+import time
 from beartype import beartype
 from typing import *
 
-from openai import OpenAI
-from PIL import Image
+import openai
+from openai import AsyncOpenAI, OpenAI
 
 from .base import Pipeline
 from .constants import ENDPOINTS
+from .images import ImagePreparer
 
 from pathlib import Path
 
+from lm_act_eval.evaluation_harness.evaluators.concurrency import RateLimiter, adaptive_limiter
+from lm_act_eval.evaluation_harness.utils.llm_cache import acached_completion, cached_completion
+from lm_act_eval.evaluation_harness.utils.resilience import attempt_timeout, resilience_policy
+from lm_act_eval.evaluation_harness.utils.telemetry import note_queue_wait, note_usage, track_call
 from lm_act_eval.ontology.config import gptv_config
 
 from lm_act_eval.ontology.inputs import GPTVScorerInput, Optional
 
 DEFAULT_GPTV_CONFIG = gptv_config()
 
+# sampling params of `gptv_config` sent (and keyed in the response cache) when set
+SAMPLING_PARAMS = ("temperature", "top_p")
+
+# seconds before the first retry of an async completion, see `utils/resilience.py`
+RETRY_INITIAL_DELAY = 1
+
 logger = logging.getLogger(__name__)
 
 class GPTV(Pipeline):
@@ -36,6 +48,8 @@ class GPTV(Pipeline):
                 "Please set your OpenAI API key in the environment variable `OPENAI_API_KEY`"
             )
         self.config = config
+        # downscaled, re-encoded & cached screenshots, sent with `detail` = `img_fidelity`
+        self.image_preparer = ImagePreparer.from_config(config)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
@@ -73,19 +87,16 @@ class GPTV(Pipeline):
         return super().process_chat(text)
     
     def encode_image(self, image_input):
-        if isinstance(image_input, str) and Path(image_input).exists():
-            return image_input
-        elif isinstance(image_input, Image.Image):
-            buffered = io.BytesIO()
-            image_input.save(buffered, format="JPEG")
-            return base64.b64encode(buffered.getvalue()).decode('utf-8')
-        else:
-            raise ValueError(f"Unsupported image input type: {type(image_input)} or check {image_input} exist")
+        """The image as a data URL, downscaled for `img_fidelity` and re-encoded (cached by content)."""
+        return self.image_preparer.encode(image_input)
 
     def process_image(self, image_inputs: str | List[str]):
         """
         Process an image input and return a list of image contents.
 
+        Local images are downscaled to the resolution the provider scores at for `img_fidelity`,
+        re-encoded as `img_format` and inlined; URLs are passed through unless `fetch_image_urls`.
+
         Parameters:
             image_input (Union[str, List[str]]): The input image or a list of input images.
                 If a single image is provided, it can be either a URL or a file path.
@@ -97,6 +108,7 @@ class GPTV(Pipeline):
                     - "type" (str): The type of the image content ("image_url").
                     - "image_url" (Dict[str, str]): The URL or base64-encoded image data.
                         - "url" (str): The URL or base64-encoded image data.
+                        - "detail" (str): The configured `img_fidelity`.
 
         Raises:
             None
@@ -104,42 +116,37 @@ class GPTV(Pipeline):
         Examples:
             >>> image_processor = ImageProcessor()
             >>> image_processor.process_image("https://example.com/image.jpg")
-            [{"type": "image_url", "image_url": {"url": "https://example.com/image.jpg"}}]
+            [{"type": "image_url", "image_url": {"url": "https://example.com/image.jpg", "detail": "high"}}]
             >>> image_processor.process_image(["https://example.com/image1.jpg", "image2.jpg"])
-            [{"type": "image_url", "image_url": {"url": "https://example.com/image1.jpg"}},
-             {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,encoded_image_data"}}]
+            [{"type": "image_url", "image_url": {"url": "https://example.com/image1.jpg", "detail": "high"}},
+             {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,encoded_image_data", "detail": "high"}}]
         """
         if not isinstance(image_inputs, list):
             image_inputs = [image_inputs]
-        image_contents = []
-        for image in image_inputs:
-            if self.is_url(image):
-                image_content = {
-                    "type": "image_url", 
-                    "image_url": {"url": image},
-                }
-            else:
-                encoded_image = self.encode_image(image)
-                mime_type, _ = mimetypes.guess_type(image[:30]) if isinstance(image, str) else ("image/jpeg", None)
-                image_content = {
-                    "type": "image_url", 
-                    "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}}
-            image_contents.append(image_content)
-        return image_contents
+        return [self.image_preparer.prepare(image) for image in image_inputs]
     
-    def generate_completion(self, text: str, images: List[str], openai_sdk=True):
+    def generate_completion(self, text: str, images: List[str], openai_sdk=True, max_tokens: Optional[int] = None):
         """
-        generate caption via OpenAI's SDK or API
+        generate caption via OpenAI's SDK or API, `max_tokens` overriding the configured budget.
+        SDK completions go through the LLM response cache (see `utils/llm_cache.py`)
         """
-        composed_message = self.process_input(images, text)
+        body = self.completion_body(text, images, max_tokens)
         if openai_sdk:
+            def create():
+                timeout = attempt_timeout()
+                return self.openai_client.chat.completions.create(
+                    **body, timeout=openai.NOT_GIVEN if timeout is None else timeout)
+
+            def generate():
+                # the SDK retries, the policy bounds the call by the deadline & circuit breaker
+                with track_call("openai", self.config.model):
+                    response = resilience_policy("openai", self.config.model).call(create, max_retries=0)
+                    note_usage(getattr(response, "usage", None))
+                return response.choices[0].message.content
             try:
                 # Assuming this is where the API call that might raise the error is made
-                response = self.openai_client.chat.completions.create(
-                    model=self.config.model,
-                    messages=composed_message,
-                    max_tokens=self.config.max_tokens
-                )
+                return cached_completion(
+                    "openai", body["model"], body["messages"], self.cache_params(body), generate)
             except requests.exceptions.HTTPError as e:
                 # Extracting JSON response from the error, assuming it's in the same format as the BadRequestError example
                 error_response = e.response.json()
@@ -149,13 +156,8 @@ class GPTV(Pipeline):
                 return f"error: {error_message}"
             
         else:
-            payload = {
-                "model": self.config.model,
-                "messages": composed_message,
-                "max_tokens": self.config.max_tokens
-            }
             response = requests.post(
-                self.api_url, headers=self.headers, json=payload)
+                self.api_url, headers=self.headers, json=body)
             try:
                 response.raise_for_status()
                 return response.json()
@@ -165,6 +167,94 @@ class GPTV(Pipeline):
         # response.choices[0].message.content
         return response.choices[0].message.content
     
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        # one client per event loop: its connection pool is bound to the loop it was first used on.
+        # SDK retries are off, callers retry under their own rate limits (see `GPTVScorer`)
+        loop = asyncio.get_running_loop()
+        if getattr(self, '_async_client_loop', None) is not loop:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+            self._async_client_loop = loop
+        return self._async_client
+
+    def estimate_tokens(self, messages: List[Dict], max_tokens: int = 0) -> int:
+        """
+        Rough token count of a request, for tokens-per-minute limiting: ~4 characters per text token,
+        the vision tokens of every image (see `ImagePreparer.tokens`), plus the completion budget.
+        """
+        tokens = max_tokens
+        for message in messages:
+            content = message["content"]
+            for part in content if isinstance(content, list) else [{"type": "text", "text": content}]:
+                if part.get("type") == "image_url":
+                    tokens += self.image_preparer.tokens(part["image_url"])
+                else:
+                    tokens += len(part.get("text", "")) // 4
+        return tokens
+
+    def completion_body(self, text: str, images: List[str], max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """The chat completion request for `text` & `images`, e.g. a Batch API request body."""
+        body = {
+            "model": self.config.model,
+            "messages": self.process_input(images, text),
+            "max_tokens": max_tokens or self.config.max_tokens,
+        }
+        for param in SAMPLING_PARAMS:
+            if getattr(self.config, param, None) is not None:
+                body[param] = getattr(self.config, param)
+        return body
+
+    @staticmethod
+    def cache_params(body: Dict[str, Any]) -> Dict[str, Any]:
+        """The generation params of a request body, as keyed in the response cache (like Batch API requests)."""
+        return {k: v for k, v in body.items() if k not in ("model", "messages")}
+
+    async def agenerate_completion(
+        self, text: str, images: List[str], rate_limiter: Optional[RateLimiter] = None, max_retries: int = 3,
+        max_tokens: Optional[int] = None) -> str:
+        """
+        Async counterpart of `generate_completion` (OpenAI SDK only), for concurrent evaluation.
+
+        With a `rate_limiter`, every attempt waits for its share of the request and token budgets.
+        Attempts run under the model's `adaptive_limiter` and `resilience_policy`, shared by every
+        metric calling it: retryable errors are retried up to `max_retries` times with jittered
+        exponential backoff (at least the `retry-after` asked for), slow attempts are hedged and
+        the current `deadline` bounds the whole; any other error is raised at once. Cached
+        responses are returned without a request.
+        """
+        # image preparation is CPU bound, off the event loop
+        body = await asyncio.to_thread(self.completion_body, text, images, max_tokens)
+        tokens = self.estimate_tokens(body["messages"], body["max_tokens"])
+
+        limiter = adaptive_limiter("openai", body["model"])
+        policy = resilience_policy("openai", body["model"])
+
+        @asynccontextmanager
+        async def queue():
+            # waiting here is neither timed nor hedged, see `ResiliencePolicy.acall`
+            queued_at = time.perf_counter()
+            if rate_limiter is not None:
+                await rate_limiter.acquire(tokens)
+            async with limiter.slot() if limiter is not None else nullcontext():
+                note_queue_wait(time.perf_counter() - queued_at)
+                yield
+
+        async def attempt():
+            if limiter is None:
+                response = await self.async_client.chat.completions.create(**body)
+            else:
+                response = await limiter.create(self.async_client.chat.completions, (openai.RateLimitError,), **body)
+            note_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content
+
+        async def generate():
+            with track_call("openai", body["model"]):
+                return await policy.acall(
+                    attempt, max_retries=max_retries, initial_delay=RETRY_INITIAL_DELAY, slot=queue)
+
+        return await acached_completion(
+            "openai", body["model"], body["messages"], self.cache_params(body), generate)
+
     def __call__(self, *args: Optional[Dict]):
         """
         calls the generate_completion method 
@@ -0,0 +1,242 @@
+"""
+Screenshot preparation before a GPT-V upload.
+
+Images are downscaled to what the provider actually looks at for the requested `detail`
+(`low`: 512px; `high`: within 2048px, shortest side 768px), re-encoded as JPEG or WebP and sent
+as data URLs with `detail` set. Encoded payloads are cached by content hash, in memory and under
+`CACHE_DIR` (least recently used out past `max_bytes`), so the same screenshot is encoded once across
+metrics and reruns. The vision tokens of a payload are kept with it, see `ImagePreparer.tokens`.
+
+Remote URLs are passed through (the provider fetches them) unless `fetch_urls` is set.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image
+
+from lm_act_eval.evaluation_harness.constants import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_CACHE_DIR = Path(CACHE_DIR) / "images"
+DEFAULT_IMAGE_CACHE_MAX_BYTES = 1024 ** 3
+# payloads written between two size checks of the disk cache
+PRUNE_INTERVAL = 100
+
+# the resolution the provider scores an image at, by `detail`
+LOW_DETAIL_SIZE = 512
+HIGH_DETAIL_MAX_SIZE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+TILE_SIZE = 512
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+ImageInput = Union[str, Path, bytes, Image.Image]
+
+
+def target_size(width: int, height: int, detail: str = "high") -> Tuple[int, int]:
+    """The size the provider would rescale a `width` x `height` image to, never upscaling."""
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_SIZE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_SIZE / max(width, height))
+        scale *= min(1.0, HIGH_DETAIL_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def vision_tokens(width: int, height: int, detail: str = "high") -> int:
+    """The vision tokens of an image: a base cost, plus per 512px tile in high detail."""
+    if detail == "low":
+        return 85
+    width, height = target_size(width, height, detail)
+    return 85 + 170 * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+# the most an image of unknown size can cost, by `detail`: 2048 x 768 is 8 tiles in high detail
+MAX_VISION_TOKENS = {
+    detail: vision_tokens(HIGH_DETAIL_MAX_SIZE, HIGH_DETAIL_SHORT_SIDE, detail) for detail in ("low", "high")}
+
+
+def is_url(image: Any) -> bool:
+    if not isinstance(image, str):
+        return False
+    try:
+        parsed = urlparse(image)
+        return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+    except ValueError:
+        return False
+
+
+class ImagePreparer:
+    def __init__(
+        self, detail: str = "high", format: str = "jpeg", quality: int = 85, fetch_urls: bool = False,
+        cache_dir: Optional[Path | str] = DEFAULT_IMAGE_CACHE_DIR, memory_items: int = 256,
+        max_bytes: Optional[int] = DEFAULT_IMAGE_CACHE_MAX_BYTES):
+        """
+        Args:
+            detail (str): `low` or `high`, the GPT-V `detail` level images are prepared (and sent) for.
+            format (str): `jpeg` or `webp`.
+            quality (int): The encoder quality.
+            fetch_urls (bool): Download, downscale and inline remote URLs instead of passing them through.
+            cache_dir (Path | str, optional): Where encoded payloads are cached, None for memory only.
+            memory_items (int): Data URLs kept in memory, least recently used first out.
+            max_bytes (int, optional): Payload bytes kept in `cache_dir`, least recently used first out.
+                None for no bound.
+        """
+        if format not in MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {format}, expected one of {list(MIME_TYPES)}")
+        self.detail = detail
+        self.format = format
+        self.quality = quality
+        self.fetch_urls = fetch_urls
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        # data URL & vision tokens by payload key
+        self._memory: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+        self._tokens: Dict[str, int] = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "ImagePreparer":
+        """The preparer of a `gptv_config`."""
+        return cls(
+            detail=getattr(config, 'img_fidelity', 'high') or 'high',
+            format=getattr(config, 'img_format', 'jpeg'),
+            quality=getattr(config, 'img_quality', 85),
+            fetch_urls=getattr(config, 'fetch_image_urls', False),
+        )
+
+    def _source_bytes(self, image: ImageInput) -> bytes:
+        if isinstance(image, bytes):
+            return image
+        if isinstance(image, Image.Image):
+            # raw pixels, so equal images hash equal however they were obtained
+            return f"{image.mode}{image.size}".encode() + image.tobytes()
+        if is_url(image):
+            response = requests.get(image, timeout=30)
+            response.raise_for_status()
+            return response.content
+        path = Path(image)
+        if not path.exists():
+            raise ValueError(f"Unsupported image input type: {type(image)} or check {image} exist")
+        return path.read_bytes()
+
+    def _encode(self, image: ImageInput, source: bytes) -> bytes:
+        if not isinstance(image, Image.Image):
+            image = Image.open(io.BytesIO(source))
+        size = target_size(*image.size, detail=self.detail)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            # no alpha in JPEG, and screenshots don't need it in WebP either
+            image = image.convert("RGB")
+        buffered = io.BytesIO()
+        if self.format == "jpeg":
+            image.save(buffered, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+        else:
+            image.save(buffered, format="WEBP", quality=self.quality, method=4)
+        return buffered.getvalue()
+
+    def encode(self, image: ImageInput) -> str:
+        """The prepared image as a data URL, from the cache when it was prepared before."""
+        source = self._source_bytes(image)
+        key = hashlib.sha256(
+            source + f"|{self.detail}|{self.format}|{self.quality}".encode()).hexdigest()
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+        path = self.cache_dir / f"{key}.{self.format}" if self.cache_dir is not None else None
+        if path is not None and path.exists():
+            encoded = path.read_bytes()
+            # recently used, see `prune`
+            os.utime(path)
+        else:
+            encoded = self._encode(image, source)
+            if path is not None:
+                self._write(path, encoded)
+        # the header is enough for the size
+        tokens = vision_tokens(*Image.open(io.BytesIO(encoded)).size, detail=self.detail)
+        data_url = f"data:{MIME_TYPES[self.format]};base64,{base64.b64encode(encoded).decode('utf-8')}"
+        with self._lock:
+            self._memory[key] = (data_url, tokens)
+            self._tokens[data_url] = tokens
+            while len(self._memory) > self.memory_items:
+                evicted, _ = self._memory.popitem(last=False)[1]
+                self._tokens.pop(evicted, None)
+        return data_url
+
+    def _write(self, path: Path, encoded: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside then renamed, concurrent writers never expose a partial file
+        partial = path.with_suffix(f".{threading.get_ident()}.tmp")
+        partial.write_bytes(encoded)
+        partial.replace(path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_INTERVAL == 1
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drops the least recently used payloads of `cache_dir` past `max_bytes`."""
+        if self.cache_dir is None or self.max_bytes is None or not self.cache_dir.exists():
+            return 0
+        files = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix.lstrip('.') in MIME_TYPES:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        excess, pruned = sum(size for _, size, _ in files) - self.max_bytes, 0
+        for _, size, path in sorted(files):
+            if excess <= 0:
+                break
+            path.unlink(missing_ok=True)
+            excess -= size
+            pruned += 1
+        if pruned:
+            logger.info(f"Pruned {pruned} cached image(s) from {self.cache_dir}")
+        return pruned
+
+    def tokens(self, image_url: Dict[str, Any]) -> int:
+        """
+        The vision tokens of an `image_url` content: those of its prepared size for payloads of this
+        preparer or other data URLs, the most an image can cost at its `detail` for remote URLs.
+        """
+        url, detail = image_url.get("url"), image_url.get("detail", "high")
+        with self._lock:
+            tokens = self._tokens.get(url)
+        if tokens is not None:
+            return tokens
+        if detail != "low" and isinstance(url, str) and url.startswith("data:"):
+            try:
+                image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+                return vision_tokens(*image.size, detail=detail)
+            except Exception as e:
+                logger.debug(f"Reading the size of an inline image failed: {e}")
+        return MAX_VISION_TOKENS.get(detail, MAX_VISION_TOKENS["high"])
+
+    def prepare(self, image: ImageInput) -> Dict[str, Any]:
+        """The `image_url` message content of an image."""
+        if is_url(image) and not self.fetch_urls:
+            url = image
+        else:
+            url = self.encode(image)
+        return {"type": "image_url", "image_url": {"url": url, "detail": self.detail}}
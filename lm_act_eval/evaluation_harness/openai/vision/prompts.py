@@ -2,6 +2,7 @@ GPTV_EVAL_PROMPTS = {
   "multion_trajectory": "Given the goal: {GOAL}, and the specific web navigation query: {QUERY} Score the screenshot on a rating between 0 to 100 to reflect how close the user is to completing their task, where 100 signifies task completion and 0 indicates no progress. Explain the score on the basis of user actions needed to proceed and indicators of progress towards the task completion. Start your response with 'SCORE: ' and follow the score with 'EXPLANATION: ' on a new line, offering a detailed explanation of your rating based on elements visible in the screenshot and how they relate to the goal and query. Consider factors such as relevant information displayed, user actions needed to proceed, and any indicators of progress towards the task completion.",
   "draft": "The user were given the following web navigation task:\n{GOAL}.With the intention to do the following task in the web:{QUERY}.\nStart with 'SCORE:\n' and rate the screenshot image on 0-100 based on how close it is to completing the task and in a new line after 'EXPLANATION:\n' include an explanation of the screenshot image.",
   "experimental": "Given an overall task objective: {GOAL}, and the specific web navigation query: {QUERY}, analyze the provided screenshot of the user's current web page. Start your response with 'SCORE: ', giving a rating between 0 to 100 to reflect how close the user is to completing their task, where 100 signifies task completion and 0 indicates no progress, such as being in the homepage or have not began the search. Follow the score with 'EXPLANATION: ' on a new line, offering a detailed explanation of your rating based on elements visible in the screenshot and how they relate to the goal and query. Consider factors such as relevant information displayed, user actions needed to proceed, and any indicators of progress towards the task completion.",
+  "multion_session": "Given the goal: {GOAL}, and the specific web navigation query: {QUERY} The {STEPS} screenshots are successive steps of one web navigation session, in order. Score each screenshot on a rating between 0 to 100 to reflect how close the user is to completing their task at that step, where 100 signifies task completion and 0 indicates no progress. For every screenshot, in order, write 'STEP <n>: SCORE: <score>' with n from 1 to {STEPS}, followed by 'EXPLANATION: ' on a new line, offering a short explanation of the rating based on elements visible in the screenshot, the user actions needed to proceed and the progress since the previous step.",
 }
 
 DEFAULT_EVAL_PROMPT = GPTV_EVAL_PROMPTS.get('multion_trajectory')
\ No newline at end of file
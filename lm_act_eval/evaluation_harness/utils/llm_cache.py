@@ -0,0 +1,299 @@
+"""
+Persistent cache of LLM responses, shared by every judge call path.
+
+Responses are stored in SQLite under `CACHE_DIR`, keyed by a canonical hash of (provider, model,
+messages, generation params): inline images (data URLs, bytes, PIL images) enter the key as
+digests, so equal requests hit whatever path built them. Entries older than `max_age` and, past
+`max_bytes`, the least recently used ones are evicted. `read_only` replays a cache without ever
+writing it, a miss then raises `CacheMiss` instead of calling the model.
+
+    cache = response_cache()
+    response = cache.complete("openai", model, messages, {"temperature": 0}, lambda: call(messages))
+
+The process-wide cache is opt-in: nothing is cached until it is configured, by the top-level
+`llm_cache` block (`enabled: false` disables it) or `set_response_cache`. `lm_act_eval --replay`
+makes it read-only:
+
+    llm_cache:
+      path: .cache/llm_responses.sqlite
+      max_bytes: 2147483648
+      max_age_days: 30
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from lm_act_eval.evaluation_harness.constants import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_CACHE_PATH = Path(CACHE_DIR) / "llm_responses.sqlite"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+# puts between two size checks
+EVICTION_INTERVAL = 100
+
+
+class CacheMiss(KeyError):
+    """A request that isn't cached, in read-only mode."""
+
+
+def _digest(data: bytes) -> str:
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, str):
+        if value.startswith("data:") and ";base64," in value[:64]:
+            header, payload = value.split(",", 1)
+            return f"{header},{_digest(payload.encode())}"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Mapping):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) or type(value).__name__ == "ListConfig":
+        return [_canonical(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return _digest(bytes(value))
+    if hasattr(value, "tobytes") and hasattr(value, "size"):
+        # PIL images (e.g. Gemini prompts)
+        return _digest(f"{getattr(value, 'mode', '')}{value.size}".encode() + value.tobytes())
+    return repr(value)
+
+
+def request_key(provider: str, model: str, messages: Any, params: Optional[Dict[str, Any]] = None) -> str:
+    """The canonical hash of a request, see the module docstring."""
+    payload = json.dumps(
+        [provider, model, _canonical(messages), _canonical(params or {})],
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self, path: Path | str = DEFAULT_LLM_CACHE_PATH, max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        max_age: Optional[float] = DEFAULT_MAX_AGE, read_only: bool = False):
+        """
+        Args:
+            path (Path | str): The SQLite database.
+            max_bytes (int, optional): Response bytes kept, least recently used first out. None for no bound.
+            max_age (float, optional): Seconds a response is kept. None for no bound.
+            read_only (bool): Serve cached responses only, misses raise `CacheMiss`.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.read_only = read_only
+        self.hits = self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, provider TEXT NOT NULL, "
+                    "model TEXT NOT NULL, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.evict()
+
+    @classmethod
+    def from_config(cls, config=None, read_only: bool = False) -> Optional["ResponseCache"]:
+        """The cache configured by an `llm_cache` block, None without one or when disabled."""
+        if config is None:
+            return None
+        config = dict(config)
+        if config.get('enabled', True) is False:
+            return None
+        max_age_days = config.get('max_age_days', DEFAULT_MAX_AGE / 86400)
+        return cls(
+            path=config.get('path') or DEFAULT_LLM_CACHE_PATH,
+            max_bytes=config.get('max_bytes', DEFAULT_MAX_BYTES),
+            max_age=max_age_days * 86400 if max_age_days is not None else None,
+            read_only=read_only or bool(config.get('read_only', False)),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread (and per process)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+            else:
+                conn = sqlite3.connect(self.path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in ('_lock', '_local')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response of `key`, None if missing or expired."""
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as e:
+            # a read-only cache that was never written
+            logger.debug(f"Reading {self.path} failed: {e}")
+            row = None
+        if row is not None and self.max_age is not None and row[1] < now - self.max_age:
+            row = None
+        self._count(row is not None)
+        if row is None:
+            return None
+        if not self.read_only:
+            with self._connection() as conn:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, response: str, provider: str = "", model: str = "") -> None:
+        if self.read_only or not isinstance(response, str) or not response:
+            # empty responses are failures of the providers' helpers, worth asking again
+            return
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, len(response.encode()), now, now))
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % EVICTION_INTERVAL == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drops the expired responses, then the least recently used ones past `max_bytes`."""
+        if self.read_only:
+            return 0
+        evicted = 0
+        with self._connection() as conn:
+            if self.max_age is not None:
+                evicted += conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)).rowcount
+            if self.max_bytes is not None:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    # the oldest accesses making up the excess
+                    cutoff, excess = None, total - self.max_bytes
+                    for accessed_at, size in conn.execute("SELECT accessed_at, size FROM responses ORDER BY accessed_at"):
+                        excess -= size
+                        cutoff = accessed_at
+                        if excess <= 0:
+                            break
+                    evicted += conn.execute("DELETE FROM responses WHERE accessed_at <= ?", (cutoff,)).rowcount
+        if evicted:
+            logger.info(f"Evicted {evicted} cached response(s) from {self.path}")
+        return evicted
+
+    def complete(
+        self, provider: str, model: str, messages: Any, params: Optional[Dict[str, Any]],
+        generate: Callable[[], str]) -> str:
+        """The cached response of the request, else `generate()`'s, cached."""
+        key = request_key(provider, model, messages, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if self.read_only:
+            raise CacheMiss(f"{provider}/{model} request {key[:12]} is not cached ({self.path}, read-only)")
+        response = generate()
+        self.put(key, response, provider, model)
+        return response
+
+    async def acomplete(
+        self, provider: str, model: str, messages: Any, params: Optional[Dict[str, Any]],
+        generate: Callable[[], Awaitable[str]]) -> str:
+        """Async `complete`."""
+        key = request_key(provider, model, messages, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if self.read_only:
+            raise CacheMiss(f"{provider}/{model} request {key[:12]} is not cached ({self.path}, read-only)")
+        response = await generate()
+        self.put(key, response, provider, model)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process, and the size of the cache."""
+        try:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.OperationalError:
+            entries, size = 0, 0
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries, "bytes": size,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def configure_response_cache(config=None, read_only: bool = False) -> Optional[ResponseCache]:
+    """Sets the process-wide cache from an `llm_cache` block (see `ResponseCache.from_config`)."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = ResponseCache.from_config(config, read_only=read_only)
+        return _response_cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+    """Sets (or, with None, disables) the process-wide cache."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = cache
+
+
+def response_cache() -> Optional[ResponseCache]:
+    """The process-wide cache, None unless configured (or when disabled)."""
+    with _response_cache_lock:
+        return _response_cache
+
+
+def cached_completion(
+    provider: str, model: str, messages: Any, params: Optional[Dict[str, Any]], generate: Callable[[], str]) -> str:
+    """`ResponseCache.complete` on the process-wide cache, `generate()` if it's disabled."""
+    cache = response_cache()
+    if cache is None:
+        return generate()
+    return cache.complete(provider, model, messages, params, generate)
+
+
+async def acached_completion(
+    provider: str, model: str, messages: Any, params: Optional[Dict[str, Any]],
+    generate: Callable[[], Awaitable[str]]) -> str:
+    """Async `cached_completion`."""
+    cache = response_cache()
+    if cache is None:
+        return await generate()
+    return await cache.acomplete(provider, model, messages, params, generate)
@@ -0,0 +1,389 @@
+"""
+Deadlines, hedging, circuit breaking and retries of LLM provider calls.
+
+Every provider call goes through the `resilience_policy(provider, model)` of its model:
+
+* errors are split into retryable ones (rate limits, timeouts, connection errors, 408/409/429/5xx)
+  and the others (e.g. a 400), raised at once: `is_retryable`;
+* each attempt is bounded by `call_timeout` and by the current `deadline` (e.g. a row's), whose
+  expiry raises `DeadlineExceeded` instead of another retry;
+* async attempts slower than the model's recent `hedge_quantile` latency are hedged: a duplicate
+  request is sent, the first answer wins and the other is cancelled. The local queue of an attempt
+  (its rate and concurrency limits, the `slot` of `acall`) is neither timed nor hedged;
+* `failure_threshold` consecutive outage errors (retryable errors other than rate limits) open
+  the model's circuit: calls fail fast with `CircuitOpenError` for `reset_timeout` seconds, then
+  a single probe call decides whether it closes again.
+
+    with deadline(60):
+        response = await resilience_policy("openai", model).acall(lambda: client.chat.completions.create(**body))
+
+Configured by the top-level `resilience` block (`enabled: false` disables it):
+
+    resilience:
+      call_timeout: 120
+      hedge_quantile: 0.95
+      failure_threshold: 5
+      reset_timeout: 30
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import AsyncExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import error_headers, retry_after
+from lm_act_eval.evaluation_harness.utils.telemetry import note_retry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_CALL_TIMEOUT = 120
+DEFAULT_HEDGE_QUANTILE = 0.95
+# latencies observed before hedging, and kept for the quantile
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_LATENCY_WINDOW = 200
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+# SDK errors raised without a status (connection errors, timeouts, or built without a response)
+RETRYABLE_NAMES = ("RateLimit", "Timeout", "Connection", "InternalServer", "ServiceUnavailable", "Overloaded")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("lm_act_eval_deadline", default=None)
+_attempt_timeout: ContextVar[Optional[float]] = ContextVar("lm_act_eval_attempt_timeout", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The current `deadline` passed before the call succeeded."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider/model circuit is open, the call wasn't attempted."""
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for source in (error, getattr(error, "response", None)):
+        for attr in ("status_code", "status", "code"):
+            value = getattr(source, attr, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether another attempt may succeed: rate limits, timeouts, connection and server errors."""
+    if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return any(name in type(error).__name__ for name in RETRYABLE_NAMES)
+
+
+def is_outage(error: BaseException) -> bool:
+    """A retryable error that isn't a rate limit, what the circuit breaker counts."""
+    return is_retryable(error) and _status(error) != 429 and "RateLimit" not in type(error).__name__
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Bounds the calls made inside (in this context, its tasks and threads started with `to_thread`); nests to the earliest."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def attempt_timeout() -> Optional[float]:
+    """The timeout of the current sync attempt (see `ResiliencePolicy.call`), for the SDK call."""
+    return _attempt_timeout.get()
+
+
+class LatencyWindow:
+    """The latencies of the last `size` successful calls."""
+
+    def __init__(self, size: int = DEFAULT_LATENCY_WINDOW):
+        self._latencies: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class CircuitBreaker:
+    def __init__(
+        self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        name: str = ""):
+        """
+        Args:
+            failure_threshold (int): Consecutive outage errors opening the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a probe call.
+            name (str): For the logs, e.g. `openai/gpt-4`.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def check(self) -> None:
+        """Raises `CircuitOpenError` while open; lets a single probe through once `reset_timeout` passed."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            waited = now - self.opened_at
+            # a probe that never reported back (e.g. cancelled) is replaced after `reset_timeout`
+            if waited >= self.reset_timeout and (self._probe_at is None or now - self._probe_at >= self.reset_timeout):
+                self._probe_at = now
+                return
+        raise CircuitOpenError(
+            f"{self.name or 'Provider'} circuit is open after {self.failures} failures, "
+            f"retrying in {max(self.reset_timeout - waited, 0):.0f}s")
+
+    def record(self, error: Optional[BaseException] = None) -> None:
+        """The outcome of a call: any answer of the server (even an error) closes the circuit, an outage counts."""
+        if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+            # the caller gave up, the server didn't answer either way
+            return
+        with self._lock:
+            self._probe_at = None
+            if error is None or not is_outage(error):
+                if self.opened_at is not None:
+                    logger.info(f"{self.name or 'Provider'} circuit closed")
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"{self.name or 'Provider'} circuit opened after {self.failures} failures: {error}")
+                self.opened_at = time.monotonic()
+
+
+async def hedged(
+    make_call: Callable[[], Awaitable[T]], after: Optional[float], max_hedges: int = 1,
+    latencies: Optional[LatencyWindow] = None) -> T:
+    """
+    `await make_call()`, plus up to `max_hedges` duplicates each started when the previous one is
+    `after` seconds old. The first to succeed wins and the others are cancelled; if all fail, the
+    first error is raised.
+    """
+    tasks: Dict[asyncio.Task, float] = {}
+    errors = []
+
+    def launch():
+        tasks[asyncio.ensure_future(make_call())] = time.perf_counter()
+
+    launch()
+    launched = 1
+    try:
+        while tasks:
+            can_hedge = after is not None and launched <= max_hedges
+            done, _ = await asyncio.wait(
+                tasks, timeout=after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.debug(f"Hedging a call slower than {after:.2f}s")
+                launch()
+                launched += 1
+                continue
+            for task in done:
+                started = tasks.pop(task)
+                if task.exception() is None:
+                    if latencies is not None:
+                        latencies.observe(time.perf_counter() - started)
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ResiliencePolicy:
+    def __init__(
+        self, call_timeout: Optional[float] = DEFAULT_CALL_TIMEOUT, hedge_quantile: Optional[float] = DEFAULT_HEDGE_QUANTILE,
+        hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES, max_hedges: int = 1,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        name: str = ""):
+        """
+        Args:
+            call_timeout (float, optional): Seconds per attempt, None for no bound besides the `deadline`.
+            hedge_quantile (float, optional): Latency quantile after which an async attempt is hedged, None to never hedge.
+            hedge_min_samples (int): Successful calls observed before hedging.
+            max_hedges (int): Duplicates of an attempt at most.
+            failure_threshold (int): Consecutive outage errors opening the circuit.
+            reset_timeout (float): Seconds the circuit stays open.
+            name (str): For the logs, e.g. `openai/gpt-4`.
+        """
+        self.call_timeout = call_timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedges = max_hedges
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, name)
+        self.latencies = LatencyWindow()
+
+    @classmethod
+    def from_config(cls, config=None, name: str = "") -> "ResiliencePolicy":
+        """The policy of a `resilience` block; `enabled: false` keeps only the error split and the deadlines."""
+        config = dict(config or {})
+        if config.get('enabled', True) is False:
+            return cls(call_timeout=None, hedge_quantile=None, failure_threshold=float('inf'), name=name)
+        return cls(
+            call_timeout=config.get('call_timeout', DEFAULT_CALL_TIMEOUT),
+            hedge_quantile=config.get('hedge_quantile', DEFAULT_HEDGE_QUANTILE),
+            hedge_min_samples=config.get('hedge_min_samples', DEFAULT_HEDGE_MIN_SAMPLES),
+            max_hedges=config.get('max_hedges', 1),
+            failure_threshold=config.get('failure_threshold', DEFAULT_FAILURE_THRESHOLD),
+            reset_timeout=config.get('reset_timeout', DEFAULT_RESET_TIMEOUT),
+            name=name,
+        )
+
+    def hedge_after(self) -> Optional[float]:
+        """Seconds after which an attempt is hedged, None until enough latencies are known."""
+        if self.hedge_quantile is None or self.max_hedges <= 0 or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    def _timeout(self) -> Optional[float]:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"{self.name or 'Call'}: deadline passed")
+        bounds = [t for t in (self.call_timeout, left) if t is not None]
+        return min(bounds) if bounds else None
+
+    def _backoff(self, error: Exception, attempt: int, max_retries: int, delay: float) -> float:
+        """The seconds to wait before retrying `error`, else raises (it, or `DeadlineExceeded`)."""
+        self.breaker.record(error)
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"{self.name or 'Call'}: deadline passed") from error
+        if not is_retryable(error) or attempt == max_retries:
+            raise error
+        # at least what the provider asks for
+        wait = max(delay, retry_after(error_headers(error)) or 0)
+        if left is not None and wait >= left:
+            raise DeadlineExceeded(f"{self.name or 'Call'}: no time left for another attempt") from error
+        note_retry(error, wait)
+        logger.warning(f"{self.name}: {type(error).__name__} on attempt {attempt + 1}, retrying in {wait:.1f}s")
+        return wait
+
+    async def acall(
+        self, make_call: Callable[[], Awaitable[T]], max_retries: int = 3, initial_delay: float = 1,
+        slot: Optional[Callable[[], AsyncContextManager]] = None) -> T:
+        """
+        `await make_call()` with hedged, timed out attempts, retried with jittered exponential
+        backoff on retryable errors, under the circuit breaker and the current deadline.
+
+        `slot()` is the local queue of an attempt (rate and concurrency limits): it's entered before
+        the attempt's timeout and hedging start, so only the request is timed and hedged (hedges share
+        the slot), and waiting in it is bounded by the deadline alone, never counted as a failure.
+        """
+        delay = initial_delay
+        for attempt in range(max_retries + 1):
+            self.breaker.check()
+            try:
+                result = await self._attempt(make_call, slot)
+            except Exception as e:
+                delay *= 2 * (1 + random.random())
+                await asyncio.sleep(self._backoff(e, attempt, max_retries, delay))
+                continue
+            self.breaker.record()
+            return result
+
+    async def _attempt(
+        self, make_call: Callable[[], Awaitable[T]], slot: Optional[Callable[[], AsyncContextManager]]) -> T:
+        async with AsyncExitStack() as stack:
+            if slot is not None:
+                try:
+                    async with asyncio.timeout(remaining()):
+                        await stack.enter_async_context(slot())
+                except TimeoutError:
+                    raise DeadlineExceeded(f"{self.name or 'Call'}: deadline passed while queued") from None
+            return await asyncio.wait_for(
+                hedged(make_call, self.hedge_after(), self.max_hedges, self.latencies), self._timeout())
+
+    def call(self, func: Callable[[], T], max_retries: int = 3, initial_delay: float = 1) -> T:
+        """
+        Sync `acall`, without hedging: `func` should bound its request by `attempt_timeout()`
+        (e.g. the SDK's `timeout`), a blocking call can't be cancelled.
+        """
+        delay = initial_delay
+        for attempt in range(max_retries + 1):
+            self.breaker.check()
+            token = _attempt_timeout.set(self._timeout())
+            started = time.perf_counter()
+            try:
+                result = func()
+            except Exception as e:
+                delay *= 2 * (1 + random.random())
+                time.sleep(self._backoff(e, attempt, max_retries, delay))
+                continue
+            finally:
+                _attempt_timeout.reset(token)
+            self.latencies.observe(time.perf_counter() - started)
+            self.breaker.record()
+            return result
+
+
+_policies: Dict[Tuple[str, str], ResiliencePolicy] = {}
+_policy_config: Any = None
+_policies_lock = threading.Lock()
+
+
+def configure_resilience(config=None) -> None:
+    """Sets the `resilience` block of the policies created from now on."""
+    global _policy_config
+    with _policies_lock:
+        _policy_config = config
+        _policies.clear()
+
+
+def resilience_policy(provider: str, model: str) -> ResiliencePolicy:
+    """The process-wide policy of a model, its circuit and latencies shared by every metric calling it."""
+    with _policies_lock:
+        key = (provider, model)
+        if key not in _policies:
+            _policies[key] = ResiliencePolicy.from_config(_policy_config, name=f"{provider}/{model}")
+        return _policies[key]
@@ -0,0 +1,349 @@
+"""
+LLM call telemetry: latency, queue wait, tokens, retries, rate-limit sleeps and errors.
+
+Every provider call runs inside `track_call(provider, model)` (or a function decorated with
+`instrumented(provider)`), which times it and attributes it to the metric being scored
+(`metric_context`, set by the evaluators). Code running within the call reports what happens
+to it through the `note_*` functions, no-ops outside a call:
+
+    with track_call("openai", model):
+        note_queue_wait(waited)
+        note_retry(error, delay)
+        note_usage(response.usage)
+
+Totals are kept per (metric, provider, model) for the whole process (calls made by process
+scheduler workers stay in their process). After a run they are written as Prometheus histograms
+and counters (text exposition format, e.g. for the node exporter's textfile collector) and
+logged as a summary table, configured by the top-level `telemetry` block:
+
+    telemetry:
+      prometheus_path: .cache/llm_telemetry.prom
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from lm_act_eval.evaluation_harness.constants import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMETHEUS_PATH = Path(CACHE_DIR) / "llm_telemetry.prom"
+# seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = "lm_act_eval_llm"
+
+_metric: ContextVar[str] = ContextVar("lm_act_eval_metric", default="")
+_call: ContextVar[Optional["CallRecord"]] = ContextVar("lm_act_eval_llm_call", default=None)
+
+
+@contextmanager
+def metric_context(metric_name: str) -> Iterator[None]:
+    """
+    Attributes the LLM calls made within to a metric, including those of the asyncio tasks and
+    `asyncio.to_thread` calls started within (plain threads don't inherit it).
+    """
+    token = _metric.set(metric_name)
+    try:
+        yield
+    finally:
+        _metric.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(`le`, cumulative count) of every bucket, as exported."""
+        total, rows = 0, []
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimated like Prometheus' `histogram_quantile`: linear within the bucket."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class CallRecord:
+    """What happened to one call, reported through the `note_*` functions."""
+
+    def __init__(self):
+        self.queue_wait = 0.0
+        self.retries = 0
+        self.rate_limit_sleeps = 0
+        self.rate_limit_sleep_seconds = 0.0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.errors: List[str] = []
+
+
+class CallStats:
+    """Totals of the calls of a (metric, provider, model)."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limit_sleeps = 0
+        self.rate_limit_sleep_seconds = 0.0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.errors: Counter = Counter()
+
+    def add(self, latency: float, record: CallRecord) -> None:
+        self.calls += 1
+        self.latency.observe(latency)
+        self.queue_wait.observe(record.queue_wait)
+        self.retries += record.retries
+        self.rate_limit_sleeps += record.rate_limit_sleeps
+        self.rate_limit_sleep_seconds += record.rate_limit_sleep_seconds
+        self.tokens_in += record.tokens_in
+        self.tokens_out += record.tokens_out
+        self.errors.update(record.errors)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class LLMTelemetry:
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str, str], CallStats] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def call(self, provider: str, model: str) -> Iterator[CallRecord]:
+        """Times a provider call, see the module docstring. Errors escaping it are counted by class."""
+        record = CallRecord()
+        token = _call.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.errors.append(type(e).__name__)
+            raise
+        finally:
+            _call.reset(token)
+            latency = time.perf_counter() - start
+            key = (_metric.get(), provider or "", str(model or ""))
+            with self._lock:
+                self._stats.setdefault(key, CallStats()).add(latency, record)
+
+    def stats(self) -> Dict[Tuple[str, str, str], CallStats]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self) -> pd.DataFrame:
+        """One row per (metric, provider, model)."""
+        rows = []
+        for (metric, provider, model), stats in sorted(self.stats().items()):
+            rows.append({
+                "metric": metric, "provider": provider, "model": model,
+                "calls": stats.calls,
+                "errors": sum(stats.errors.values()),
+                "retries": stats.retries,
+                "rate_limit_sleeps": stats.rate_limit_sleeps,
+                "rate_limit_sleep_s": round(stats.rate_limit_sleep_seconds, 3),
+                "latency_mean_s": round(stats.latency.mean, 3),
+                "latency_p50_s": round(stats.latency.quantile(0.5), 3),
+                "latency_p95_s": round(stats.latency.quantile(0.95), 3),
+                "queue_wait_mean_s": round(stats.queue_wait.mean, 3),
+                "tokens_in": stats.tokens_in,
+                "tokens_out": stats.tokens_out,
+            })
+        return pd.DataFrame(rows, columns=[
+            "metric", "provider", "model", "calls", "errors", "retries", "rate_limit_sleeps",
+            "rate_limit_sleep_s", "latency_mean_s", "latency_p50_s", "latency_p95_s", "queue_wait_mean_s",
+            "tokens_in", "tokens_out"])
+
+    def to_prometheus(self) -> str:
+        """The totals in the Prometheus text exposition format."""
+        stats = sorted(self.stats().items())
+        lines = []
+
+        def histogram(name: str, help: str, attr: str):
+            lines.extend([f"# HELP {METRIC_PREFIX}_{name} {help}", f"# TYPE {METRIC_PREFIX}_{name} histogram"])
+            for (metric, provider, model), call_stats in stats:
+                hist = getattr(call_stats, attr)
+                for bound, count in hist.cumulative():
+                    labels = _labels(metric=metric, provider=provider, model=model, le=bound)
+                    lines.append(f"{METRIC_PREFIX}_{name}_bucket{labels} {count}")
+                labels = _labels(metric=metric, provider=provider, model=model)
+                lines.append(f"{METRIC_PREFIX}_{name}_sum{labels} {hist.sum}")
+                lines.append(f"{METRIC_PREFIX}_{name}_count{labels} {hist.count}")
+
+        def counter(name: str, help: str, values: Callable[[CallStats], Dict[Tuple[str, str], float]]):
+            lines.extend([f"# HELP {METRIC_PREFIX}_{name} {help}", f"# TYPE {METRIC_PREFIX}_{name} counter"])
+            for (metric, provider, model), call_stats in stats:
+                for extra, value in values(call_stats).items():
+                    labels = _labels(metric=metric, provider=provider, model=model, **dict([extra] if extra else []))
+                    lines.append(f"{METRIC_PREFIX}_{name}{labels} {value}")
+
+        histogram("call_seconds", "Wall latency of LLM provider calls, retries included.", "latency")
+        histogram("queue_wait_seconds", "Time LLM calls waited for a rate or concurrency limit.", "queue_wait")
+        counter("calls_total", "LLM provider calls.", lambda s: {None: s.calls})
+        counter("tokens_total", "Tokens sent (in) and generated (out).",
+                lambda s: {("direction", "in"): s.tokens_in, ("direction", "out"): s.tokens_out})
+        counter("retries_total", "Retried LLM call attempts.", lambda s: {None: s.retries})
+        counter("rate_limit_sleeps_total", "Sleeps after a rate limit error.", lambda s: {None: s.rate_limit_sleeps})
+        counter("rate_limit_sleep_seconds_total", "Seconds slept after rate limit errors.",
+                lambda s: {None: s.rate_limit_sleep_seconds})
+        counter("errors_total", "LLM call errors, by class (retried ones included).",
+                lambda s: {("error", error): count for error, count in s.errors.items()})
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path | str = DEFAULT_PROMETHEUS_PATH) -> Path:
+        """Writes `to_prometheus()` to `path`, atomically (scrapers never read a partial file)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        partial.write_text(self.to_prometheus())
+        partial.replace(path)
+        return path
+
+    def report(self, config=None) -> Optional[pd.DataFrame]:
+        """Writes the Prometheus file (`prometheus_path` of a `telemetry` block) and logs the summary table."""
+        config = dict(config or {})
+        summary = self.summary()
+        if summary.empty:
+            return None
+        path = self.write_prometheus(config.get("prometheus_path") or DEFAULT_PROMETHEUS_PATH)
+        logger.info(f"LLM calls (metrics written to {path}):\n{summary.to_string(index=False)}")
+        return summary
+
+
+_telemetry = LLMTelemetry()
+
+
+def telemetry() -> LLMTelemetry:
+    """The process-wide telemetry."""
+    return _telemetry
+
+
+def track_call(provider: str, model: str):
+    """`LLMTelemetry.call` on the process-wide telemetry."""
+    return _telemetry.call(provider, model)
+
+
+def instrumented(provider: str, model_args: Sequence[str] = ("model", "engine")):
+    """
+    Decorates a (sync or async) provider call with `track_call`, the model being the first of
+    `model_args` passed as keyword argument.
+    """
+    def decorator(func):
+        def model_of(kwargs):
+            return next((kwargs[name] for name in model_args if kwargs.get(name)), "")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_call(provider, model_of(kwargs)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_call(provider, model_of(kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _current() -> Optional[CallRecord]:
+    return _call.get()
+
+
+def note_queue_wait(seconds: float) -> None:
+    """Time the current call waited for a rate or concurrency limit."""
+    record = _current()
+    if record is not None:
+        record.queue_wait += seconds
+
+
+def note_rate_limit_sleep(seconds: float) -> None:
+    record = _current()
+    if record is not None:
+        record.rate_limit_sleeps += 1
+        record.rate_limit_sleep_seconds += seconds
+
+
+def note_error(error: BaseException) -> None:
+    """An error the current call handled (retried or swallowed)."""
+    record = _current()
+    if record is not None:
+        record.errors.append(type(error).__name__)
+
+
+def note_retry(error: BaseException, delay: float) -> None:
+    """A failed attempt of the current call, retried after `delay` seconds."""
+    record = _current()
+    if record is None:
+        return
+    record.retries += 1
+    note_error(error)
+    if "RateLimit" in type(error).__name__:
+        note_rate_limit_sleep(delay)
+
+
+def note_tokens(tokens_in: int = 0, tokens_out: int = 0) -> None:
+    record = _current()
+    if record is not None:
+        record.tokens_in += int(tokens_in or 0)
+        record.tokens_out += int(tokens_out or 0)
+
+
+def note_usage(usage: Any) -> None:
+    """Token usage of a response: OpenAI `usage` (object or dict), or any `input/output_tokens` pair."""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else functools.partial(getattr, usage)
+    note_tokens(
+        get("prompt_tokens", None) or get("input_tokens", None) or 0,
+        get("completion_tokens", None) or get("output_tokens", None) or 0)
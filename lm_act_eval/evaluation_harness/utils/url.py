@@ -1,16 +1,171 @@
+"""
+Screenshot URL accessibility checks.
+
+`UrlChecker` checks many URLs at once: duplicates are checked once, concurrently, over a pooled
+keep-alive session capped at `per_host` connections per host. Verdicts (status & content type)
+are cached on disk for `ttl` seconds, so reruns skip the network. Only definitive verdicts are
+cached: network errors and transient statuses (408, 429, 5xx) are checked again next time.
+
+    eligible = screenshots_accessible(df['screenshot'])
+    process_df = df[eligible]
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, LiteralString, NamedTuple, Optional
+
 import requests
-from typing import LiteralString
-from pandas import Series, DataFrame
+from pandas import DataFrame, Series
+from requests.adapters import HTTPAdapter
+
+from lm_act_eval.evaluation_harness.constants import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CONTENT_TYPES = ('image/png', 'image/jpg', 'image/jpeg')
+DEFAULT_URL_CACHE_PATH = Path(CACHE_DIR) / "url_checks.sqlite"
+DEFAULT_TTL = 24 * 60 * 60
+# statuses that may well change on the next request
+TRANSIENT_STATUSES = (408, 429)
+
+
+class UrlCheck(NamedTuple):
+    status: int
+    content_type: str
+
+    @property
+    def is_screenshot(self) -> bool:
+        return self.status == 200 and any(img in self.content_type for img in IMAGE_CONTENT_TYPES)
+
+    @property
+    def is_definitive(self) -> bool:
+        """Whether the verdict is worth caching: not a server error, timeout or rate limit."""
+        return self.status < 500 and self.status not in TRANSIENT_STATUSES
+
+
+class UrlChecker:
+    def __init__(
+        self, max_workers: int = 32, per_host: int = 8, timeout: float = 5, ttl: float = DEFAULT_TTL,
+        cache_path: Optional[Path | str] = DEFAULT_URL_CACHE_PATH):
+        """
+        Args:
+            max_workers (int): URLs checked concurrently.
+            per_host (int): Connections kept (and used at once) per host.
+            timeout (float): Seconds per request.
+            ttl (float): Seconds a cached verdict stays valid.
+            cache_path (Path | str, optional): The verdict cache, None to disable it.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self.session = requests.Session()
+        # blocking pools: a host never has more than `per_host` connections open
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=per_host, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache_path = Path(cache_path) if cache_path else None
+        if self.cache_path is not None:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._cache() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS url_checks "
+                    "(url TEXT PRIMARY KEY, status INTEGER NOT NULL, content_type TEXT NOT NULL, checked_at REAL NOT NULL)")
+
+    def _cache(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+    def _fetch(self, url: str) -> Optional[UrlCheck]:
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            # Fall back to GET request if HEAD is not allowed
+            if response.status_code == 405:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    pass
+            return UrlCheck(response.status_code, response.headers.get('Content-Type', ''))
+        except requests.RequestException as e:
+            logger.debug(f"Checking {url} failed: {e}")
+            return None
+
+    def _cached(self, urls: Iterable[str]) -> Dict[str, UrlCheck]:
+        if self.cache_path is None:
+            return {}
+        urls, cached = list(urls), {}
+        fresh_after = time.time() - self.ttl
+        with self._cache() as conn:
+            # below SQLite's bound parameter limit
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT url, status, content_type FROM url_checks WHERE checked_at > ? "
+                    f"AND url IN ({','.join('?' * len(chunk))})", [fresh_after, *chunk])
+                cached.update({url: UrlCheck(status, content_type) for url, status, content_type in rows})
+        return cached
+
+    def check(self, url: str) -> Optional[UrlCheck]:
+        return self.check_many([url]).get(url)
+
+    def check_many(self, urls: Iterable[str]) -> Dict[str, Optional[UrlCheck]]:
+        """
+        Checks every distinct URL once, from the cache when fresh.
+
+        Returns:
+            Dict[str, Optional[UrlCheck]]: The verdict by URL, None if the URL couldn't be reached.
+        """
+        unique = list(dict.fromkeys(url for url in urls if isinstance(url, str) and url))
+        results: Dict[str, Optional[UrlCheck]] = self._cached(unique)
+        missing = [url for url in unique if url not in results]
+        if missing:
+            logger.info(f"Checking {len(missing)} URL(s), {len(results)} cached")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._fetch, url): url for url in missing}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            self._store({
+                url: results[url] for url in missing if results[url] is not None and results[url].is_definitive})
+        return results
+
+    def _store(self, checks: Dict[str, UrlCheck]) -> None:
+        if self.cache_path is None or not checks:
+            return
+        now = time.time()
+        with self._cache() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO url_checks (url, status, content_type, checked_at) VALUES (?, ?, ?, ?)",
+                [(url, check.status, check.content_type, now) for url, check in checks.items()])
+
+    def screenshots_accessible(self, urls: Series) -> Series:
+        """Whether each URL of `urls` serves an image, aligned with `urls`."""
+        checks = self.check_many(urls)
+        verdicts = {url: check is not None and check.is_screenshot for url, check in checks.items()}
+        return Series([verdicts.get(url, False) for url in urls], index=urls.index, dtype=bool)
+
+
+_default_checker: Optional[UrlChecker] = None
+_default_checker_lock = threading.Lock()
+
+
+def default_checker() -> UrlChecker:
+    """The process-wide checker, sharing its connection pool and cache."""
+    global _default_checker
+    with _default_checker_lock:
+        if _default_checker is None:
+            _default_checker = UrlChecker()
+        return _default_checker
+
+
+def screenshots_accessible(urls: Series, checker: Optional[UrlChecker] = None) -> Series:
+    """Series-level `is_screenshot_url_accessible`, see `UrlChecker.screenshots_accessible`."""
+    return (checker or default_checker()).screenshots_accessible(urls)
+
 
 def is_screenshot_url_accessible(url: Series| LiteralString, field_name="screenshot"):
     if isinstance(url, (Series, DataFrame)):
         assert field_name, "Field name must be specified for which field is the url field"
         url = url.get(field_name)
-    try:
-        response = requests.head(url, allow_redirects=True, timeout=5)
-        # Fall back to GET request if HEAD is not allowed
-        if response.status_code == 405:
-            response = requests.get(url, stream=True, timeout=5)
-        return response.status_code == 200 and any([img in response.headers.get('Content-Type', '') for img in ['image/png', 'image/jpg', 'image/jpeg']])
-    except requests.RequestException:
-        return False
+    check = default_checker().check(url)
+    return check is not None and check.is_screenshot
@@ -8,8 +8,8 @@ rich_handler.setFormatter(fmt=logging.Formatter(fmt="%(message)s", datefmt="[%H:
 file_formatter = logging.Formatter(fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt="[%Y-%m-%d %H:%M:%S]")
 
 
-# Setup FileHandler for logging to a file
-file_handler = logging.FileHandler('lm_act_eval.log')
+# Setup FileHandler for logging to a file, opened on the first record rather than on import
+file_handler = logging.FileHandler('lm_act_eval.log', delay=True)
 file_handler.setFormatter(file_formatter)
 
 
@@ -1,8 +1,15 @@
 import dataclasses
-from typing import List, Literal, Dict
+from typing import List, Literal, Dict, Optional
 
 @dataclasses.dataclass
 class gptv_config:
   model: str = "gpt-4-vision-preview"
   max_tokens: int = 300
+  # sampling params, the provider's defaults unless set
+  temperature: Optional[float] = None
+  top_p: Optional[float] = None
   img_fidelity: str = "high"
+  # screenshot preparation, see `openai/vision/images.py`
+  img_format: str = "jpeg"
+  img_quality: int = 85
+  fetch_image_urls: bool = False
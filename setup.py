@@ -18,6 +18,7 @@ requirements = [
     'numpy==1.25.2',
     'openai==1.14.0',
     'pandas==2.2.1',
+    'pyarrow>=15.0.0',
     'Pillow==10.0.1',
     'playwright==1.37.0',
     'pydantic==1.10.14',  # Duplicate removed
@@ -72,7 +73,7 @@ setup(
     description="Evaluation for LLM Actions & Trajectories",
     entry_points={
         'console_scripts': [
-            'lm_act_eval=lm_act_eval.__main__:main',
+            'lm_act_eval=lm_act_eval.__main__:cli',
         ],
     },
     install_requires=requirements,
@@ -88,6 +89,7 @@ setup(
     },
     long_description=readme + '\n\n' + history,
     include_package_data=True,
+    package_data={'lm_act_eval': ['startup_budget.json']},
     keywords='lm_act_eval',
     name='lm_act_eval',
     packages=find_packages(include=['lm_act_eval', 'lm_act_eval.*']),
@@ -3,6 +3,44 @@ import pandas as pd
 import os
 from hydra.experimental import initialize, compose
 
+from lm_act_eval.evaluation_harness.evaluators.concurrency import configure_adaptive_concurrency
+from lm_act_eval.evaluation_harness.helper_functions.judges import configure_judge
+from lm_act_eval.evaluation_harness.utils.llm_cache import ResponseCache, set_response_cache
+from lm_act_eval.evaluation_harness.utils.resilience import configure_resilience
+
+
+@pytest.fixture(autouse=True)
+def llm_cache(tmp_path):
+    """A fresh LLM response cache per test, so tests never answer each other (or from `.cache`)."""
+    cache = ResponseCache(tmp_path / "llm_responses.sqlite")
+    set_response_cache(cache)
+    yield cache
+    set_response_cache(None)
+
+
+@pytest.fixture(autouse=True)
+def adaptive_concurrency():
+    """Fresh per model limiters per test, so rate limits don't carry over."""
+    configure_adaptive_concurrency(None)
+    yield
+    configure_adaptive_concurrency(None)
+
+
+@pytest.fixture(autouse=True)
+def resilience():
+    """Fresh per model circuits and latencies per test, so an outage doesn't carry over."""
+    configure_resilience(None)
+    yield
+    configure_resilience(None)
+
+
+@pytest.fixture(autouse=True)
+def llm_judge():
+    """The default (OpenAI) judge per test."""
+    configure_judge(None)
+    yield
+    configure_judge(None)
+
 @pytest.fixture(scope="session")
 def cfg():
     with initialize(config_path="../config", job_name="test_app"):
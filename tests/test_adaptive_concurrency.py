@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import (
+    AdaptiveLimiter,
+    adaptive_limiter,
+    configure_adaptive_concurrency,
+    parse_duration,
+    retry_after,
+)
+from lm_act_eval.evaluation_harness.openai.vision import gptv
+
+from .test_gptv_concurrency import FakeCompletions, error
+
+
+def rate_limit_error(headers):
+    e = error(openai.RateLimitError)
+    e.response = SimpleNamespace(headers=headers)
+    return e
+
+
+class RawResponse:
+    def __init__(self, parsed, headers):
+        self.parsed, self.headers = parsed, headers
+
+    def parse(self):
+        return self.parsed
+
+
+class Provider:
+    """Serves `capacity` calls at once and 429s beyond, reporting its headroom like OpenAI does."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_flight = self.peak = self.rate_limited = 0
+        self.with_raw_response = SimpleNamespace(create=self.create_raw)
+
+    async def create_raw(self, **body):
+        if self.in_flight >= self.capacity:
+            self.rate_limited += 1
+            raise rate_limit_error({"retry-after-ms": "5"})
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.002)
+        self.in_flight -= 1
+        return RawResponse("ok", {"x-ratelimit-limit-requests": "1000", "x-ratelimit-remaining-requests": "900"})
+
+
+def test_rate_limit_headers():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("59ms") == pytest.approx(0.059)
+    assert parse_duration("1.5s") == 1.5
+    assert parse_duration("soon") is None
+    assert retry_after({"retry-after-ms": "250", "retry-after": "1"}) == 0.25
+    assert retry_after({"retry-after": "2"}) == 2
+    assert retry_after({}) is None
+
+
+def test_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveLimiter(initial=4, max_limit=5)
+    for _ in range(4):
+        limiter.succeeded()
+    assert limiter.limit == pytest.approx(4.9, abs=0.05)
+
+    # under 10% of the window left: hold
+    limiter.succeeded({"x-ratelimit-limit-tokens": "10000", "x-ratelimit-remaining-tokens": "500"})
+    assert limiter.limit == pytest.approx(4.9, abs=0.05)
+
+    # a burst of 429s from the same epoch cuts once
+    assert limiter.rate_limited(0) is None
+    limiter.rate_limited(0)
+    assert limiter.limit == pytest.approx(2.45, abs=0.05)
+    for _ in range(3):
+        limiter.rate_limited(limiter._epoch)
+    assert limiter.limit == 1
+
+
+def test_converges_under_the_provider_capacity():
+    limiter = AdaptiveLimiter(initial=8)
+    provider = Provider(capacity=6)
+
+    async def call():
+        while True:
+            try:
+                return await limiter.create(provider, (openai.RateLimitError,), model="m")
+            except openai.RateLimitError:
+                pass
+
+    async def run():
+        return await asyncio.gather(*[call() for _ in range(200)])
+
+    assert asyncio.run(run()) == ["ok"] * 200
+    assert provider.peak == 6
+    # the first burst over capacity, then a few probes
+    assert provider.rate_limited < 20
+    assert 3 <= limiter.limit <= 8
+    assert limiter.in_flight == 0
+
+
+def test_limiters_are_shared_across_threads_and_loops():
+    configure_adaptive_concurrency({"initial": 2, "max": 2})
+    limiter = adaptive_limiter("openai", "m")
+    assert adaptive_limiter("openai", "m") is limiter
+    provider = Provider(capacity=100)
+
+    def metric():
+        async def run():
+            await asyncio.gather(*[limiter.create(provider, model="m") for _ in range(20)])
+        asyncio.run(run())
+
+    threads = [threading.Thread(target=metric) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    # one cap across the three event loops
+    assert provider.peak == 2 and limiter.in_flight == 0
+
+    configure_adaptive_concurrency({"enabled": False})
+    assert adaptive_limiter("openai", "m") is None
+
+
+def test_gptv_backs_off_as_asked(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(gptv, "RETRY_INITIAL_DELAY", 0.001)
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+        await sleep(0)
+    monkeypatch.setattr(gptv.asyncio, "sleep", record_sleep)
+
+    completions = FakeCompletions([rate_limit_error({"retry-after": "0.05"})])
+    monkeypatch.setattr(gptv.GPTV, "async_client", property(
+        lambda self: SimpleNamespace(chat=SimpleNamespace(completions=completions))))
+    pipeline = gptv.GPTV()
+    assert asyncio.run(pipeline.agenerate_completion("goal", ["https://example.com/a.png"])).startswith("SCORE")
+
+    assert sleeps[0] >= 0.05
+    # halved, then grown by the success
+    assert adaptive_limiter("openai", pipeline.config.model).limit == pytest.approx(4 + 1 / 4)
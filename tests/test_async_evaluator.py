@@ -0,0 +1,99 @@
+import asyncio
+import random
+
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter
+from lm_act_eval.evaluation_harness.evaluators.metrics.base import DFTableScorer
+from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
+from lm_act_eval.evaluation_harness.evaluators.sft.trajectory import AsyncTableTrajectoryEvaluator
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def __call__(self, item):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        await asyncio.sleep(random.random() / 1000)
+        self.current -= 1
+        return item * 2
+
+
+def test_limiter_caps_concurrency_and_keeps_order():
+    limiter = ConcurrencyLimiter(max_concurrency=8, provider_limits={"openai": 3})
+    openai_calls, other_calls = InFlight(), InFlight()
+
+    async def run():
+        return await asyncio.gather(
+            limiter.map(openai_calls, range(50), provider="openai"),
+            limiter.map(other_calls, range(50), provider="local"))
+
+    openai_results, other_results = asyncio.run(run())
+    assert openai_results == [i * 2 for i in range(50)]
+    assert other_results == [i * 2 for i in range(50)]
+    assert openai_calls.peak <= 3
+    assert openai_calls.peak + other_calls.peak <= 8 + 3
+
+
+def test_limiter_serves_successive_event_loops():
+    # as in successive `evaluate()` calls of an async evaluator, each under its own `asyncio.run`
+    limiter = ConcurrencyLimiter(max_concurrency=2, provider_limits={"openai": 1})
+    for _ in range(2):
+        calls = InFlight()
+        assert asyncio.run(limiter.map(calls, range(10), provider="openai")) == [i * 2 for i in range(10)]
+        assert calls.peak == 1
+
+
+def test_limiter_from_config():
+    limiter = ConcurrencyLimiter.from_config(OmegaConf.create({"concurrency": {"max": 4, "providers": {"openai": 2}}}))
+    assert limiter.max_concurrency == 4
+    assert limiter.provider_limits == {"openai": 2}
+
+
+@metric_registry.register("test_async_judge")
+class AsyncJudge(DFTableScorer):
+    provider = "judge"
+    in_flight = InFlight()
+
+    def is_eligible(self, row):
+        return True
+
+    async def ascore_row(self, row):
+        await self.in_flight(0)
+        return pd.Series({"Score": len(row["GOAL"])})
+
+    def _process_result(self, evals):
+        return evals["Score"].mean()
+
+
+@metric_registry.register("test_sync_length")
+class SyncLength:
+    def __init__(self, config):
+        self.config = config
+
+    def __call__(self, df):
+        return df["answer"].str.len().tolist()
+
+
+def test_async_evaluator_runs_rows_concurrently(tmp_path):
+    goals = [f"goal {'x' * i}" for i in range(40)]
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"session_id": range(40), "GOAL": goals, "y": goals}).to_csv(path)
+    config = OmegaConf.create({
+        "data": {"path": str(path), "extract_fs": {"GOAL": {"GOAL": None}, "y": {"y": None}}},
+        "metrics": {
+            "test_async_judge": {"inputs": ["GOAL"], "args": None},
+            "test_sync_length": {"inputs": [{"answer": "y"}], "args": None},
+        },
+        "concurrency": {"max": 10, "providers": {"judge": 5}},
+    })
+
+    evaluations = AsyncTableTrajectoryEvaluator(config).evaluate()
+    assert evaluations["test_async_judge"] == pytest.approx(sum(map(len, goals)) / len(goals))
+    assert evaluations["test_sync_length"] == [len(g) for g in goals]
+    assert 1 < AsyncJudge.in_flight.peak <= 5
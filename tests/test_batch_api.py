@@ -0,0 +1,165 @@
+import json
+
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.openai import batch
+from lm_act_eval.evaluation_harness.openai.batch import BatchRunner, BatchTransport
+from lm_act_eval.evaluation_harness.openai.vision import evaluator
+from lm_act_eval.evaluation_harness.utils.llm_cache import set_response_cache
+
+
+class StandInTransport(BatchTransport):
+    """An in-memory Batch API: echoes the last user message, failing `flaky` ids once and `rejected` ids always."""
+
+    def __init__(self, flaky=(), fail_batches=0, rejected=()):
+        self.files, self.batches, self.polls = {}, {}, {}
+        self.flaky = set(flaky)
+        self.rejected = set(rejected)
+        self.fail_batches = fail_batches
+        self.submitted = []
+
+    def upload(self, content, filename):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content.decode()
+        return file_id
+
+    def create(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.batches)}"
+        requests = [json.loads(line) for line in self.files[input_file_id].splitlines()]
+        self.submitted.append([r["custom_id"] for r in requests])
+        if self.fail_batches:
+            self.fail_batches -= 1
+            self.batches[batch_id] = {"id": batch_id, "status": "failed", "errors": "validation"}
+            return batch_id
+        outputs, errors = [], []
+        for request in requests:
+            custom_id = request["custom_id"]
+            if custom_id in self.flaky:
+                self.flaky.discard(custom_id)
+                errors.append({"custom_id": custom_id, "response": {"status_code": 500, "body": {}}, "error": None})
+                continue
+            if custom_id in self.rejected:
+                body = {"error": {"message": "context length exceeded"}}
+                errors.append({"custom_id": custom_id, "response": {"status_code": 400, "body": body}, "error": None})
+                continue
+            content = request["body"]["messages"][-1]["content"]
+            text = content[-1]["text"] if isinstance(content, list) else content
+            body = {"choices": [{"message": {"content": f"SCORE: {len(text)}\nEXPLANATION: {custom_id}"}}]}
+            outputs.append({"custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None})
+        self.files[f"{batch_id}-out"] = "\n".join(map(json.dumps, outputs))
+        self.files[f"{batch_id}-err"] = "\n".join(map(json.dumps, errors))
+        self.batches[batch_id] = {
+            "id": batch_id, "status": "completed",
+            "output_file_id": f"{batch_id}-out", "error_file_id": f"{batch_id}-err" if errors else None}
+        return batch_id
+
+    def retrieve(self, batch_id):
+        # in progress on the first poll
+        self.polls[batch_id] = self.polls.get(batch_id, 0) + 1
+        return self.batches[batch_id] if self.polls[batch_id] > 1 else {"id": batch_id, "status": "in_progress"}
+
+    def download(self, file_id):
+        return self.files[file_id]
+
+
+def chat(n):
+    return {f"id-{i}": {"model": "m", "messages": [{"role": "user", "content": "x" * i}]} for i in range(n)}
+
+
+def test_partial_failures_are_resubmitted():
+    transport = StandInTransport(flaky={"id-3", "id-7"})
+    runner = BatchRunner(transport, poll_interval=0, max_batch_requests=4)
+    results = runner.run_chat(chat(10))
+
+    assert results == {f"id-{i}": f"SCORE: {i}\nEXPLANATION: id-{i}" for i in range(10)}
+    # 10 requests in files of 4, then the two failures
+    assert transport.submitted == [
+        ["id-0", "id-1", "id-2", "id-3"], ["id-4", "id-5", "id-6", "id-7"], ["id-8", "id-9"], ["id-3", "id-7"]]
+
+
+def test_failed_batches_are_retried_then_given_up_on():
+    # the same requests twice, never answered from the response cache
+    set_response_cache(None)
+    transport = StandInTransport(fail_batches=1)
+    assert BatchRunner(transport, poll_interval=0).run_chat(chat(3)).keys() == {"id-0", "id-1", "id-2"}
+
+    transport = StandInTransport(fail_batches=2)
+    assert BatchRunner(transport, poll_interval=0, max_attempts=2).run_chat(chat(3)) == {}
+
+
+def test_client_errors_are_not_resubmitted():
+    transport = StandInTransport(flaky={"id-1"}, rejected={"id-2"})
+    results = BatchRunner(transport, poll_interval=0).run_chat(chat(3))
+    assert results.keys() == {"id-0", "id-1"}
+    assert transport.submitted == [["id-0", "id-1", "id-2"], ["id-1"]]
+
+
+def test_stuck_batches_are_cancelled_after_the_timeout(monkeypatch):
+    class Stuck(StandInTransport):
+        cancelled = []
+
+        def retrieve(self, batch_id):
+            return {"id": batch_id, "status": "in_progress"}
+
+        def cancel(self, batch_id):
+            self.cancelled.append(batch_id)
+
+    clock = iter(range(0, 1000, 10))
+    monkeypatch.setattr(batch.time, "monotonic", lambda: next(clock))
+    monkeypatch.setattr(batch.time, "sleep", lambda seconds: None)
+    transport = Stuck()
+    assert BatchRunner(transport, poll_interval=5, timeout=30).run_chat(chat(2)) == {}
+    # a single submission, cancelled once past the timeout
+    assert transport.submitted == [["id-0", "id-1"]] and transport.cancelled == ["batch-0"]
+
+
+def test_polling_backs_off(monkeypatch):
+    class Slow(StandInTransport):
+        def retrieve(self, batch_id):
+            self.polls[batch_id] = self.polls.get(batch_id, 0) + 1
+            return self.batches[batch_id] if self.polls[batch_id] > 3 else {"id": batch_id, "status": "in_progress"}
+
+    sleeps = []
+    monkeypatch.setattr(batch.time, "sleep", sleeps.append)
+    runner = BatchRunner(Slow(), poll_interval=2, max_poll_interval=4)
+    assert runner.wait(runner.submit(chat(1)))[0]["status"] == "completed"
+    assert sleeps == [2, 3, 4]
+
+
+def test_gptv_batch_mode_maps_results_to_rows(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(evaluator, "screenshots_accessible", lambda urls: pd.Series(True, index=urls.index))
+    scorer = evaluator.GPTVScorer(OmegaConf.create([{"mode": "batch"}, {"batch": {"poll_interval": 0}}]))
+    scorer.batch_runner._transport = StandInTransport(flaky={"row-1"})
+    assert not scorer.supports_async
+
+    df = pd.DataFrame({
+        "GOAL": ["a", "bb", "ccc"], "QUERY": ["q"] * 3,
+        "screenshot": [f"https://example.com/{i}.png" for i in range(3)],
+    }).set_axis([7, 8, 9])
+    scorer.input_df = df
+    scorer._process()
+    evals = scorer.evaluate()
+
+    assert evals.index.tolist() == [7, 8, 9]
+    assert evals["Explanation"].tolist() == ["row-0", "row-1", "row-2"]
+    assert evals["Score"].tolist() == [str(len(scorer.eval_prompt.format(**row))) for _, row in df.iterrows()]
+
+
+def test_llm_judges_in_batch():
+    llm = pytest.importorskip("lm_act_eval.evaluation_harness.helper_functions.llm")
+
+    class Judge(StandInTransport):
+        def download(self, file_id):
+            # every answer graded correct, but item-2 gets an unparsable judgment
+            content = self.files[file_id].replace("SCORE", "correct")
+            return "\n".join(
+                line.replace("correct", "maybe") if '"item-2"' in line else line for line in content.splitlines())
+
+    runner = BatchRunner(Judge(flaky={"item-1"}), poll_interval=0)
+    assert llm.llm_fuzzy_match_batch(["a", "b"], ["a", "b"], ["q", "q"], runner=runner) == [1.0, 1.0]
+    # an unparsable judgment leaves only its answer unscored
+    scores = llm.llm_fuzzy_match_batch(["a", "b", "c"], ["a", "b", "c"], ["q", "q", "q"], runner=runner)
+    assert scores[:2] == [1.0, 1.0] and scores[2] is None
@@ -0,0 +1,78 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from lm_act_eval.evaluation_harness.evaluators.sft.dataframe import apply_extractors
+from lm_act_eval.evaluation_harness.helper_functions.registry import function_registry
+from lm_act_eval.evaluation_harness.helper_functions.multion import ParseChatCompletion
+
+TEXTS = [
+    "",
+    "just a thought",
+    "I should search first.\nCOMMANDS:\nGOTO_URL https://www.opentable.com\nEXPLANATION: open the site\nSTATUS: CONTINUE",
+    "ANSWER: The reservation is confirmed.\nSTATUS: DONE",
+    "thinking\\n\nASK_USER_HELP: what time?\\n",
+    "EXPLANATION: only an explanation\n",
+    "STATUS: NOT SURE\nCOMMANDS: CLICK 12\nEXPLANATION: reordered",
+    "SCORE: 7\nEXPLANATION: close enough\nSTATUS: DONE",
+    "  COMMANDS:   TYPE 3 \"party of 2\"  \n\n",
+    "COMMANDS: a\nCOMMANDS: b",
+]
+
+MESSAGES = [
+    str({"chat_completion_messages": [{"role": "user", "content": "Book a table for 2"}]}),
+    str({"chat_completion_messages": [{"role": "user", "content": "Book a table for 2"}]}),
+    str({"chat_completion_messages": "not a list"}),
+    str({"other": 1}),
+    "{'role': 'user', 'content': 'malformed'}",
+    "not parseable at all",
+]
+
+
+@pytest.mark.parametrize("name", [
+    "extract_first", "extract_thought", "extract_action", "extract_explanation", "extract_status"])
+def test_batch_matches_row_wise(name):
+    function = function_registry.get(name)
+    batch_function = function_registry.get_batch(name)
+    texts = pd.Series(TEXTS, index=range(10, 10 + len(TEXTS)))
+
+    expected = [function(text) for text in texts]
+    result = batch_function(texts)
+    assert result.index.equals(texts.index)
+    assert result.tolist() == expected
+
+
+def test_extract_first_batch_with_term():
+    texts = pd.Series(TEXTS)
+    batch_function = function_registry.get_batch("extract_first")
+    for term in ["SCORE", "EXPLANATION", "STATUS", "COMMANDS"]:
+        expected = [function_registry.get("extract_first")(text, term) for text in texts]
+        assert batch_function(texts, term).tolist() == expected
+
+
+def test_parse_content_batch_matches_row_wise():
+    parser = ParseChatCompletion()
+    messages = pd.Series(MESSAGES)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [parser.parse_content(m) for m in messages]
+        result = parser.parse_content_batch(messages)
+    assert result.tolist() == expected
+
+
+def test_apply_extractors_prefers_batch_and_expands_fields():
+    @function_registry.register("test_split_fields")
+    def split_fields(text):
+        return pd.Series({"len": len(text), "upper": text.upper()})
+
+    df = pd.DataFrame({"text": ["ab", "COMMANDS: x"], "raw": [1, 2]}, index=[5, 7])
+    extracted = apply_extractors(df, {
+        "ACTION": {"text": "extract_action"},
+        "TEXT": {"text": "test_split_fields"},
+        "RAW": {"raw": None},
+    })
+    assert list(extracted.columns) == ["ACTION", "TEXT_len", "TEXT_upper", "RAW"]
+    assert extracted.index.tolist() == [5, 7]
+    assert extracted["ACTION"].tolist() == ["", "x"]
+    assert extracted["TEXT_upper"].tolist() == ["AB", "COMMANDS: X"]
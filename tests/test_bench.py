@@ -0,0 +1,78 @@
+import pytest
+
+from lm_act_eval.bench import (
+    DEFAULT_BUDGET_PATH, budget_from_report, check_budget, format_import_tree, load_budget, measure_module,
+    parse_importtime)
+
+IMPORTTIME_STDERR = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     _bisect
+import time:       200 |        300 |   bisect
+import time:      1000 |       1300 | random
+import time:      9000 |       9000 | pandas
+"""
+
+
+def test_parse_importtime_builds_tree():
+    roots = parse_importtime(IMPORTTIME_STDERR)
+    assert [r.name for r in roots] == ["random", "pandas"]
+    random_node = roots[0]
+    assert random_node.cumulative_us == 1300
+    assert [c.name for c in random_node.children] == ["bisect"]
+    assert [c.name for c in random_node.children[0].children] == ["_bisect"]
+
+
+def test_format_import_tree_prunes_fast_nodes():
+    lines = format_import_tree(parse_importtime(IMPORTTIME_STDERR), min_ms=1.0)
+    assert lines[0].startswith("pandas")
+    assert lines[1].startswith("random")
+    assert len(lines) == 2
+
+
+def _report(**module_overrides):
+    module = {"import_ms": 100.0, "peak_rss_mb": 50.0, "error": None, "created_files": []}
+    module.update(module_overrides)
+    return {
+        "interpreter_ms": 20.0, "cold_start_ms": 300.0, "created_files": [],
+        "modules": {"lm_act_eval.common.data": module},
+    }
+
+
+def test_check_budget_within_budget():
+    report = _report()
+    assert check_budget(report, budget_from_report(report)) == []
+
+
+def test_check_budget_reports_violations():
+    budget = {
+        "cold_start_ms": 100,
+        "modules": {"lm_act_eval.common.data": {"import_ms": 50, "no_created_files": True}},
+    }
+    violations = check_budget(_report(created_files=["lm_act_eval.log"]), budget)
+    assert len(violations) == 3
+    assert violations[0].startswith("cold start")
+
+
+def test_check_budget_import_error_is_violation():
+    budget = {"modules": {"lm_act_eval.common.data": {"import_ms": 50}}}
+    violations = check_budget(_report(error="AssertionError: Have not loaded the environment variables"), budget)
+    assert violations == [
+        "lm_act_eval.common.data: import failed (AssertionError: Have not loaded the environment variables)"]
+
+
+def test_budget_ships_with_the_package_and_is_required(tmp_path):
+    assert load_budget(DEFAULT_BUDGET_PATH)["modules"]
+    with pytest.raises(FileNotFoundError):
+        load_budget(tmp_path / "missing.json")
+
+
+def test_measure_module_sees_only_the_files_of_the_import(tmp_path, monkeypatch):
+    modules = tmp_path / "modules"
+    modules.mkdir()
+    (modules / "writes_on_import.py").write_text("open('created.txt', 'w').close()\n")
+    monkeypatch.setenv("PYTHONPATH", str(modules))
+    # files already in the caller's working directory aren't import side effects
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "lm_act_eval.log").touch()
+    assert measure_module("lm_act_eval.log_configs").created_files == []
+    assert measure_module("writes_on_import").created_files == ["created.txt"]
+    assert not (tmp_path / "created.txt").exists()
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("text_generation")
+llm_utils = pytest.importorskip("lm_act_eval.evaluation_harness.helper_functions.llms.utils")
+from lm_act_eval.evaluation_harness.helper_functions.llms.lm_config import LMConfig
+
+
+def config(**gen_config):
+    return LMConfig(provider="huggingface", model="tgi", mode="completion", gen_config={
+        "model_endpoint": "http://tgi", "temperature": 0.0, "top_p": 1.0,
+        "max_new_tokens": 8, "stop_sequences": None, **gen_config})
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    state = {"in_flight": 0, "peak": 0, "prompts": []}
+
+    async def agenerate(prompt, **kwargs):
+        state["prompts"].append(prompt)
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        # later prompts finish first
+        await asyncio.sleep(0.001 * (10 - int(prompt)))
+        state["in_flight"] -= 1
+        return f"answer {prompt}"
+
+    monkeypatch.setattr(llm_utils, "agenerate_from_huggingface_completion", agenerate)
+    return state
+
+
+def test_results_keep_the_prompt_order(generate):
+    prompts = [str(i) for i in range(10)]
+    responses = llm_utils.call_llm_batch(config(concurrency=3), prompts)
+    assert responses == [f"answer {i}" for i in range(10)]
+    assert generate["peak"] == 3
+    assert llm_utils.call_llm_batch(config(), prompts, concurrency=2) == responses
+    # every prompt was answered from the cache the second time
+    assert len(generate["prompts"]) == 10
+
+
+def test_batches_are_scheduled_one_after_the_other(generate):
+    prompts = [str(i) for i in range(5)]
+    llm_utils.call_llm_batch(config(batch_size=2, concurrency=8), prompts)
+    assert generate["peak"] == 2
+    # the batch completes before the next starts, prompts stay grouped
+    assert [sorted(generate["prompts"][i:i + 2]) for i in (0, 2, 4)] == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_scheduling_does_not_change_the_cache_key(generate):
+    assert llm_utils._cache_params(config(concurrency=4, batch_size=2)) == llm_utils._cache_params(config())
+    assert asyncio.run(llm_utils.acall_llm(config(concurrency=4), "7")) == "answer 7"
+    assert llm_utils.call_llm(config(), "7") == "answer 7"
+    assert generate["prompts"] == ["7"]
+
+
+def test_uncached_calls_always_ask(generate, llm_cache):
+    for _ in range(2):
+        assert asyncio.run(llm_utils.acall_llm(config(), "7", cache=False)) == "answer 7"
+    assert generate["prompts"] == ["7"] * 2
+    assert llm_cache.stats()["entries"] == 0
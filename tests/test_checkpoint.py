@@ -0,0 +1,162 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+import lm_act_eval.__main__ as entry_point
+from lm_act_eval.evaluation_harness.evaluators import checkpoint as checkpoint_module
+from lm_act_eval.evaluation_harness.evaluators.checkpoint import (
+    MISSING, CheckpointStore, ascore_rows, row_hashes, unscored)
+from lm_act_eval.evaluation_harness.evaluators.concurrency import ConcurrencyLimiter
+from lm_act_eval.evaluation_harness.evaluators.metrics.base import DFTableScorer
+from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
+from lm_act_eval.evaluation_harness.evaluators.sft.trajectory import (
+    AsyncTableTrajectoryEvaluator, TableTrajectoryEvaluator)
+
+CALLS = {"rows": 0, "frames": 0}
+FAIL_ON = {"goal": None}
+
+
+@metric_registry.register("test_checkpointed_judge")
+class CheckpointedJudge(DFTableScorer):
+    def is_eligible(self, row):
+        return True
+
+    async def ascore_row(self, row):
+        if row["GOAL"] == FAIL_ON["goal"]:
+            raise RuntimeError("crashed")
+        CALLS["rows"] += 1
+        return len(row["GOAL"])
+
+    def _process_result(self, evals):
+        return evals.sum()
+
+
+@metric_registry.register("test_checkpointed_total")
+class CheckpointedTotal:
+    def __init__(self, config):
+        self.config = config
+
+    def __call__(self, df):
+        CALLS["frames"] += 1
+        return df["GOAL"].str.len().sum()
+
+
+def make_config(tmp_path, metric):
+    goals = [f"goal {'x' * i}" for i in range(30)]
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"session_id": range(30), "GOAL": goals}).to_csv(path)
+    return goals, OmegaConf.create({
+        "data": {"path": str(path), "extract_fs": {"GOAL": {"GOAL": None}}},
+        "metrics": {metric: {"inputs": ["GOAL"], "args": None}},
+        "concurrency": {"max": 1},
+        "checkpoint": {"path": str(tmp_path / "checkpoints.sqlite")},
+    })
+
+
+def test_store_round_trip_is_scoped_to_the_run(tmp_path):
+    config = {"metrics": {"m": {"args": None}}}
+    store = CheckpointStore(tmp_path / "store.sqlite")
+    first = store.start_run(config)
+    store.metric("m", config["metrics"]["m"]).put("abc", {"score": 1})
+    assert store.metric("m", config["metrics"]["m"]).get("abc") == {"score": 1}
+    assert store.metric("m", {"args": {"k": 2}}).get("abc") is MISSING
+
+    assert store.start_run(config) != first
+    assert store.metric("m", config["metrics"]["m"]).get("abc") is MISSING
+    assert store.start_run(config, resume=True) == store.run_id
+    assert store.start_run({"metrics": {}}, resume=True) != first
+
+
+def test_row_hashes_ignore_the_index():
+    df = pd.DataFrame({"a": ["x", "y"], "b": [[1], [2]]})
+    assert row_hashes(df) == row_hashes(df.set_axis([5, 6]))
+    assert len(set(row_hashes(df))) == 2
+
+
+def test_resume_skips_rows_scored_before_a_crash(tmp_path):
+    goals, config = make_config(tmp_path, "test_checkpointed_judge")
+    CALLS["rows"], FAIL_ON["goal"] = 0, goals[20]
+    with pytest.raises(RuntimeError, match="crashed"):
+        AsyncTableTrajectoryEvaluator(config).evaluate()
+    scored = CALLS["rows"]
+    assert scored >= 20
+
+    CALLS["rows"], FAIL_ON["goal"] = 0, None
+    evaluations = AsyncTableTrajectoryEvaluator(config, resume=True).evaluate()
+    assert evaluations["test_checkpointed_judge"] == sum(map(len, goals))
+    assert CALLS["rows"] == len(goals) - scored
+
+    # a fresh run scores everything again
+    CALLS["rows"] = 0
+    AsyncTableTrajectoryEvaluator(config).evaluate()
+    assert CALLS["rows"] == len(goals)
+
+
+def test_unscored_rows_are_retried_on_resume(tmp_path):
+    store = CheckpointStore(tmp_path / "store.sqlite")
+    store.start_run({"track": 1})
+    df = pd.DataFrame({"GOAL": ["a", "bb"]})
+    calls = []
+
+    async def ascore_row(row):
+        calls.append(row["GOAL"])
+        # the first attempt at "bb" runs past its deadline
+        if row["GOAL"] == "bb" and calls.count("bb") == 1:
+            return unscored(pd.Series({"Score": None}))
+        return pd.Series({"Score": len(row["GOAL"])})
+
+    for _ in range(2):
+        results = asyncio.run(ascore_rows(ascore_row, df, ConcurrencyLimiter(1), checkpoint=store.metric("m", None)))
+    assert [result["Score"] for result in results] == [1, 2]
+    assert sorted(calls) == ["a", "bb", "bb"] and store.count("m") == 2
+
+
+def test_sync_evaluator_restores_whole_metric_results(tmp_path):
+    goals, config = make_config(tmp_path, "test_checkpointed_total")
+    CALLS["frames"] = 0
+    first = TableTrajectoryEvaluator(config).evaluate()
+    resumed = TableTrajectoryEvaluator(config, resume=True).evaluate()
+    assert first == resumed == {"test_checkpointed_total": sum(map(len, goals))}
+    assert CALLS["frames"] == 1
+
+
+def test_checkpoint_can_be_disabled(tmp_path):
+    _, config = make_config(tmp_path, "test_checkpointed_total")
+    config.checkpoint = False
+    assert TableTrajectoryEvaluator(config).checkpoints == {}
+    assert CheckpointStore.from_config(config, resume=True) is None
+
+
+def test_checkpoint_is_off_without_a_block_unless_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint_module, "DEFAULT_CHECKPOINT_PATH", tmp_path / "default.sqlite")
+    config = {"metrics": {"m": {"args": None}}}
+    assert CheckpointStore.from_config(config) is None
+    assert CheckpointStore.from_config(config, resume=True).path == tmp_path / "default.sqlite"
+
+
+def test_old_runs_are_pruned(tmp_path, monkeypatch):
+    store = CheckpointStore(tmp_path / "store.sqlite", max_age_days=1)
+    old = store.start_run({"track": 1})
+    store.put("m", "args", "row", 1)
+    store.start_run({"track": 2})
+    assert store.prune() == 0
+
+    later = datetime.now() + timedelta(days=2)
+    monkeypatch.setattr(checkpoint_module, "datetime", SimpleNamespace(now=lambda: later))
+    # resuming keeps the resumed run, however old
+    assert store.start_run({"track": 1}, resume=True) == old
+    assert store.count() == 1
+    store.start_run({"track": 3})
+    assert store.start_run({"track": 1}, resume=True) != old
+
+
+def test_cli_resume_flag_becomes_an_override(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["lm_act_eval", "--resume", "eval=x"])
+    monkeypatch.setattr(entry_point, "main", lambda: None)
+    entry_point.cli()
+    assert sys.argv == ["lm_act_eval", "eval=x", "++resume=true"]
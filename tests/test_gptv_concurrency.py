@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import openai
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import RateLimiter
+from lm_act_eval.evaluation_harness.openai.vision import evaluator, gptv
+from lm_act_eval.evaluation_harness.utils.llm_cache import set_response_cache
+
+
+def error(cls):
+    # the constructors need an HTTP response, which scoring never looks at
+    e = cls.__new__(cls)
+    Exception.__init__(e, "failed")
+    return e
+
+
+class FakeCompletions:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.in_flight = self.peak = self.calls = 0
+
+    async def create(self, model, messages, max_tokens):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(random.random() / 100)
+        self.in_flight -= 1
+        text = messages[0]["content"][-1]["text"]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"SCORE: {len(text)}\nEXPLANATION: ok"))])
+
+
+@pytest.fixture
+def make_scorer(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(gptv, "RETRY_INITIAL_DELAY", 0.001)
+    monkeypatch.setattr(evaluator, "screenshots_accessible", lambda urls: pd.Series(True, index=urls.index))
+
+    def make(args, completions):
+        monkeypatch.setattr(gptv.GPTV, "async_client", property(
+            lambda self: SimpleNamespace(chat=SimpleNamespace(completions=completions))))
+        return evaluator.GPTVScorer(OmegaConf.create(args))
+    return make
+
+
+def rows(n):
+    return pd.DataFrame({
+        "GOAL": [f"goal {'x' * i}" for i in range(n)],
+        "QUERY": ["q"] * n,
+        "screenshot": [f"https://example.com/{i}.png" for i in range(n)],
+    }).set_axis(range(100, 100 + n))
+
+
+def test_concurrent_scores_keep_input_order(make_scorer):
+    completions = FakeCompletions()
+    scorer = make_scorer([{"PROMPT_VERSION": "multion_trajectory"}, {"concurrency": 8}], completions)
+    df = rows(40)
+    scorer.input_df = df
+    scorer._process()
+    evals = scorer.evaluate()
+
+    prompts = [scorer.eval_prompt.format(**row) for _, row in df.iterrows()]
+    assert evals.index.tolist() == df.index.tolist()
+    assert evals["Score"].tolist() == [str(len(p)) for p in prompts]
+    assert 1 < completions.peak <= 8
+
+
+def test_only_retryable_errors_are_retried(make_scorer):
+    # the same request twice, never answered from the response cache
+    set_response_cache(None)
+    completions = FakeCompletions([error(openai.RateLimitError), error(openai.InternalServerError)])
+    scorer = make_scorer({"concurrency": 2}, completions)
+    row = rows(1).iloc[0]
+    assert asyncio.run(scorer.ascore_row(row))["Explanation"] == "ok"
+    assert completions.calls == 3
+
+    completions = FakeCompletions([error(openai.BadRequestError)])
+    scorer = make_scorer({"concurrency": 2}, completions)
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(scorer.ascore_row(row))
+    assert completions.calls == 1
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=600)  # one every 0.1s once the burst is used
+
+    async def run():
+        for _ in range(600):
+            await limiter.acquire()
+        start = time.perf_counter()
+        await asyncio.gather(*[limiter.acquire() for _ in range(3)])
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) >= 0.25
+
+
+def test_token_estimate_counts_text_images_and_completion(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    messages = [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": "https://example.com/a.png"}},
+        {"type": "image_url", "image_url": {"url": "https://example.com/b.png", "detail": "low"}},
+        {"type": "text", "text": "x" * 400},
+    ]}]
+    # a remote image of unknown size costs at most 8 high detail tiles
+    assert gptv.GPTV().estimate_tokens(messages, max_tokens=300) == 85 + 170 * 8 + 85 + 100 + 300
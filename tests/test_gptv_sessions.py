@@ -0,0 +1,122 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.sft.dataframe import select_inputs
+from lm_act_eval.evaluation_harness.evaluators.trajectory_index import TrajectoryIndex, attach_trajectory_index
+from lm_act_eval.evaluation_harness.openai.vision import evaluator, gptv
+from lm_act_eval.evaluation_harness.openai.vision.evaluator import select_steps
+
+
+def judge(messages):
+    """Scores every screenshot of a request by its URL, e.g. `.../s1/3.png` scores 3."""
+    images = [part["image_url"]["url"] for part in messages[0]["content"] if part["type"] == "image_url"]
+    scores = [re.search(r"/(\d+)\.png", url).group(1) for url in images]
+    return "\n".join(
+        f"STEP {n}: SCORE: {score}\nEXPLANATION: {url}" for n, (score, url) in enumerate(zip(scores, images), 1))
+
+
+class Completions:
+    def __init__(self):
+        self.requests = []
+
+    def create(self, model, messages, max_tokens, **kwargs):
+        self.requests.append((messages, max_tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=judge(messages)))])
+
+
+class AsyncCompletions(Completions):
+    async def create(self, model, messages, max_tokens):
+        await asyncio.sleep(0)
+        return super().create(model, messages, max_tokens)
+
+
+@pytest.fixture
+def make_scorer(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(evaluator, "screenshots_accessible", lambda urls: ~urls.str.contains("broken"))
+
+    def make(args, completions):
+        scorer = evaluator.GPTVScorer(OmegaConf.create([{"granularity": "session"}, *args]))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        scorer.gptv.openai_client = client
+        monkeypatch.setattr(gptv.GPTV, "async_client", property(lambda self: client))
+        return scorer
+    return make
+
+
+def sessions():
+    # two shuffled sessions of 12 and 3 steps, one broken screenshot
+    rows = [("s1", i) for i in range(12)] + [("s2", i) for i in range(3)]
+    df = pd.DataFrame({
+        "session_id": [s for s, _ in rows], "idx_in_session": [i for _, i in rows],
+        "GOAL": ["g"] * len(rows), "QUERY": ["q"] * len(rows),
+        "screenshot": [f"https://example.com/{s}/{i}.png" for s, i in rows],
+    }).sample(frac=1, random_state=0).reset_index(drop=True)
+    df.loc[(df.session_id == "s2") & (df.idx_in_session == 1), "screenshot"] = "https://example.com/broken"
+    return df
+
+
+def test_select_steps_spreads_and_keeps_the_last():
+    assert select_steps(3, 8).tolist() == [0, 1, 2]
+    assert select_steps(12, 4).tolist() == [0, 4, 7, 11]
+    assert select_steps(12, 1).tolist() == [11]
+
+
+@pytest.mark.parametrize("args, completions", [
+    ([], Completions()),
+    ([{"concurrency": 4}], AsyncCompletions()),
+])
+def test_session_scores_map_back_to_rows(make_scorer, args, completions):
+    scorer = make_scorer([*args, {"max_images_per_session": 4}], completions)
+    df = sessions()
+    scorer.input_df = df
+    scorer._process()
+    evals = scorer.evaluate()
+
+    # one request per session, step budgets scaled by the images
+    assert len(completions.requests) == 2
+    assert sorted(max_tokens for _, max_tokens in completions.requests) == [600, 1200]
+    assert evals.index.tolist() == scorer.process_df.index.tolist()
+    judged = evals.dropna()
+    steps = df.loc[judged.index]
+    assert judged["Score"].tolist() == steps["idx_in_session"].astype(str).tolist()
+    assert sorted(map(tuple, steps[["session_id", "idx_in_session"]].values.tolist())) == [
+        ("s1", 0), ("s1", 4), ("s1", 7), ("s1", 11), ("s2", 0), ("s2", 2)]
+
+
+def test_selected_inputs_use_the_attached_index(make_scorer):
+    # the metric input has no session column, the broken screenshot is filtered out of it
+    completions = Completions()
+    scorer = make_scorer([{"max_images_per_session": 4}], completions)
+    df = sessions()
+    scorer.input_df = attach_trajectory_index(
+        select_inputs(df, ["GOAL", "QUERY", "screenshot"]), TrajectoryIndex.from_frame(df))
+    scorer._process()
+    judged = scorer.evaluate().dropna()
+
+    assert len(completions.requests) == 2
+    steps = df.loc[judged.index]
+    assert judged["Score"].tolist() == steps["idx_in_session"].astype(str).tolist()
+    assert sorted(map(tuple, steps[["session_id", "idx_in_session"]].values.tolist())) == [
+        ("s1", 0), ("s1", 4), ("s1", 7), ("s1", 11), ("s2", 0), ("s2", 2)]
+
+
+def test_missing_steps_get_no_score(make_scorer):
+    scorer = make_scorer([], Completions())
+    completion = "STEP 2: SCORE: 40\nEXPLANATION: half way\nthere"
+    parsed = scorer._parse_session_completion(completion, 2)
+    assert parsed[0].isna().all()
+    assert parsed[1].to_dict() == {"Score": "40", "Explanation": "half way\nthere"}
+
+
+def test_sessions_need_a_session_column(make_scorer):
+    scorer = make_scorer([], Completions())
+    scorer.input_df = sessions().drop(columns="session_id")
+    scorer._process()
+    with pytest.raises(ValueError):
+        scorer.evaluate()
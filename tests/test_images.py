@@ -0,0 +1,105 @@
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from lm_act_eval.evaluation_harness.openai.vision import gptv
+from lm_act_eval.evaluation_harness.openai.vision.images import ImagePreparer, target_size, vision_tokens
+
+
+def decode(data_url):
+    header, payload = data_url.split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(payload)))
+
+
+@pytest.fixture
+def screenshot(tmp_path):
+    path = tmp_path / "screenshot.png"
+    Image.new("RGBA", (2560, 1440), (200, 30, 30, 255)).save(path)
+    return path
+
+
+def test_target_sizes_follow_the_provider_rescaling():
+    assert target_size(2560, 1440, "low") == (512, 288)
+    # within 2048 x 2048, then the shortest side to 768
+    assert target_size(2560, 1440, "high") == (1365, 768)
+    assert target_size(4096, 1024, "high") == (2048, 512)
+    # never upscaled
+    assert target_size(640, 480, "high") == (640, 480)
+    assert vision_tokens(2560, 1440, "low") == 85
+    assert vision_tokens(2560, 1440, "high") == 85 + 170 * 3 * 2
+
+
+@pytest.mark.parametrize("detail, fmt, mime, size", [
+    ("low", "jpeg", "image/jpeg", (512, 288)),
+    ("high", "webp", "image/webp", (1365, 768)),
+])
+def test_screenshots_are_downscaled_and_reencoded(screenshot, tmp_path, detail, fmt, mime, size):
+    preparer = ImagePreparer(detail=detail, format=fmt, cache_dir=tmp_path / "cache")
+    content = preparer.prepare(str(screenshot))
+
+    assert content["image_url"]["detail"] == detail
+    header, image = decode(content["image_url"]["url"])
+    assert header == f"data:{mime};base64"
+    assert image.size == size
+    assert image.format == fmt.upper()
+
+
+def test_payloads_are_encoded_once(screenshot, tmp_path, monkeypatch):
+    encodes = []
+    encode = ImagePreparer._encode
+    monkeypatch.setattr(ImagePreparer, "_encode", lambda self, *args: encodes.append(1) or encode(self, *args))
+
+    preparer = ImagePreparer(cache_dir=tmp_path / "cache")
+    first = preparer.encode(str(screenshot))
+    assert preparer.encode(screenshot.read_bytes()) == first
+    # a rerun: a new preparer reads the payload back from disk
+    assert ImagePreparer(cache_dir=tmp_path / "cache").encode(str(screenshot)) == first
+    assert len(encodes) == 1
+
+    # another quality is another payload
+    ImagePreparer(quality=50, cache_dir=tmp_path / "cache").encode(str(screenshot))
+    assert len(encodes) == 2
+
+
+def test_memory_cache_is_bounded(tmp_path):
+    preparer = ImagePreparer(cache_dir=None, memory_items=2)
+    for color in range(3):
+        preparer.encode(Image.new("RGB", (8, 8), (color, 0, 0)))
+    assert len(preparer._memory) == 2
+
+
+def test_gptv_passes_urls_through_and_inlines_files(screenshot, tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pipeline = gptv.GPTV({"img_fidelity": "low"})
+    pipeline.image_preparer.cache_dir = tmp_path / "cache"
+
+    url, inlined = pipeline.process_image(["https://example.com/a.png", str(screenshot)])
+    assert url["image_url"] == {"url": "https://example.com/a.png", "detail": "low"}
+    assert inlined["image_url"]["url"].startswith("data:image/jpeg;base64,")
+    assert decode(inlined["image_url"]["url"])[1].size == (512, 288)
+    assert pipeline.estimate_tokens([{"role": "user", "content": [url, inlined]}]) == 85 * 2
+
+
+def test_payloads_carry_their_vision_tokens(screenshot, tmp_path):
+    preparer = ImagePreparer(cache_dir=tmp_path / "cache")
+    content = preparer.prepare(str(screenshot))["image_url"]
+    # 1365 x 768 is 3 x 2 tiles, from memory and from a data URL this preparer didn't make
+    assert preparer.tokens(content) == vision_tokens(2560, 1440) == 85 + 170 * 6
+    assert ImagePreparer(cache_dir=None).tokens(content) == 85 + 170 * 6
+
+
+def test_disk_cache_is_pruned_least_recently_used_first(tmp_path):
+    preparer = ImagePreparer(cache_dir=tmp_path / "cache", max_bytes=None)
+    for color in range(3):
+        preparer.encode(Image.new("RGB", (64, 64), (color * 100, 0, 0)))
+    files = sorted((tmp_path / "cache").iterdir())
+    # the first was used last
+    for used_at, path in zip((3, 1, 2), files):
+        os.utime(path, (used_at, used_at))
+
+    preparer.max_bytes = sum(path.stat().st_size for path in files[::2])
+    assert preparer.prune() == 1
+    assert sorted((tmp_path / "cache").iterdir()) == sorted(files[::2])
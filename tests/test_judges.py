@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+from lm_act_eval.evaluation_harness.helper_functions import judges, llm
+from lm_act_eval.evaluation_harness.helper_functions.judges import (
+    DynamicBatcher,
+    LocalHFJudge,
+    OpenAIJudge,
+    configure_judge,
+    judge_backend,
+)
+
+
+class FakeLocalJudge(LocalHFJudge):
+    """A local judge without a model: one token per character, answers 'correct' unless told otherwise."""
+
+    batches = []
+    encoded_on = []
+
+    def encode(self, messages):
+        FakeLocalJudge.encoded_on.append(threading.current_thread())
+        return list(messages[-1]["content"].encode())
+
+    def generate(self, batch):
+        FakeLocalJudge.batches.append([len(ids) for ids in batch])
+        return [(self.answer(bytes(ids)), 1) for ids in batch]
+
+    @staticmethod
+    def answer(prompt):
+        if b"student answer: wrong" in prompt:
+            return "incorrect"
+        # off-format answers of a small model, cut by `max_new_tokens`
+        if b"student answer: close" in prompt:
+            return "The student's answer is partially correct, as it"
+        if b"student answer: unsure" in prompt:
+            return "To grade the answer, let's first"
+        return "correct"
+
+
+@pytest.fixture
+def local_judge(monkeypatch):
+    FakeLocalJudge.batches, FakeLocalJudge.encoded_on = [], []
+    monkeypatch.setitem(judges.JUDGE_BACKENDS, "local", FakeLocalJudge)
+    configure_judge({"backend": "local", "batch_size": 4, "max_wait": 0.05})
+    return judge_backend()
+
+
+def test_concurrent_prompts_are_batched_by_length():
+    batches = []
+    started, release = threading.Event(), threading.Event()
+
+    def generate(batch):
+        started.set()
+        release.wait()
+        batches.append([len(ids) for ids in batch])
+        return [(str(len(ids)), len(ids)) for ids in batch]
+
+    batcher = DynamicBatcher(generate, batch_size=3, max_batch_tokens=20, max_wait=0.05)
+    # the worker is held on the first prompt while the others queue up
+    first = batcher.submit([0])
+    started.wait(timeout=5)
+    lengths = [9, 2, 3, 8, 1, 2, 7]
+    futures = [batcher.submit([0] * n) for n in lengths]
+    release.set()
+
+    assert first.result(timeout=5) == ("1", 1)
+    assert [f.result(timeout=5)[0] for f in futures] == [str(n) for n in lengths]
+    assert batches[1:] == [[1, 2, 2], [3, 7], [8, 9]]
+
+
+def test_local_judge_batches_the_batch_helpers(local_judge):
+    preds = ["right", "wrong", "right", "right", "wrong"]
+    scores = llm.llm_fuzzy_match_batch(preds, ["right"] * 5, ["q"] * 5)
+    assert scores == [1.0, 0.0, 1.0, 1.0, 0.0]
+    # the 2 distinct judgments, batched together
+    assert [len(batch) for batch in FakeLocalJudge.batches] == [2]
+
+    # answered from the response cache, then judged on its own
+    assert llm.llm_fuzzy_match("right", "right", "q") == 1.0
+    assert asyncio.run(llm.allm_fuzzy_match("wrong", "right", "another q")) == 0.0
+    assert sum(map(len, FakeLocalJudge.batches)) == 3
+
+
+def test_off_format_judgments_are_graded_by_their_first_label(local_judge, caplog):
+    assert llm.llm_fuzzy_match("close", "right", "q") == 0.0
+    assert llm.llm_fuzzy_match("unsure", "right", "q") == 0.0
+    assert "graded 0" in caplog.text
+    # left unscored in a batch
+    assert llm.llm_fuzzy_match_batch(["right", "unsure", "close"], ["right"] * 3, ["q"] * 3) == [1.0, None, 0.0]
+
+
+def test_judges_never_block_or_nest_the_event_loop(local_judge):
+    async def run():
+        loop_thread = threading.current_thread()
+        assert await llm.allm_fuzzy_match("right", "right", "q") == 1.0
+        assert loop_thread not in FakeLocalJudge.encoded_on
+        # the batch helpers are sync, but may be called from a coroutine
+        return llm.llm_fuzzy_match_batch(["right", "wrong"], ["right"] * 2, ["q2"] * 2)
+
+    assert asyncio.run(run()) == [1.0, 0.0]
+
+    class EchoJudge(judges.JudgeBackend):
+        def judge(self, messages):
+            return messages[-1]["content"]
+
+    async def run_base():
+        return EchoJudge("echo", {}).judge_many([[{"content": "a"}], [{"content": "b"}]])
+
+    assert asyncio.run(run_base()) == ["a", "b"]
+
+
+def test_judge_backend_is_configured():
+    assert isinstance(judge_backend(), OpenAIJudge) and judge_backend() is judge_backend()
+    configure_judge({"backend": "openai", "model": "gpt-4o"})
+    assert judge_backend().model == "gpt-4o"
+    configure_judge({"backend": "nope"})
+    with pytest.raises(ValueError):
+        judge_backend()
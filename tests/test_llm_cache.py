@@ -0,0 +1,128 @@
+import asyncio
+import base64
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+
+from lm_act_eval.evaluation_harness.openai.batch import BatchRunner
+from lm_act_eval.evaluation_harness.openai.vision import gptv
+from lm_act_eval.evaluation_harness.utils import llm_cache as cache_module
+from lm_act_eval.evaluation_harness.utils.llm_cache import CacheMiss, ResponseCache, request_key
+
+from .test_batch_api import StandInTransport, chat
+
+
+def data_url(payload: bytes) -> str:
+    return f"data:image/jpeg;base64,{base64.b64encode(payload).decode()}"
+
+
+def test_keys_are_canonical():
+    messages = [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": data_url(b"screenshot"), "detail": "low"}},
+        {"type": "text", "text": "score it"}]}]
+    key = request_key("openai", "gpt-4", messages, {"temperature": 0, "max_tokens": 10})
+    # params in any order; the image enters as a digest
+    assert key == request_key("openai", "gpt-4", messages, {"max_tokens": 10, "temperature": 0})
+    assert len(cache_module._canonical(messages)[0]["content"][0]["image_url"]["url"]) < 100
+
+    other_image = [{**messages[0], "content": [
+        {"type": "image_url", "image_url": {"url": data_url(b"other"), "detail": "low"}}, messages[0]["content"][1]]}]
+    assert key != request_key("openai", "gpt-4", other_image, {"temperature": 0, "max_tokens": 10})
+    assert key != request_key("openai", "gpt-4", messages, {"temperature": 1, "max_tokens": 10})
+    assert key != request_key("portkey", "gpt-4", messages, {"temperature": 0, "max_tokens": 10})
+
+
+def test_hits_misses_and_replay(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    cache = ResponseCache(path)
+    calls = []
+    generate = lambda: calls.append(1) or "correct"
+
+    assert cache.complete("openai", "m", "q", {}, generate) == "correct"
+    assert cache.complete("openai", "m", "q", {}, generate) == "correct"
+    assert asyncio.run(cache.acomplete("openai", "m", "q", {}, None)) == "correct"
+    assert len(calls) == 1
+    assert cache.stats() | {"hit_rate": None} == {"hits": 2, "misses": 1, "hit_rate": None, "entries": 1, "bytes": 7}
+
+    # empty responses are failures, not cached
+    cache.complete("openai", "m", "empty", {}, lambda: "")
+    assert cache.stats()["entries"] == 1
+
+    replay = ResponseCache(path, read_only=True)
+    assert replay.complete("openai", "m", "q", {}, generate) == "correct"
+    with pytest.raises(CacheMiss):
+        replay.complete("openai", "m", "other", {}, generate)
+    assert len(calls) == 1
+
+
+def test_eviction_by_age_and_size(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResponseCache(tmp_path / "responses.sqlite", max_bytes=25, max_age=100)
+    for i in range(3):
+        cache.put(f"k{i}", "x" * 10)
+        now[0] += 10
+    assert cache.get("k0") is not None  # now the most recently used
+
+    assert cache.evict() == 1
+    assert [cache.get(k) is not None for k in ("k0", "k1", "k2")] == [True, False, True]
+
+    now[0] += 100
+    assert cache.get("k2") is None  # expired, even before eviction
+    assert cache.evict() == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_gptv_completions_are_cached(monkeypatch, llm_cache):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    calls = []
+
+    class Completions:
+        def create(self, model, messages, max_tokens, **kwargs):
+            calls.append(messages)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="SCORE: 1"))])
+
+        async def acreate(self, model, messages, max_tokens):
+            return self.create(model, messages, max_tokens)
+
+    completions = Completions()
+    pipeline = gptv.GPTV()
+    pipeline.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(gptv.GPTV, "async_client", property(
+        lambda self: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=completions.acreate)))))
+
+    image = "https://example.com/a.png"
+    assert pipeline.generate_completion("goal", [image]) == "SCORE: 1"
+    # the async path hits the same entry
+    assert asyncio.run(pipeline.agenerate_completion("goal", [image])) == "SCORE: 1"
+    assert pipeline.generate_completion("other goal", [image]) == "SCORE: 1"
+    assert len(calls) == 2
+    assert llm_cache.hits == 1
+
+    # sampling params are part of the key
+    pipeline.config = dataclasses.replace(pipeline.config, temperature=0.7)
+    assert pipeline.generate_completion("goal", [image]) == "SCORE: 1"
+    assert len(calls) == 3
+
+
+def test_caching_is_opt_in(tmp_path):
+    assert cache_module.configure_response_cache(None) is None
+    assert cache_module.response_cache() is None
+    assert cache_module.cached_completion("openai", "m", "hi", {}, lambda: "fresh") == "fresh"
+    assert cache_module.configure_response_cache({"enabled": False}) is None
+
+    cache = cache_module.configure_response_cache({"path": str(tmp_path / "configured.sqlite")})
+    assert cache_module.response_cache() is cache and cache.path == tmp_path / "configured.sqlite"
+
+
+def test_batches_only_submit_misses(llm_cache):
+    transport = StandInTransport()
+    runner = BatchRunner(transport, poll_interval=0)
+    first = runner.run_chat(chat(3))
+    results = runner.run_chat(chat(5))
+
+    assert transport.submitted == [["id-0", "id-1", "id-2"], ["id-3", "id-4"]]
+    assert results == {**first, "id-3": "SCORE: 3\nEXPLANATION: id-3", "id-4": "SCORE: 4\nEXPLANATION: id-4"}
+    with pytest.raises(CacheMiss):
+        runner.run_chat(chat(6), cache=ResponseCache(llm_cache.path, read_only=True))
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from lm_act_eval.evaluation_harness.evaluators.sft import dataframe
+from lm_act_eval.evaluation_harness.evaluators.sft.dataframe import MIN_ROWS_PER_WORKER, apply_extractors
+from lm_act_eval.evaluation_harness.helper_functions.registry import function_registry
+
+
+@function_registry.register("test_fields")
+def fields(text):
+    return pd.Series({"len": len(text), "action": text.split(":")[0]})
+
+
+EXTRACT_FS = {
+    "ACTION": {"text": "extract_action"},
+    "STATUS": {"text": "extract_status"},
+    "FIELDS": {"text": "test_fields"},
+    "GOAL": {"messages": "parse_completion.parse_content"},
+    "RAW": {"text": None},
+}
+
+
+def _input(n):
+    return pd.DataFrame({
+        "text": [f"step {i}\nCOMMANDS: CLICK {i}\nSTATUS: {'DONE' if i % 7 else 'CONTINUE'}" for i in range(n)],
+        "messages": [str({"chat_completion_messages": [{"content": f"goal {i % 13}"}]}) for i in range(n)],
+    }, index=range(100, 100 + n))
+
+
+def test_process_pool_matches_serial():
+    df = _input(3 * MIN_ROWS_PER_WORKER + 17)
+    pd.testing.assert_frame_equal(
+        apply_extractors(df, EXTRACT_FS, workers=3), apply_extractors(df, EXTRACT_FS))
+
+
+def test_tiny_input_runs_serially(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("process pool started for a tiny input")
+
+    monkeypatch.setattr(dataframe, "ProcessPoolExecutor", no_pool)
+    extracted = apply_extractors(_input(10), EXTRACT_FS, workers=8)
+    assert extracted["ACTION"].tolist() == [f"CLICK {i}" for i in range(10)]
+
+
+def test_unpicklable_function_runs_serially():
+    @function_registry.register("test_local_upper")
+    def upper(text):
+        return text.upper()
+
+    df = _input(2 * MIN_ROWS_PER_WORKER)
+    extracted = apply_extractors(df, {"UPPER": {"text": "test_local_upper"}}, workers=2)
+    assert extracted["UPPER"].tolist() == df["text"].str.upper().tolist()
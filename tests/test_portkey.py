@@ -0,0 +1,68 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("portkey_ai")
+from lm_act_eval.evaluation_harness.openai import portkey
+
+
+class FakePortkey:
+    """Stands in for `AsyncPortkey`: answers the message back, counting clients and calls in flight."""
+
+    created = []
+
+    def __init__(self, api_key, virtual_key, config=None):
+        self.api_key, self.virtual_key, self.config = api_key, virtual_key, config
+        self.in_flight = self.peak = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        FakePortkey.created.append(self)
+
+    def with_options(self, config):
+        return FakePortkey(self.api_key, self.virtual_key, config)
+
+    async def create(self, messages, model):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        content = f"{model}: {messages[-1]['content']}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    FakePortkey.created = []
+    monkeypatch.setattr(portkey, "AsyncPortkey", FakePortkey)
+    monkeypatch.setenv("GEMINI_VIRTUAL_KEY", "gemini-key")
+    monkeypatch.setenv("GPT4_VIRTUAL_KEY", "gpt4-key")
+    monkeypatch.setenv("PORTKEY_GPT4_CONFIG", "gpt4-config")
+    monkeypatch.delenv("PORTKEY_API_KEY", raising=False)
+    return FakePortkey
+
+
+def test_queries_share_one_client_per_model_and_keys(gateway):
+    messages = [f"m{i}" for i in range(20)]
+    responses = asyncio.run(portkey.aquery_many(messages, concurrency=4))
+
+    assert responses == [f"gemini-1.5-pro-latest: m{i}" for i in range(20)]
+    (client,) = gateway.created
+    assert client.api_key == "gemini-key" and client.peak == 4
+    # the keys are read, never written to the environment
+    assert "PORTKEY_API_KEY" not in os.environ
+
+
+def test_models_get_their_own_client(gateway):
+    async def run():
+        return await asyncio.gather(
+            portkey.query_model("a", model="gpt4"), portkey.query_model("b", model="gpt4"),
+            portkey.query_model("c"))
+
+    assert asyncio.run(run()) == ["gpt4: a", "gpt4: b", "gemini-1.5-pro-latest: c"]
+    configs = [(c.api_key, c.config) for c in gateway.created]
+    # the GPT-4 client (and its `with_options` copy), then Gemini's
+    assert configs == [("gpt4-key", None), ("gpt4-key", "gpt4-config"), ("gemini-key", None)]
+
+    with pytest.raises(AssertionError):
+        portkey.model_virtual_key("unknown")
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.sft.readers import get_reader, read_table, referenced_columns
+
+
+def _table():
+    return pd.DataFrame({
+        "session_id": ["a", "a", "b"],
+        "idx_in_session": [0, 1, 0],
+        "QUERY": ["q1", "q2", "q3"],
+        "screenshot": ["s1", "s2", "s3"],
+        "chat_completion_messages": ["m1", "m2", "m3"],
+        "DOM": ["<html/>"] * 3,
+    })
+
+
+def _config(path, **data):
+    return OmegaConf.create({
+        "data": {
+            "path": str(path),
+            "extract_fs": {
+                "QUERY": {"QUERY": None},
+                "GOAL": {"chat_completion_messages": "parse_completion.parse_content"},
+            },
+            **data,
+        },
+        "metrics": {"gpt-v": {"inputs": ["GOAL", "QUERY", "screenshot"], "args": None}},
+    })
+
+
+def test_referenced_columns_skips_unused():
+    columns = referenced_columns(_config("data.csv"), list(_table().columns))
+    assert columns == ["session_id", "idx_in_session", "QUERY", "screenshot", "chat_completion_messages"]
+
+
+def test_referenced_columns_warns_for_missing_source():
+    config = _config("data.csv")
+    config.data.extract_fs.HTML = {"html": "opentable_extract_reservation_details"}
+    with pytest.warns(UserWarning, match="html"):
+        referenced_columns(config, list(_table().columns))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".feather"])
+def test_read_table_projects_columns(tmp_path, suffix):
+    df = _table()
+    path = tmp_path / f"data{suffix}"
+    if suffix == ".csv":
+        df.to_csv(path)
+    elif suffix == ".parquet":
+        df.to_parquet(path)
+    else:
+        df.to_feather(path)
+
+    result = read_table(_config(path))
+    assert "DOM" not in result.columns
+    pd.testing.assert_frame_equal(result, df[list(result.columns)], check_dtype=False)
+
+
+def test_read_table_without_projection(tmp_path):
+    path = tmp_path / "data.csv"
+    _table().to_csv(path)
+    assert "DOM" in read_table(_config(path, project_columns=False)).columns
+
+
+def test_unknown_suffix_falls_back_to_csv():
+    assert type(get_reader("data.txt")).__name__ == "CSVReader"
+    assert type(get_reader("data.txt", format="parquet")).__name__ == "ParquetReader"
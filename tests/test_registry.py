@@ -0,0 +1,70 @@
+import subprocess
+import sys
+
+import pytest
+
+from lm_act_eval.evaluation_harness.evaluators.registry import Registry, resolve_reference
+
+
+def test_manifest_entry_resolved_on_get():
+    registry = Registry({"dumps": "json:dumps"})
+    assert "dumps" in registry
+    assert "dumps" in registry.list_registered()
+
+    import json
+    assert registry.get("dumps") is json.dumps
+
+
+def test_registered_entry_takes_precedence_over_manifest():
+    registry = Registry({"scorer": "json:dumps"})
+
+    @registry.register("scorer")
+    def scorer():
+        return 1.0
+
+    assert registry.get("scorer") is scorer
+    assert registry.list_registered() == ["scorer"]
+
+
+def test_get_list_warns_for_missing_names():
+    registry = Registry({"dumps": "json:dumps"})
+    with pytest.warns(UserWarning):
+        result = registry.get(["dumps", "missing"])
+    assert list(result) == ["dumps"]
+
+
+def test_get_missing_name_raises():
+    with pytest.raises(Exception, match="doesn't exist in the registry"):
+        Registry().get("missing")
+
+
+def test_resolve_reference():
+    import os.path
+    assert resolve_reference("os.path:join") is os.path.join
+
+
+def test_opentable_metric_does_not_import_heavy_dependencies():
+    code = (
+        "import sys\n"
+        "from lm_act_eval.evaluation_harness.evaluators import metric_registry, evaluator_registry\n"
+        "metric_registry.get('opentable_html')\n"
+        "evaluator_registry.get('sft.trajectory')\n"
+        "heavy = ['torch', 'transformers', 'playwright', 'datasets', 'wandb']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_entry_point_does_not_import_the_llm_stack():
+    code = (
+        "import sys\n"
+        "import lm_act_eval.__main__\n"
+        "heavy = ['pandas', 'lm_act_eval.evaluation_harness.utils.telemetry',\n"
+        "         'lm_act_eval.evaluation_harness.helper_functions.judges']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
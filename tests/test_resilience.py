@@ -0,0 +1,154 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import adaptive_limiter, configure_adaptive_concurrency
+from lm_act_eval.evaluation_harness.utils.resilience import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    ResiliencePolicy,
+    configure_resilience,
+    deadline,
+    is_outage,
+    is_retryable,
+    resilience_policy,
+)
+
+from .test_gptv_concurrency import FakeCompletions, error, make_scorer, rows
+
+
+def test_errors_are_split_into_retryable_and_not():
+    assert is_retryable(error(openai.RateLimitError)) and not is_outage(error(openai.RateLimitError))
+    assert is_retryable(error(openai.InternalServerError)) and is_outage(error(openai.InternalServerError))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(error(openai.BadRequestError))
+    assert not is_retryable(DeadlineExceeded())
+
+
+def test_slow_calls_are_hedged():
+    policy = ResiliencePolicy(hedge_min_samples=3)
+    for _ in range(3):
+        policy.latencies.observe(0.01)
+    calls, cancelled = [], []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        return len(calls)
+
+    start = time.perf_counter()
+    assert asyncio.run(policy.acall(call, max_retries=0)) == 2
+    assert time.perf_counter() - start < 1
+    assert cancelled == [True]
+
+
+def test_deadline_stops_the_retries():
+    policy = ResiliencePolicy()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise error(openai.InternalServerError)
+
+    async def run():
+        with deadline(0.05):
+            await policy.acall(call, max_retries=10, initial_delay=0.01)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert 1 <= len(calls) < 10
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def run_slow():
+        with deadline(0.05):
+            await policy.acall(slow, max_retries=3)
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run_slow())
+    assert time.perf_counter() - start < 1
+
+
+def test_circuit_opens_fails_fast_and_probes():
+    policy = ResiliencePolicy(failure_threshold=2, reset_timeout=0.05)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise error(openai.InternalServerError)
+
+    with pytest.raises(openai.InternalServerError):
+        policy.call(failing, max_retries=1, initial_delay=0.001)
+    assert policy.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        policy.call(failing)
+    assert len(calls) == 2
+
+    time.sleep(0.06)
+    assert policy.breaker.state == "half-open"
+    assert policy.call(lambda: "ok") == "ok"
+    assert policy.breaker.state == "closed"
+
+    # rate limits don't count as an outage
+    for _ in range(3):
+        with pytest.raises(openai.RateLimitError):
+            policy.call(lambda: (_ for _ in ()).throw(error(openai.RateLimitError)), max_retries=0)
+    assert policy.breaker.state == "closed"
+
+
+def test_queued_calls_are_neither_timed_nor_hedged():
+    configure_adaptive_concurrency({"initial": 2, "max": 2})
+    configure_resilience({"call_timeout": 0.2, "failure_threshold": 2})
+    limiter, policy = adaptive_limiter("openai", "m"), resilience_policy("openai", "m")
+    # hedge requests slower than 100ms, 20x the backend's latency
+    for _ in range(20):
+        policy.latencies.observe(0.1)
+    backend = SimpleNamespace(calls=0, in_flight=0, peak=0)
+
+    async def create(**body):
+        backend.calls += 1
+        backend.in_flight += 1
+        backend.peak = max(backend.peak, backend.in_flight)
+        await asyncio.sleep(0.005)
+        backend.in_flight -= 1
+        return "ok"
+
+    async def run():
+        # 200 calls 2 at a time: most wait far longer than the call timeout and the hedge delay
+        return await asyncio.gather(*[
+            policy.acall(lambda: limiter.create(SimpleNamespace(create=create), model="m"), slot=limiter.slot)
+            for _ in range(200)])
+
+    assert asyncio.run(run()) == ["ok"] * 200
+    assert (backend.calls, backend.peak) == (200, 2)
+    assert policy.breaker.state == "closed" and limiter.in_flight == 0
+
+
+def test_policies_are_shared_per_model():
+    assert resilience_policy("openai", "m") is resilience_policy("openai", "m")
+    assert resilience_policy("openai", "m") is not resilience_policy("google", "m")
+
+
+class StuckCompletions(FakeCompletions):
+    async def create(self, model, messages, max_tokens, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(5)
+
+
+def test_rows_past_their_deadline_are_unscored(make_scorer):
+    completions = StuckCompletions()
+    scorer = make_scorer({"concurrency": 2, "row_deadline": 0.05}, completions)
+    start = time.perf_counter()
+    result = asyncio.run(scorer.ascore_row(rows(1).iloc[0]))
+    assert time.perf_counter() - start < 1
+    assert result.isna().all() and completions.calls == 1
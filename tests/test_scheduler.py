@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
+from lm_act_eval.evaluation_harness.evaluators.sft.dataframe import apply_extractors, select_inputs
+from lm_act_eval.evaluation_harness.evaluators.sft.scheduler import MetricGraph
+from lm_act_eval.evaluation_harness.evaluators.sft.readers import referenced_columns
+from lm_act_eval.evaluation_harness.evaluators.sft.trajectory import (
+    AsyncTableTrajectoryEvaluator, TableTrajectoryEvaluator)
+from lm_act_eval.evaluation_harness.helper_functions.registry import function_registry
+
+CALLS = {"upper": 0}
+
+
+@function_registry.register("test_counted_upper")
+def counted_upper(text):
+    CALLS["upper"] += 1
+    return text.upper()
+
+
+class Sleepy:
+    def __init__(self, column, seconds=0.3):
+        self.column, self.seconds = column, seconds
+
+    def __call__(self, df):
+        time.sleep(self.seconds)
+        return df[self.column].str.len().sum()
+
+
+@metric_registry.register("test_sleepy_upper")
+class SleepyUpper(Sleepy):
+    def __init__(self, config):
+        super().__init__("UPPER")
+
+
+@metric_registry.register("test_sleepy_text")
+class SleepyText(Sleepy):
+    def __init__(self, config):
+        super().__init__("text")
+
+
+def test_shared_derived_column_computed_once_and_metrics_overlap():
+    df = pd.DataFrame({"text": ["ab", "cde"]})
+    produces = {"UPPER": {"text": "test_counted_upper"}}
+    metric_configs = OmegaConf.create({
+        "a": {"inputs": ["UPPER"], "produces": produces},
+        "b": {"inputs": ["UPPER"], "produces": produces},
+        "c": {"inputs": ["text"]},
+    })
+    graph = MetricGraph.build(metric_configs, [
+        (Sleepy("UPPER"), ["UPPER"]), (Sleepy("UPPER"), ["UPPER"]), (Sleepy("text"), ["text"])])
+
+    CALLS["upper"] = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(4) as executor:
+        results, derived_df = graph.run(df, select_inputs, apply_extractors, executor)
+    elapsed = time.perf_counter() - start
+
+    assert results == {"a": 5, "b": 5, "c": 5}
+    assert list(results) == ["a", "b", "c"]
+    assert derived_df["UPPER"].tolist() == ["AB", "CDE"]
+    assert CALLS["upper"] == len(df)
+    # three 0.3s metrics, run concurrently
+    assert elapsed < 0.8
+
+
+def test_conflicting_derived_columns_raise():
+    metric_configs = OmegaConf.create({
+        "a": {"inputs": ["X"], "produces": {"X": {"text": "extract_action"}}},
+        "b": {"inputs": ["X"], "produces": {"X": {"text": "extract_status"}}},
+    })
+    with pytest.raises(ValueError, match="already produced"):
+        MetricGraph.build(metric_configs, [(None, ["X"]), (None, ["X"])])
+
+
+def test_cyclic_derived_columns_raise():
+    with pytest.raises(ValueError, match="cycle"):
+        MetricGraph({}, {"X": {"Y": None}, "Y": {"X": None}})
+
+
+def test_table_evaluator_uses_the_graph(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"session_id": [0, 1], "text": ["ab", "cde"]}).to_csv(path)
+    config = OmegaConf.create({
+        "data": {"path": str(path), "extract_fs": {"text": {"text": None}}},
+        "metrics": {
+            "test_sleepy_upper": {
+                "inputs": ["UPPER"], "args": None, "produces": {"UPPER": {"text": "test_counted_upper"}}},
+            "test_sleepy_text": {"inputs": ["text"], "args": None},
+        },
+    })
+    assert TableTrajectoryEvaluator(config).evaluate() == {"test_sleepy_upper": 5, "test_sleepy_text": 5}
+
+
+@pytest.mark.parametrize("evaluator", [TableTrajectoryEvaluator, AsyncTableTrajectoryEvaluator])
+def test_derived_columns_read_raw_input_columns(tmp_path, evaluator):
+    # `DOM` is neither extracted nor read by a metric, only produced from
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"session_id": [0, 1], "text": ["ab", "cde"], "DOM": ["x", "yz"], "unused": [0, 0]}).to_csv(path)
+    config = OmegaConf.create({
+        "data": {"path": str(path), "extract_fs": {"text": {"text": None}}},
+        "metrics": {
+            "test_sleepy_upper": {
+                "inputs": ["UPPER"], "args": None, "produces": {"UPPER": {"DOM": "test_counted_upper"}}},
+        },
+    })
+    assert referenced_columns(config, ["session_id", "text", "DOM", "unused"]) == ["session_id", "text", "DOM"]
+    assert evaluator(config).evaluate() == {"test_sleepy_upper": 3}
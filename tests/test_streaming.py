@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
+from lm_act_eval.evaluation_harness.evaluators.sft.readers import FeatherReader, iter_table
+from lm_act_eval.evaluation_harness.evaluators.sft.streaming import MetricAggregate, iter_session_chunks
+from lm_act_eval.evaluation_harness.evaluators.sft.trajectory import TableTrajectoryEvaluator
+
+
+@metric_registry.register("test_mean_score")
+class MeanScore:
+    def __init__(self, config):
+        self.config = config
+
+    def __call__(self, df):
+        return df["score"].mean()
+
+
+def _table():
+    sessions = ["a"] * 3 + ["b"] * 4 + ["c"] * 2 + ["d"]
+    return pd.DataFrame({
+        "session_id": sessions,
+        "idx_in_session": [0, 1, 2, 0, 1, 2, 3, 0, 1, 0],
+        "score": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+        "DOM": ["<html/>"] * 10,
+    })
+
+
+def _config(path, chunk_rows):
+    return OmegaConf.create({
+        "data": {"path": str(path), "chunk_rows": chunk_rows, "extract_fs": {"score": {"score": None}}},
+        "metrics": {"test_mean_score": {"inputs": ["score"], "args": None}},
+    })
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 3, 5, 100])
+def test_session_chunks_never_split_a_session(chunk_rows):
+    df = _table()
+    chunks = list(iter_session_chunks(df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows)))
+    pd.testing.assert_frame_equal(pd.concat(chunks), df)
+    for i, chunk in enumerate(chunks):
+        for later in chunks[i + 1:]:
+            assert set(chunk.session_id).isdisjoint(later.session_id)
+
+
+def test_session_chunks_warns_on_non_contiguous_sessions():
+    df = _table().iloc[[0, 3, 1]]
+    with pytest.warns(UserWarning, match="not contiguous"):
+        list(iter_session_chunks([df.iloc[:1], df.iloc[1:2], df.iloc[2:]]))
+
+
+def test_metric_aggregate_weights_by_rows():
+    agg = MetricAggregate()
+    agg.update(1.0, weight=1)
+    agg.update(float("nan"), weight=5)
+    agg.update(4.0, weight=3)
+    assert agg.value == pytest.approx(13 / 4)
+
+    series_agg = MetricAggregate()
+    series_agg.update(pd.Series({"x": 1.0, "y": 2.0}), weight=1)
+    series_agg.update(pd.Series({"x": 3.0}), weight=1)
+    assert series_agg.value.to_dict() == {"x": 2.0, "y": 2.0}
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".feather"])
+def test_iter_table_yields_chunks(tmp_path, suffix):
+    df = _table()
+    path = tmp_path / f"data{suffix}"
+    getattr(df, {".csv": "to_csv", ".parquet": "to_parquet", ".feather": "to_feather"}[suffix])(path)
+    chunks = list(iter_table(_config(path, 4), 4))
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    assert "DOM" not in chunks[0].columns
+    pd.testing.assert_frame_equal(pd.concat(chunks), df.drop(columns="DOM"), check_dtype=False)
+
+
+def test_compressed_feather_is_streamed_by_record_batch(tmp_path):
+    df = _table()
+    path = tmp_path / "data.feather"
+    # LZ4 record batches of 3 rows, re-sliced to chunks of 4
+    df.to_feather(path, compression="lz4", chunksize=3)
+    chunks = list(FeatherReader().iter_chunks(path, 4, columns=["score", "session_id"]))
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    assert list(chunks[0].columns) == ["score", "session_id"]
+    pd.testing.assert_frame_equal(pd.concat(chunks), df[["score", "session_id"]])
+
+
+def test_streaming_evaluation_matches_full_evaluation(tmp_path):
+    path = tmp_path / "data.parquet"
+    _table().to_parquet(path)
+
+    evaluator = TableTrajectoryEvaluator(_config(path, 3))
+    assert evaluator.input_df is None
+    assert evaluator.evaluate() == {"test_mean_score": pytest.approx(_table()["score"].mean())}
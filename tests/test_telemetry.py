@@ -0,0 +1,106 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import openai
+import pandas as pd
+import pytest
+
+from lm_act_eval.evaluation_harness.evaluators.concurrency import RateLimiter
+from lm_act_eval.evaluation_harness.evaluators.sft.dataframe import score_metric
+from lm_act_eval.evaluation_harness.openai.vision import gptv
+from lm_act_eval.evaluation_harness.utils.telemetry import (
+    Histogram,
+    instrumented,
+    note_retry,
+    note_usage,
+    telemetry,
+    track_call,
+)
+
+from .test_gptv_concurrency import FakeCompletions, error
+
+
+@pytest.fixture(autouse=True)
+def fresh_telemetry():
+    telemetry().reset()
+    yield telemetry()
+    telemetry().reset()
+
+
+def test_histogram_quantiles():
+    hist = Histogram(buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        hist.observe(value)
+    assert hist.cumulative() == [("1", 1), ("2", 3), ("4", 4), ("+Inf", 5)]
+    assert hist.quantile(0.5) == pytest.approx(1.75)
+    assert hist.quantile(1.0) == 4
+    assert hist.mean == pytest.approx(3.3)
+
+
+def test_calls_are_attributed_to_the_scored_metric(fresh_telemetry):
+    @instrumented("openai")
+    def judge(messages, model):
+        note_usage({"prompt_tokens": 10, "completion_tokens": 2})
+        return "correct"
+
+    @instrumented("openai")
+    async def ajudge(messages, model):
+        note_retry(error(openai.RateLimitError), 0.5)
+        note_usage(SimpleNamespace(prompt_tokens=7, completion_tokens=1))
+        return "correct"
+
+    def scorer(df):
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lambda _: judge([], model="gpt-4"), range(2)))
+        return asyncio.run(ajudge([], model="gpt-4"))
+
+    assert score_metric("fuzzy", scorer, pd.DataFrame()) == "correct"
+    with pytest.raises(ValueError), track_call("openai", "gpt-4"):
+        raise ValueError("bad request")
+
+    summary = fresh_telemetry.summary().set_index("metric")
+    # threads started by the scorer don't inherit the metric, its tasks do
+    assert summary.loc["fuzzy", ["calls", "retries", "rate_limit_sleeps", "tokens_in", "tokens_out"]].tolist() == [
+        1, 1, 1, 7, 1]
+    assert summary.loc["", ["calls", "errors", "tokens_in"]].tolist() == [3, 1, 20]
+
+
+def test_gptv_records_retries_tokens_and_queue_wait(monkeypatch, fresh_telemetry):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(gptv, "RETRY_INITIAL_DELAY", 0.001)
+
+    class UsageCompletions(FakeCompletions):
+        async def create(self, model, messages, max_tokens):
+            response = await super().create(model, messages, max_tokens)
+            response.usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+            return response
+
+    completions = UsageCompletions([error(openai.RateLimitError)])
+    monkeypatch.setattr(gptv.GPTV, "async_client", property(
+        lambda self: SimpleNamespace(chat=SimpleNamespace(completions=completions))))
+    pipeline = gptv.GPTV()
+    asyncio.run(pipeline.agenerate_completion(
+        "goal", ["https://example.com/a.png"], rate_limiter=RateLimiter(requests_per_minute=600)))
+
+    (key, stats), = fresh_telemetry.stats().items()
+    assert key == ("", "openai", pipeline.config.model)
+    assert (stats.calls, stats.retries, stats.rate_limit_sleeps) == (1, 1, 1)
+    assert (stats.tokens_in, stats.tokens_out) == (100, 20)
+    assert stats.errors == {"RateLimitError": 1}
+    assert stats.queue_wait.count == 1
+
+
+def test_prometheus_export(tmp_path, fresh_telemetry):
+    with track_call("openai", 'gpt-"4"'):
+        note_usage({"prompt_tokens": 3, "completion_tokens": 1})
+    path = fresh_telemetry.write_prometheus(tmp_path / "llm.prom")
+    lines = path.read_text().splitlines()
+
+    labels = 'metric="",provider="openai",model="gpt-\\"4\\""'
+    assert "# TYPE lm_act_eval_llm_call_seconds histogram" in lines
+    assert f'lm_act_eval_llm_call_seconds_bucket{{{labels},le="+Inf"}} 1' in lines
+    assert f"lm_act_eval_llm_call_seconds_count{{{labels}}} 1" in lines
+    assert f'lm_act_eval_llm_tokens_total{{{labels},direction="in"}} 3' in lines
+    assert f"lm_act_eval_llm_calls_total{{{labels}}} 1" in lines
+    assert fresh_telemetry.report({"prometheus_path": tmp_path / "report.prom"}).shape[0] == 1
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("text_generation")
+from aiohttp import web
+from text_generation.errors import OverloadedError, ValidationError
+
+from lm_act_eval.evaluation_harness.helper_functions.llms.providers import hf_utils
+from lm_act_eval.evaluation_harness.helper_functions.llms.providers.tgi_client import TGIClient, close_tgi_clients
+from lm_act_eval.evaluation_harness.utils.telemetry import telemetry
+
+
+class StandInTGI:
+    """A local stand-in of a TGI server: uppercases prompts, streams `stream_tokens`."""
+
+    def __init__(self):
+        self.in_flight = self.peak = self.requests = self.streamed = 0
+        self.failures = 0
+        self.stream_tokens = ["Hel", "lo", " ST", "OP", " never", " read"]
+        self.app = web.Application()
+        self.app.add_routes([web.post("/generate", self.generate), web.post("/generate_stream", self.generate_stream)])
+
+    async def generate(self, request):
+        body = await request.json()
+        self.requests += 1
+        if self.failures:
+            self.failures -= 1
+            return web.json_response({"error": "Model is overloaded", "error_type": "overloaded"}, status=429)
+        if body["parameters"].get("temperature") == -1:
+            return web.json_response({"error": "bad temperature", "error_type": "validation"}, status=422)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(1 if body["inputs"] == "slow" else 0.02)
+        self.in_flight -= 1
+        return web.json_response({
+            "generated_text": body["inputs"].upper(),
+            "details": {"generated_tokens": len(body["inputs"]), "finish_reason": "length"}})
+
+    async def generate_stream(self, request):
+        self.requests += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for i, text in enumerate(self.stream_tokens):
+                event = {"token": {"id": i, "text": text, "special": False}, "generated_text": None}
+                if i == len(self.stream_tokens) - 1:
+                    event |= {"generated_text": "".join(self.stream_tokens), "details": {"generated_tokens": i + 1}}
+                await response.write(f"data:{json.dumps(event)}\n\n".encode())
+                self.streamed += 1
+                await asyncio.sleep(0.05)
+        except ConnectionResetError:
+            pass
+        return response
+
+
+@pytest.fixture
+def server():
+    stand_in = StandInTGI()
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(stand_in.app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    host, port = runner.addresses[0][:2]
+    stand_in.url = f"http://{host}:{port}"
+    yield stand_in
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(url, **options):
+        clients.append(TGIClient(url, **options))
+        return clients[-1]
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_concurrent_requests_share_a_bounded_pool(server, make_client):
+    client = make_client(server.url, max_connections=3)
+
+    async def generate_all():
+        return await asyncio.gather(*[client.generate(f"p{i}", max_new_tokens=4) for i in range(8)])
+
+    generations = asyncio.run(generate_all())
+    assert [g.text for g in generations] == [f"P{i}" for i in range(8)]
+    assert server.peak == 3
+    # sync callers, from another event loop, share the same pool
+    assert client.generate_sync("again", max_new_tokens=4).generated_tokens == 5
+
+
+def test_retries_and_timeouts(server, make_client):
+    client = make_client(server.url, initial_delay=0.001)
+    server.failures = 2
+    assert client.generate_sync("x", max_new_tokens=4).text == "X"
+    assert server.requests == 3
+
+    server.failures = 2
+    with pytest.raises(OverloadedError):
+        client.generate_sync("x", max_new_tokens=4, max_retries=1)
+    with pytest.raises(ValidationError):
+        client.generate_sync("x", max_new_tokens=4, temperature=-1)
+    requests = server.requests
+    with pytest.raises(asyncio.TimeoutError):
+        client.generate_sync("slow", max_new_tokens=4, timeout=0.05, max_retries=0)
+    assert server.requests == requests + 1
+
+
+def test_streaming_stops_at_the_first_stop_sequence(server, make_client):
+    client = make_client(server.url)
+    generation = client.generate_sync("hi", max_new_tokens=8, stream=True, stop_sequences=["STOP", "zzz"])
+    assert generation == ("Hello STOP", 4, "stop_sequence")
+    assert server.streamed < len(server.stream_tokens)
+
+    generation = client.generate_sync("hi", max_new_tokens=8, stream=True)
+    assert generation.text == "Hello STOP never read"
+
+
+def test_provider_calls_record_tokens_and_retries(server):
+    telemetry().reset()
+    server.failures = 1
+    hf_utils.tgi_client(server.url).initial_delay = 0.001
+    response = hf_utils.generate_from_huggingface_completion(
+        "judge", model_endpoint=server.url, temperature=0.0, top_p=1.0, max_new_tokens=4)
+
+    assert response == "JUDGE"
+    (stats,) = telemetry().stats().values()
+    assert (stats.calls, stats.retries, stats.tokens_out) == (1, 1, 5)
+    telemetry().reset()
+    close_tgi_clients()
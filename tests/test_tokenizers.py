@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("tiktoken")
+pytest.importorskip("text_generation")
+from lm_act_eval.evaluation_harness.helper_functions.llms import tokenizers
+from lm_act_eval.evaluation_harness.helper_functions.llms.tokenizers import Tokenizer, cached_tokenizer
+
+
+class WordEncoding:
+    """One token per word, counting the texts it tokenizes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return [len(word) for word in text.split(" ")]
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, ids):
+        return " ".join("x" * n for n in ids)
+
+
+@pytest.fixture
+def tokenizer():
+    tokenizer = Tokenizer.__new__(Tokenizer)
+    tokenizer.provider, tokenizer.tokenizer = "openai", WordEncoding()
+    return tokenizer
+
+
+def test_short_texts_are_not_tokenized(tokenizer):
+    assert tokenizer.truncate("xx xx", 8) == "xx xx"
+    assert tokenizer.tokenizer.encoded == []
+
+    # may be over the budget: tokenized, kept whole if it fits
+    assert tokenizer.truncate("x " * 5, 8) == "x " * 5
+    assert tokenizer.truncate("xx " * 10, 3) == "xx xx xx"
+    assert len(tokenizer.tokenizer.encoded) == 2
+
+
+def test_token_counts_in_batch(tokenizer):
+    assert tokenizer.count_tokens(["a", "a b c", ""]) == [1, 3, 1]
+    gemini = Tokenizer("google", "gemini-pro")
+    assert gemini.count_tokens(["abc"]) == [3]
+    assert gemini.truncate("abcdef", 4) == "abcd"
+
+
+def test_tokenizers_are_loaded_once(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(tokenizers, "_tokenizers", {})
+    monkeypatch.setattr(tokenizers, "Tokenizer", lambda *key: loaded.append(key) or object())
+    assert cached_tokenizer("openai", "gpt-4") is cached_tokenizer("openai", "gpt-4")
+    cached_tokenizer("openai", "gpt-3.5-turbo")
+    assert loaded == [("openai", "gpt-4"), ("openai", "gpt-3.5-turbo")]
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from omegaconf import OmegaConf
+
+from lm_act_eval.evaluation_harness.evaluators.metrics.base import DFTableScorer
+from lm_act_eval.evaluation_harness.evaluators.registry import metric_registry
+from lm_act_eval.evaluation_harness.evaluators.sft.trajectory import TableTrajectoryEvaluator, extract_trajectory
+from lm_act_eval.evaluation_harness.evaluators.trajectory_index import (
+    TrajectoryIndex, attach_trajectory_index, trajectory_index)
+
+
+def make_table(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "session_id": rng.choice(["a", "b", "c", "d", "e"], n),
+        "idx_in_session": rng.permutation(n),
+        "text": [f"t{i}" for i in range(n)],
+    })
+    return df.set_axis(rng.permutation(n) + 1000)
+
+
+def test_index_matches_groupby():
+    df = make_table()
+    index = TrajectoryIndex(df)
+    grouped = df.sort_values(["session_id", "idx_in_session"]).groupby("session_id")
+
+    assert list(index.sessions) == list(grouped.groups)
+    assert index.step_counts.to_dict() == grouped.size().to_dict()
+    pd.testing.assert_frame_equal(index.last_steps(df), df.loc[df.groupby("session_id")["idx_in_session"].idxmax()])
+    assert index.first("c") == df.loc[df.session_id == "c", "idx_in_session"].idxmin()
+    assert index.session(df, "b")["idx_in_session"].is_monotonic_increasing
+    assert index.step_count("e") == (df.session_id == "e").sum()
+    pd.testing.assert_series_equal(
+        index.trajectories(df, "text"), grouped["text"].apply(list), check_index_type=False)
+
+
+def test_rows_without_session_are_left_out():
+    df = pd.DataFrame({"session_id": ["a", None, "a"], "idx_in_session": [1, 0, 0]})
+    index = TrajectoryIndex(df)
+    assert len(index) == 1 and "a" in index
+    assert index.positions("a").tolist() == [2, 0]
+
+
+def test_attached_index_survives_selection_and_is_shared():
+    df = make_table()
+    index = TrajectoryIndex(df)
+    selected = attach_trajectory_index(df[["text"]].copy(), index)
+    assert trajectory_index(selected[["text"]]) is index
+    assert extract_trajectory(attach_trajectory_index(df, index), target_col="text").equals(index.trajectories(df, "text"))
+
+
+def test_restrict_matches_a_rebuilt_index():
+    df = make_table()
+    kept = df[(df.index % 3 != 0) & (df.session_id != "b")].sample(frac=1, random_state=1)
+    restricted = TrajectoryIndex(df).restrict(kept[["text"]])
+    rebuilt = TrajectoryIndex(kept)
+    assert list(restricted.sessions) == list(rebuilt.sessions) and "b" not in restricted
+    for session in rebuilt.sessions:
+        assert restricted.positions(session).tolist() == rebuilt.positions(session).tolist()
+
+
+@metric_registry.register("test_last_step")
+class LastStep(DFTableScorer):
+    def __call__(self, df):
+        return self.get_last_in_trajectory(df, group="session_id", idx="idx_in_session")["text"].tolist()
+
+
+def test_scorers_get_the_index_of_the_evaluation(tmp_path):
+    path = tmp_path / "data.csv"
+    make_table(n=50).to_csv(path)
+    config = OmegaConf.create({
+        "data": {"path": str(path), "extract_fs": {"text": {"text": None}}},
+        "metrics": {"test_last_step": {"inputs": ["text"], "args": None}},
+        "checkpoint": False,
+    })
+    evaluator = TableTrajectoryEvaluator(config)
+    # the scorer input holds only `text`, the session order comes from the attached index
+    expected = evaluator.trajectory_index.last_steps(evaluator.df)["text"].tolist()
+    assert evaluator.evaluate() == {"test_last_step": expected}
+    assert len(expected) == 5
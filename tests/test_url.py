@@ -0,0 +1,97 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from lm_act_eval.evaluation_harness.utils.url import UrlCheck, UrlChecker
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, body=False):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(0.02)
+        with server.lock:
+            server.in_flight -= 1
+        if self.path.startswith("/no-head") and self.command == "HEAD":
+            self.send_response(405)
+        elif self.path.startswith("/missing"):
+            self.send_response(404)
+        elif self.path.startswith("/busy"):
+            self.send_response(int(self.path.split("/")[2]))
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png" if self.path.endswith(".png") else "text/html")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._respond()
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock, server.requests, server.in_flight, server.peak = threading.Lock(), [], 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_bulk_check_dedupes_and_caps_connections(server, tmp_path):
+    paths = [f"/{i}.png" for i in range(20)]
+    urls = pd.Series([url(server, p) for p in paths * 3] + [url(server, "/page.html"), url(server, "/missing.png"), None])
+    checker = UrlChecker(max_workers=16, per_host=4, cache_path=tmp_path / "urls.sqlite")
+    accessible = checker.screenshots_accessible(urls.set_axis(range(100, 100 + len(urls))))
+
+    assert accessible.index.tolist() == list(range(100, 100 + len(urls)))
+    assert accessible.tolist() == [True] * 60 + [False, False, False]
+    assert len(server.requests) == 22
+    assert server.peak <= 4
+
+
+def test_verdicts_are_cached_until_they_expire(server, tmp_path):
+    urls = pd.Series([url(server, "/a.png"), url(server, "/missing.png")])
+    UrlChecker(cache_path=tmp_path / "urls.sqlite").screenshots_accessible(urls)
+    assert len(server.requests) == 2
+
+    # a rerun, with a fresh checker, only reads the cache
+    assert UrlChecker(cache_path=tmp_path / "urls.sqlite").check(urls[1]) == UrlCheck(404, "")
+    assert UrlChecker(cache_path=tmp_path / "urls.sqlite").screenshots_accessible(urls).tolist() == [True, False]
+    assert len(server.requests) == 2
+
+    UrlChecker(ttl=0, cache_path=tmp_path / "urls.sqlite").screenshots_accessible(urls)
+    assert len(server.requests) == 4
+
+
+def test_get_fallback_and_unreachable_hosts(server, tmp_path):
+    checker = UrlChecker(timeout=1, cache_path=None)
+    assert checker.check(url(server, "/no-head.png")).is_screenshot
+    assert server.requests == [("HEAD", "/no-head.png"), ("GET", "/no-head.png")]
+    assert checker.check("http://127.0.0.1:1/a.png") is None
+
+
+def test_transient_failures_are_not_cached(server, tmp_path):
+    urls = [url(server, f"/busy/{status}/a.png") for status in (408, 429, 500, 503)]
+    for _ in range(2):
+        checks = UrlChecker(cache_path=tmp_path / "urls.sqlite").check_many(urls)
+        assert not any(check.is_screenshot or check.is_definitive for check in checks.values())
+    assert len(server.requests) == 8